@@ -0,0 +1,66 @@
+"""Tablas de logs de Binance
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+Las bases creadas antes con Base.metadata.create_all ya tienen las tablas: solo
+se crean las que faltan, así la revisión sirve de punto de partida para ambas.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table("binance_request_logs"):
+        op.create_table(
+            "binance_request_logs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("endpoint", sa.String(255), nullable=False),
+            sa.Column("method", sa.String(10), nullable=False),
+            sa.Column("request_params", sa.Text()),
+            sa.Column("response_status", sa.Integer()),
+            sa.Column("response_data", sa.Text()),
+            sa.Column("response_time_ms", sa.Float()),
+            sa.Column("success", sa.Boolean()),
+            sa.Column("error_message", sa.Text(), nullable=True),
+            sa.Column("symbol", sa.String(20), nullable=True),
+            sa.Column("operation_type", sa.String(50), nullable=True),
+        )
+        op.create_index("ix_binance_request_logs_id", "binance_request_logs", ["id"])
+        op.create_index("ix_binance_request_logs_endpoint", "binance_request_logs", ["endpoint"])
+        op.create_index("ix_binance_request_logs_symbol", "binance_request_logs", ["symbol"])
+        op.create_index("ix_binance_request_logs_operation_type", "binance_request_logs", ["operation_type"])
+
+    if not inspector.has_table("trading_operations"):
+        op.create_table(
+            "trading_operations",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("operation_type", sa.String(50), nullable=False),
+            sa.Column("symbol", sa.String(20), nullable=False),
+            sa.Column("parameters", sa.Text()),
+            sa.Column("result", sa.Text()),
+            sa.Column("execution_time_ms", sa.Float()),
+            sa.Column("success", sa.Boolean()),
+            sa.Column("error_message", sa.Text(), nullable=True),
+            sa.Column("model_accuracy", sa.Float(), nullable=True),
+            sa.Column("prediction_signal", sa.String(10), nullable=True),
+            sa.Column("prediction_probability", sa.Float(), nullable=True),
+        )
+        op.create_index("ix_trading_operations_id", "trading_operations", ["id"])
+        op.create_index("ix_trading_operations_operation_type", "trading_operations", ["operation_type"])
+        op.create_index("ix_trading_operations_symbol", "trading_operations", ["symbol"])
+
+
+def downgrade() -> None:
+    op.drop_table("trading_operations")
+    op.drop_table("binance_request_logs")
@@ -0,0 +1,62 @@
+"""Índices compuestos para filtrar y paginar los logs
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+Las consultas de /logs filtran por símbolo, tipo de operación o éxito y
+ordenan por (timestamp, id) desc. Los índices compuestos cubren filtro y
+orden (y la paginación por cursor); los de una sola columna de symbol y
+operation_type quedan como prefijo de los nuevos y se eliminan. En Postgres
+se crean con CONCURRENTLY para no bloquear las escrituras en tablas grandes.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+TABLES = ("binance_request_logs", "trading_operations")
+COMPOSITE = (
+    ("timestamp", "id"),
+    ("symbol", "timestamp", "id"),
+    ("operation_type", "timestamp", "id"),
+    ("success", "timestamp", "id"),
+)
+REPLACED = ("symbol", "operation_type")
+
+
+def _index_name(table: str, columns) -> str:
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def _run(statements) -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # CREATE/DROP INDEX CONCURRENTLY no puede ir dentro de una transacción
+        with op.get_context().autocommit_block():
+            statements(postgresql_concurrently=True)
+    else:
+        statements()
+
+
+def upgrade() -> None:
+    def statements(**kw):
+        for table in TABLES:
+            for columns in COMPOSITE:
+                op.create_index(_index_name(table, columns), table, list(columns), if_not_exists=True, **kw)
+            for column in REPLACED:
+                op.drop_index(_index_name(table, (column,)), table_name=table, if_exists=True, **kw)
+
+    _run(statements)
+
+
+def downgrade() -> None:
+    def statements(**kw):
+        for table in TABLES:
+            for column in REPLACED:
+                op.create_index(_index_name(table, (column,)), table, [column], if_not_exists=True, **kw)
+            for columns in COMPOSITE:
+                op.drop_index(_index_name(table, columns), table_name=table, if_exists=True, **kw)
+
+    _run(statements)
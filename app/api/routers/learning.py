@@ -1,12 +1,21 @@
 """
 API Router para el sistema de aprendizaje
 """
-from fastapi import APIRouter, HTTPException
-from app.services.learning_agent import learning_agent, TradeOutcome
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from app.services.learning_agent import learning_agent, TradeOutcome, BATCH_REASONS
+from app.services.learning_metrics import classify_conditions
+from app.services.learning_tuner import build_grid, run_tuning
+from app.services.persistence_service import persistence_service
+from app.core.config import settings
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Literal, Optional
+import json
 import logging
+import math
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -15,24 +24,63 @@ router = APIRouter(prefix="/learning", tags=["learning"])
 class TradeOutcomeRequest(BaseModel):
     trade_id: str
     symbol: str
-    side: str  # BUY or SELL
-    entry_price: float
+    side: Literal["BUY", "SELL"]
+    entry_price: float = Field(gt=0)
     exit_price: float
-    quantity: float
+    quantity: float = Field(gt=0)
     hold_time_minutes: int = 60
     market_conditions: Optional[Dict] = None
     decision_confidence: float = 0.7
+    timestamp: Optional[datetime] = None  # Por defecto, la hora del reloj del agente
+
+    @field_validator("side", mode="before")
+    @classmethod
+    def _upper_side(cls, value):
+        # Se aceptaba "buy"/"sell" en minúsculas
+        return value.upper() if isinstance(value, str) else value
+
+    @field_validator("market_conditions")
+    @classmethod
+    def _check_conditions(cls, value):
+        if value is not None:
+            classify_conditions(value)  # ValueError -> 422
+        return value
+
+MAX_BATCH_TRADES = 200_000
+# Campo -> valor por defecto (... = requerido), como en TradeOutcomeRequest
+BATCH_FIELDS = {
+    "trade_id": ..., "symbol": ..., "side": ..., "entry_price": ..., "exit_price": ..., "quantity": ...,
+    "hold_time_minutes": 60, "market_conditions": None, "decision_confidence": 0.7, "timestamp": None,
+}
 
 class TradeEvaluationRequest(BaseModel):
     market_conditions: Dict
     signal_confidence: float
 
+MAX_BATCH_CANDIDATES = 100_000
+
+class TuneRequest(BaseModel):
+    """Grid de políticas: campo de LearningPolicy -> valores a probar"""
+    grid: Dict[str, List[float]]
+    source: str = "memory"  # memory (trades en memoria) o database (learning_trades)
+    limit: int = 10_000  # Últimos N trades a reproducir
+    top: int = 20
+    workers: Optional[int] = None
+
+class TradeEvaluationBatchRequest(BaseModel):
+    """Candidatos en columnas; las condiciones omitidas (o null) usan los defaults de evaluate-trade"""
+    signal_confidence: List[float]
+    volatility_value: Optional[List[Optional[float]]] = None
+    volume_ratio: Optional[List[Optional[float]]] = None
+    trend_strength: Optional[List[Optional[str]]] = None
+    rsi: Optional[List[Optional[float]]] = None
+
 @router.post("/record-trade")
 def record_trade_outcome(trade_req: TradeOutcomeRequest):
     """Registra el resultado de un trade para aprendizaje"""
     try:
         # Calcular PnL
-        if trade_req.side.upper() == "BUY":
+        if trade_req.side == "BUY":
             pnl = (trade_req.exit_price - trade_req.entry_price) * trade_req.quantity
         else:  # SELL
             pnl = (trade_req.entry_price - trade_req.exit_price) * trade_req.quantity
@@ -43,7 +91,7 @@ def record_trade_outcome(trade_req: TradeOutcomeRequest):
         outcome = TradeOutcome(
             trade_id=trade_req.trade_id,
             symbol=trade_req.symbol,
-            side=trade_req.side.upper(),
+            side=trade_req.side,
             entry_price=trade_req.entry_price,
             exit_price=trade_req.exit_price,
             quantity=trade_req.quantity,
@@ -52,7 +100,7 @@ def record_trade_outcome(trade_req: TradeOutcomeRequest):
             hold_time_minutes=trade_req.hold_time_minutes,
             market_conditions=trade_req.market_conditions or {},
             decision_confidence=trade_req.decision_confidence,
-            timestamp=datetime.now()
+            timestamp=trade_req.timestamp or learning_agent.clock.now()
         )
         
         # Registrar en el agente de aprendizaje
@@ -70,11 +118,166 @@ def record_trade_outcome(trade_req: TradeOutcomeRequest):
         logger.error(f"Error registrando trade outcome: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+def _parse_trade_batch(body: bytes, content_type: str) -> Dict[str, list]:
+    """Lee el lote como columnas.
+
+    Acepta un array JSON de trades, NDJSON (un trade por línea) o un objeto con
+    una lista por campo (formato columnar, el más rápido de parsear).
+    """
+    try:
+        stripped = body.lstrip()
+        if "ndjson" in content_type or not stripped.startswith((b"[", b"{")):
+            lines = [line for line in body.splitlines() if line.strip()]
+            payload = json.loads(b"[" + b",".join(lines) + b"]")
+        else:
+            payload = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+
+    if isinstance(payload, dict) and isinstance(payload.get("trade_id"), list):
+        raw = payload
+        n = len(raw["trade_id"])
+    elif isinstance(payload, list) and all(isinstance(item, dict) for item in payload):
+        n = len(payload)
+        raw = {name: [item.get(name) for item in payload] for name in BATCH_FIELDS}
+    else:
+        raise HTTPException(status_code=400, detail="Se esperaba un array de trades, NDJSON o un objeto de columnas")
+
+    if n > MAX_BATCH_TRADES:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_TRADES} trades por lote")
+    columns = {}
+    for name, default in BATCH_FIELDS.items():
+        values = raw.get(name)
+        if values is None:
+            values = [default] * n
+        elif len(values) != n:
+            raise HTTPException(status_code=422, detail=f"La columna {name} no tiene {n} valores")
+        if default is ...:
+            if any(value is None for value in values):
+                raise HTTPException(status_code=422, detail=f"Falta el campo requerido {name}")
+        elif default is not None:
+            values = [default if value is None else value for value in values]
+        columns[name] = values
+    return columns
+
+def _trade_batch_columns(raw: Dict[str, list]) -> Dict:
+    """Valida y convierte el lote a columnas numpy; calcula PnL vectorizado"""
+    sides = [str(side).upper() for side in raw["side"]]
+    for i, side in enumerate(sides):
+        if side not in ("BUY", "SELL"):
+            raise HTTPException(status_code=400, detail=f"Trade {i}: side debe ser 'BUY' o 'SELL'")
+    try:
+        entry = np.asarray(raw["entry_price"], dtype=float)
+        exit_ = np.asarray(raw["exit_price"], dtype=float)
+        quantity = np.asarray(raw["quantity"], dtype=float)
+        hold = np.asarray(raw["hold_time_minutes"], dtype=np.int32)
+        confidence = np.asarray(raw["decision_confidence"], dtype=float)
+        now_us = int(learning_agent.clock.now().timestamp() * 1_000_000)
+        ts_us = np.array([
+            now_us if ts is None else int(datetime.fromisoformat(ts).timestamp() * 1_000_000)
+            for ts in raw["timestamp"]
+        ], dtype=np.int64)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Valor inválido en el lote: {e}")
+    # Precios o cantidades no positivos darían pnl_percentage inf/NaN en métricas y persistencia
+    for name, values in (("entry_price", entry), ("quantity", quantity)):
+        invalid = np.flatnonzero(~(np.isfinite(values) & (values > 0)))
+        if len(invalid):
+            raise HTTPException(status_code=400, detail=f"Trade {invalid[0]}: {name} debe ser mayor que 0")
+    invalid = np.flatnonzero(~np.isfinite(exit_) | ~np.isfinite(confidence))
+    if len(invalid):
+        raise HTTPException(status_code=400, detail=f"Trade {invalid[0]}: valores no finitos")
+    conditions = raw["market_conditions"]
+    for i, trade_conditions in enumerate(conditions):
+        if trade_conditions is None:
+            continue
+        if not isinstance(trade_conditions, dict):
+            raise HTTPException(status_code=422, detail=f"Trade {i}: market_conditions debe ser un objeto")
+        try:
+            classify_conditions(trade_conditions)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Trade {i}: {e}")
+
+    side_codes = np.array([side == "SELL" for side in sides], dtype=np.int8)
+    pnl = np.where(side_codes == 0, exit_ - entry, entry - exit_) * quantity
+    pnl_percentage = pnl / (entry * quantity) * 100
+    return {
+        "trade_ids": [str(trade_id) for trade_id in raw["trade_id"]],
+        "symbols": [str(symbol) for symbol in raw["symbol"]],
+        "sides": side_codes,
+        "entry_price": entry,
+        "exit_price": exit_,
+        "quantity": quantity,
+        "pnl": pnl,
+        "pnl_percentage": pnl_percentage,
+        "hold_time_minutes": hold,
+        "decision_confidence": confidence,
+        "market_conditions": conditions,
+        "ts_us": ts_us,
+    }
+
+def _record_trade_batch(body: bytes, content_type: str, adjust_every: Optional[int]) -> Dict:
+    """Parsea, valida y registra el lote (CPU: se ejecuta fuera del event loop)"""
+    raw = _parse_trade_batch(body, content_type)
+    if not raw["trade_id"]:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    columns = _trade_batch_columns(raw)
+    recorded = learning_agent.record_trade_outcomes_batch(columns, adjust_every)
+    return {
+        "message": "Trade outcomes registrados exitosamente",
+        "recorded": recorded,
+        "total_pnl": round(float(columns["pnl"].sum()), 2),
+        "total_lifetime_trades": len(learning_agent.trade_outcomes)
+    }
+
+@router.post("/record-trades/batch")
+async def record_trades_batch(
+    request: Request,
+    adjust_every: Optional[int] = Query(None, ge=1, description="Ajustar parámetros cada N trades (por defecto, una vez por lote)")
+):
+    """Registra muchos trade outcomes a la vez (array JSON, NDJSON u objeto de columnas)"""
+    try:
+        body = await request.body()
+        return await run_in_threadpool(
+            _record_trade_batch, body, request.headers.get("content-type", ""), adjust_every
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error registrando lote de trade outcomes: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
 @router.get("/performance")
-def get_learning_performance():
-    """Obtiene métricas de performance y aprendizaje"""
+def get_learning_performance(
+    from_: Optional[datetime] = Query(None, alias="from", description="Inicio del rango (incluido)"),
+    to: Optional[datetime] = Query(None, description="Fin del rango (incluido)"),
+    symbol: Optional[str] = Query(None, description="Solo trades de este símbolo")
+):
+    """Obtiene métricas de performance y aprendizaje.
+
+    Con from/to/symbol devuelve las métricas de ese rango de todo el historial
+    (índice por tiempo y símbolo) en lugar del resumen de la ventana reciente.
+    """
     try:
-        return learning_agent.get_performance_summary()
+        if from_ is None and to is None and symbol is None:
+            return learning_agent.get_performance_summary()
+        if from_ is not None and to is not None and from_ > to:
+            raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+        
+        metrics = learning_agent.performance_in_range(from_, to, symbol)
+        for key in ("win_rate", "avg_pnl", "avg_win", "avg_loss", "sharpe_ratio", "max_drawdown",
+                    "profit_factor", "best_trade", "worst_trade", "total_pnl"):
+            if key in metrics:
+                value = metrics[key]
+                metrics[key] = round(value, 4) if math.isfinite(value) else None
+        
+        return {
+            "range": {"from": from_, "to": to, "symbol": symbol},
+            "performance": metrics
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo performance: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
@@ -94,6 +297,88 @@ def evaluate_trade_decision(eval_req: TradeEvaluationRequest):
         logger.error(f"Error evaluando decisión de trade: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+@router.post("/evaluate-trades/batch")
+def evaluate_trades_batch(eval_req: TradeEvaluationBatchRequest):
+    """Evalúa muchos candidatos de trade a la vez (respuesta en columnas)"""
+    try:
+        n = len(eval_req.signal_confidence)
+        if n > MAX_BATCH_CANDIDATES:
+            raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_CANDIDATES} candidatos por lote")
+        columns = {}
+        for name in ("volatility_value", "volume_ratio", "trend_strength", "rsi"):
+            values = getattr(eval_req, name)
+            if values is not None and len(values) != n:
+                raise HTTPException(status_code=422, detail=f"La columna {name} no tiene {n} valores")
+            if values is not None and name != "trend_strength":
+                values = np.array(values, dtype=float)  # None -> NaN (valor por defecto)
+            columns[name] = values
+        
+        decisions = learning_agent.should_trade_batch(eval_req.signal_confidence, **columns)
+        
+        return {
+            "total_candidates": n,
+            "approved": int(decisions["should_trade"].sum()),
+            "confidence_threshold": decisions["parameters"].confidence_threshold,
+            "parameters_version": decisions["parameters"].version,
+            "should_trade": decisions["should_trade"].tolist(),
+            "final_score": np.round(decisions["final_score"], 4).tolist(),
+            "market_score": np.round(decisions["market_score"], 4).tolist(),
+            "reason": [BATCH_REASONS[code] for code in decisions["reason"].tolist()]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error evaluando lote de trades: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.post("/tune")
+async def tune_learning_policy(tune_req: TuneRequest):
+    """Reproduce outcomes guardados con un grid de políticas y compara PnL y drawdown.
+
+    La carga y el pool de procesos corren fuera del event loop.
+    """
+    try:
+        try:
+            policies = build_grid(tune_req.grid)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not policies:
+            raise HTTPException(status_code=400, detail="El grid no genera ninguna política")
+        if len(policies) > settings.learning_tuner_max_policies:
+            raise HTTPException(
+                status_code=413,
+                detail=f"El grid genera {len(policies)} políticas (máximo {settings.learning_tuner_max_policies})"
+            )
+        
+        if tune_req.source == "memory":
+            stream = learning_agent.trade_outcomes[-tune_req.limit:]
+        elif tune_req.source == "database":
+            if not persistence_service.enabled:
+                raise HTTPException(status_code=400, detail="Persistencia en base de datos no configurada")
+            trades, _ = await run_in_threadpool(persistence_service.load_learning_state, tune_req.limit)
+            stream = [TradeOutcome.from_record(t) for t in trades]
+        else:
+            raise HTTPException(status_code=400, detail="source debe ser 'memory' o 'database'")
+        if not stream:
+            raise HTTPException(status_code=400, detail="No hay trades para reproducir")
+        
+        results = await run_in_threadpool(
+            run_tuning, stream, policies, tune_req.workers or settings.learning_tuner_workers or None
+        )
+        
+        return {
+            "trades_replayed": len(stream),
+            "policies_evaluated": len(results),
+            "results": results[:tune_req.top]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en el tuning de políticas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
 @router.get("/trades-history")
 def get_learning_trades():
     """Obtiene historial de trades usados para aprendizaje"""
@@ -127,13 +412,18 @@ def get_learning_trades():
 def get_learning_parameters():
     """Obtiene los parámetros actuales de aprendizaje"""
     try:
+        params = learning_agent.parameters
         return {
-            "confidence_threshold": learning_agent.confidence_threshold,
-            "market_conditions_weights": learning_agent.market_conditions_weights,
-            "optimal_conditions": learning_agent.optimal_conditions,
+            "version": params.version,
+            "published_at": params.published_at,
+            "confidence_threshold": params.confidence_threshold,
+            "market_conditions_weights": dict(params.market_conditions_weights),
+            "optimal_conditions": dict(params.optimal_conditions),
             "learning_rate": learning_agent.learning_rate,
             "min_trades_for_learning": learning_agent.min_trades_for_learning,
-            "total_performance_updates": len(learning_agent.performance_history)
+            "total_performance_updates": len(learning_agent.performance_history),
+            "adjustments_requested": learning_agent.adjustments_requested,
+            "adjustments_run": learning_agent.adjustments_run
         }
         
     except Exception as e:
@@ -147,8 +437,7 @@ def adjust_confidence_threshold(new_threshold: float):
         if not 0.1 <= new_threshold <= 0.9:
             raise HTTPException(status_code=400, detail="Threshold debe estar entre 0.1 y 0.9")
         
-        old_threshold = learning_agent.confidence_threshold
-        learning_agent.confidence_threshold = new_threshold
+        old_threshold = learning_agent.set_confidence_threshold(new_threshold)
         
         logger.info(f"🎯 Threshold ajustado manualmente: {old_threshold:.3f} → {new_threshold:.3f}")
         
@@ -175,65 +464,28 @@ def get_market_conditions_analysis():
                 "required_trades": 10
             }
         
-        # Analizar últimos 30 trades
-        recent_trades = learning_agent.trade_outcomes[-30:]
-        
-        # Agrupar por condiciones de mercado
-        volatility_analysis = {"HIGH": [], "MEDIUM": [], "LOW": []}
-        trend_analysis = {"STRONG_BULLISH": [], "STRONG_BEARISH": [], "WEAK": []}
-        volume_analysis = {"HIGH": [], "NORMAL": [], "LOW": []}
+        # Agregados por bucket de los últimos trades (no recorre el historial)
+        buckets = learning_agent.condition_buckets
         
-        for trade in recent_trades:
-            conditions = trade.market_conditions
-            
-            # Volatilidad
-            vol_level = conditions.get("volatility_level", "MEDIUM")
-            if vol_level in volatility_analysis:
-                volatility_analysis[vol_level].append(trade.pnl_percentage)
-            
-            # Tendencia
-            trend_level = conditions.get("trend_strength", "WEAK")
-            if trend_level in trend_analysis:
-                trend_analysis[trend_level].append(trade.pnl_percentage)
-            
-            # Volumen
-            volume_ratio = conditions.get("volume_ratio", 1.0)
-            if volume_ratio > 1.5:
-                volume_analysis["HIGH"].append(trade.pnl_percentage)
-            elif volume_ratio > 0.8:
-                volume_analysis["NORMAL"].append(trade.pnl_percentage)
-            else:
-                volume_analysis["LOW"].append(trade.pnl_percentage)
-        
-        # Calcular estadísticas
-        def analyze_condition(data_dict):
-            result = {}
-            for condition, values in data_dict.items():
-                if values:
-                    result[condition] = {
-                        "avg_pnl": round(sum(values) / len(values), 2),
-                        "win_rate": round(len([v for v in values if v > 0]) / len(values), 3),
-                        "trade_count": len(values),
-                        "best_trade": round(max(values), 2),
-                        "worst_trade": round(min(values), 2)
-                    }
-                else:
-                    result[condition] = {
-                        "avg_pnl": 0,
-                        "win_rate": 0,
-                        "trade_count": 0,
-                        "best_trade": 0,
-                        "worst_trade": 0
-                    }
-            return result
+        def analyze_condition(dimension):
+            return {
+                level: {
+                    "avg_pnl": round(stats["avg_pnl"], 2),
+                    "win_rate": round(stats["win_rate"], 3),
+                    "trade_count": stats["trade_count"],
+                    "best_trade": round(stats["best_trade"], 2),
+                    "worst_trade": round(stats["worst_trade"], 2)
+                }
+                for level, stats in buckets.analysis(dimension).items()
+            }
         
         return {
-            "analysis_period": f"Últimos {len(recent_trades)} trades",
-            "volatility_performance": analyze_condition(volatility_analysis),
-            "trend_performance": analyze_condition(trend_analysis),
-            "volume_performance": analyze_condition(volume_analysis),
-            "current_weights": learning_agent.market_conditions_weights,
-            "optimal_conditions": learning_agent.optimal_conditions
+            "analysis_period": f"Últimos {buckets.size} trades",
+            "volatility_performance": analyze_condition("volatility"),
+            "trend_performance": analyze_condition("trend"),
+            "volume_performance": analyze_condition("volume"),
+            "current_weights": dict(learning_agent.parameters.market_conditions_weights),
+            "optimal_conditions": dict(learning_agent.parameters.optimal_conditions)
         }
         
     except Exception as e:
@@ -248,23 +500,10 @@ def reset_learning_data():
         performance_count = len(learning_agent.performance_history)
         
         # Resetear datos
-        learning_agent.trade_outcomes.clear()
-        learning_agent.performance_history.clear()
+        learning_agent.clear_history()
         
         # Resetear parámetros a valores iniciales
-        learning_agent.confidence_threshold = 0.6
-        learning_agent.market_conditions_weights = {
-            "volatility": 1.0,
-            "trend_strength": 1.0,
-            "volume_ratio": 1.0,
-            "rsi_level": 1.0,
-            "macd_signal": 1.0
-        }
-        learning_agent.optimal_conditions = {
-            "volatility_range": (1.0, 3.0),
-            "volume_ratio_min": 1.2,
-            "trend_strength_min": 0.7
-        }
+        learning_agent.reset_parameters()
         
         logger.info("🔄 Datos de aprendizaje reseteados")
         
@@ -272,7 +511,7 @@ def reset_learning_data():
             "message": "Datos de aprendizaje reseteados exitosamente",
             "trades_removed": trades_count,
             "performance_records_removed": performance_count,
-            "reset_timestamp": datetime.now()
+            "reset_timestamp": learning_agent.clock.now()
         }
         
     except Exception as e:
@@ -325,7 +564,7 @@ def get_trading_recommendations():
                 })
         
         # Recomendaciones generales
-        if learning_agent.confidence_threshold > 0.75:
+        if learning_agent.parameters.confidence_threshold > 0.75:
             recommendations.append({
                 "type": "OPPORTUNITY",
                 "message": "Threshold muy conservador puede estar perdiendo oportunidades.",
@@ -334,7 +573,7 @@ def get_trading_recommendations():
         
         return {
             "current_status": {
-                "confidence_threshold": learning_agent.confidence_threshold,
+                "confidence_threshold": learning_agent.parameters.confidence_threshold,
                 "total_trades": len(learning_agent.trade_outcomes),
                 "learning_active": len(learning_agent.trade_outcomes) >= learning_agent.min_trades_for_learning
             },
@@ -1,9 +1,9 @@
 from typing import Optional, List
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Query, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from fastapi import APIRouter, HTTPException, Query, Depends
+from sqlalchemy.orm import Query as OrmQuery, Session
+from sqlalchemy import and_, desc, or_
 
 from app.core.database import get_db
 from app.models.binance_logs import BinanceRequestLog, TradingOperation
@@ -12,6 +12,34 @@ from app.models.binance_logs import BinanceRequestLog, TradingOperation
 router = APIRouter(prefix="/logs", tags=["logs"])
 
 
+def _keyset_page(query: OrmQuery, model, limit: int, before_ts: Optional[datetime],
+                 before_id: Optional[int]) -> List:
+    """Página ordenada por (timestamp, id) desc que empieza después del cursor.
+
+    Sin OFFSET: la condición sobre (timestamp, id) la resuelve el índice
+    compuesto, así que el coste no crece con la profundidad de la página.
+    """
+    if before_id is not None and before_ts is None:
+        raise HTTPException(status_code=400, detail="before_id requiere before_ts")
+    if before_ts is not None:
+        if before_id is None:
+            query = query.filter(model.timestamp < before_ts)
+        else:
+            query = query.filter(
+                model.timestamp <= before_ts,
+                or_(model.timestamp < before_ts, and_(model.timestamp == before_ts, model.id < before_id))
+            )
+    return query.order_by(desc(model.timestamp), desc(model.id)).limit(limit).all()
+
+
+def _next_cursor(logs: List, limit: int) -> Optional[dict]:
+    """Cursor para pedir la página siguiente (None si no hay más)"""
+    if len(logs) < limit:
+        return None
+    last = logs[-1]
+    return {"before_ts": last.timestamp, "before_id": last.id}
+
+
 @router.get("/binance-requests")
 def get_binance_request_logs(
     limit: int = Query(default=50, ge=1, le=500),
@@ -19,6 +47,8 @@ def get_binance_request_logs(
     operation_type: Optional[str] = Query(default=None),
     success_only: bool = Query(default=False),
     hours_back: int = Query(default=24, ge=1, le=168),  # Max 1 semana
+    before_ts: Optional[datetime] = Query(default=None),  # Cursor: next_cursor de la página anterior
+    before_id: Optional[int] = Query(default=None),
     db: Session = Depends(get_db)
 ):
     """Obtener logs de solicitudes a Binance"""
@@ -38,8 +68,8 @@ def get_binance_request_logs(
     if success_only:
         query = query.filter(BinanceRequestLog.success == True)
     
-    # Ordenar por timestamp descendente y limitar
-    logs = query.order_by(desc(BinanceRequestLog.timestamp)).limit(limit).all()
+    # Ordenar por (timestamp, id) descendente desde el cursor y limitar
+    logs = _keyset_page(query, BinanceRequestLog, limit, before_ts, before_id)
     
     return {
         "total_logs": len(logs),
@@ -49,6 +79,7 @@ def get_binance_request_logs(
             "success_only": success_only,
             "hours_back": hours_back
         },
+        "next_cursor": _next_cursor(logs, limit),
         "logs": [
             {
                 "id": log.id,
@@ -74,6 +105,8 @@ def get_trading_operation_logs(
     operation_type: Optional[str] = Query(default=None),
     success_only: bool = Query(default=False),
     hours_back: int = Query(default=24, ge=1, le=168),
+    before_ts: Optional[datetime] = Query(default=None),
+    before_id: Optional[int] = Query(default=None),
     db: Session = Depends(get_db)
 ):
     """Obtener logs de operaciones de trading"""
@@ -93,8 +126,8 @@ def get_trading_operation_logs(
     if success_only:
         query = query.filter(TradingOperation.success == True)
     
-    # Ordenar por timestamp descendente y limitar
-    logs = query.order_by(desc(TradingOperation.timestamp)).limit(limit).all()
+    # Ordenar por (timestamp, id) descendente desde el cursor y limitar
+    logs = _keyset_page(query, TradingOperation, limit, before_ts, before_id)
     
     return {
         "total_logs": len(logs),
@@ -104,6 +137,7 @@ def get_trading_operation_logs(
             "success_only": success_only,
             "hours_back": hours_back
         },
+        "next_cursor": _next_cursor(logs, limit),
         "logs": [
             {
                 "id": log.id,
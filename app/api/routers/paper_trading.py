@@ -1,13 +1,19 @@
 """
 API Router para Paper Trading
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.core.database import get_db
-from app.services.paper_trading_service import paper_engine, OrderSide
+from app.services.paper_trading_service import OrderSide
+from app.services.fill_models import Candle
+from app.services.paper_accounts import paper_accounts, DEFAULT_ACCOUNT
 from app.services.binance_client import BinanceService
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,15 +24,44 @@ class OrderRequest(BaseModel):
     symbol: str
     side: str  # BUY or SELL
     quantity: float
-    order_type: str = "MARKET"
+    order_type: str = "MARKET"  # MARKET, LIMIT, STOP_LOSS, TAKE_PROFIT
+    price: Optional[float] = None  # Precio límite o de disparo
+
+class BatchOrderRequest(BaseModel):
+    orders: List[OrderRequest] = Field(min_length=1, max_length=500)
+    atomic: bool = False  # True: todas o ninguna; False: best-effort
+
+class AmendOrderRequest(BaseModel):
     price: Optional[float] = None
+    quantity: Optional[float] = None
 
 class PortfolioResetRequest(BaseModel):
     new_balance: float = 10000.0
 
+class AccountCreateRequest(BaseModel):
+    account_id: str
+    initial_balance: Optional[float] = None
+
+def get_account(account: str = Query(default=DEFAULT_ACCOUNT, description="Cuenta de paper trading")) -> str:
+    """Dependency que valida la cuenta de paper trading"""
+    if account not in paper_accounts.accounts:
+        raise HTTPException(status_code=404, detail=f"Cuenta no encontrada: {account}")
+    return account
+
+def _fetch_last_candle(symbol: str, db: Session):
+    """Precio actual y última vela de 1m cerrada (llamada bloqueante a Binance, en el threadpool).
+
+    La última kline es la vela en curso: su rango y volumen son parciales y en
+    parte anteriores a la orden, así que solo se usa su cierre como precio.
+    """
+    binance_svc = BinanceService(db=db)
+    df = binance_svc.get_klines_df(symbol=symbol, interval="1m", limit=2)
+    return float(df.iloc[-1]['close']), df.iloc[-2] if len(df) > 1 else None
+
 @router.post("/order")
-def place_paper_order(
+async def place_paper_order(
     order_req: OrderRequest,
+    account: str = Depends(get_account),
     db: Session = Depends(get_db)
 ):
     """Coloca una orden de paper trading"""
@@ -38,26 +73,31 @@ def place_paper_order(
         except ValueError:
             raise HTTPException(status_code=400, detail="Side debe ser 'BUY' o 'SELL'")
         
-        # Actualizar precio de mercado
-        binance_svc = BinanceService(db=db)
+        # Obtener precio de mercado (fuera del escritor del engine)
         try:
-            df = binance_svc.get_klines_df(symbol=order_req.symbol, interval="1m", limit=1)
-            current_price = float(df.iloc[-1]['close'])
-            paper_engine.update_market_price(order_req.symbol, current_price)
+            current_price, candle = await run_in_threadpool(_fetch_last_candle, order_req.symbol, db)
+            market_candle = Candle.from_row(candle) if candle is not None else None
             
             logger.info(f"💰 Precio actual {order_req.symbol}: ${current_price:.4f}")
         except Exception as e:
             logger.error(f"Error obteniendo precio para {order_req.symbol}: {e}")
             raise HTTPException(status_code=400, detail=f"Error obteniendo precio: {str(e)}")
         
-        # Colocar orden
-        result = paper_engine.place_order(
-            symbol=order_req.symbol,
-            side=order_side,
-            quantity=order_req.quantity,
-            order_type=order_req.order_type.upper(),
-            price=order_req.price
-        )
+        # Actualizar precio y colocar orden en un único comando atómico
+        def command(engine):
+            engine.update_market_price(order_req.symbol, current_price, market_candle)
+            return engine.place_order(
+                symbol=order_req.symbol,
+                side=order_side,
+                quantity=order_req.quantity,
+                order_type=order_req.order_type.upper(),
+                price=order_req.price
+            )
+        
+        result = await paper_accounts.submit(account, command)
+        
+        # Propagar el precio al resto de cuentas con exposición al símbolo
+        await paper_accounts.update_price(order_req.symbol, current_price, exclude=account, candle=market_candle)
         
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
@@ -65,6 +105,7 @@ def place_paper_order(
         # Agregar información del precio actual
         result["current_market_price"] = current_price
         result["symbol"] = order_req.symbol
+        result["account"] = account
         
         return result
         
@@ -74,59 +115,211 @@ def place_paper_order(
         logger.error(f"Error ejecutando orden: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
-@router.get("/portfolio")
-def get_portfolio():
-    """Obtiene estado actual del portfolio de paper trading"""
+def _fetch_prices(symbols: List[str], db: Session):
+    """Precios actuales de varios símbolos en una sola llamada bloqueante a Binance"""
+    binance_svc = BinanceService(db=db)
+    return binance_svc.get_prices(symbols)
+
+@router.post("/orders/batch")
+async def place_paper_orders_batch(
+    batch_req: BatchOrderRequest,
+    account: str = Depends(get_account),
+    db: Session = Depends(get_db)
+):
+    """Coloca un lote de órdenes validadas contra un mismo snapshot de balance y precios"""
+    
     try:
-        summary = paper_engine.get_portfolio_summary()
+        orders = []
+        for i, order_req in enumerate(batch_req.orders):
+            try:
+                order_side = OrderSide(order_req.side.upper())
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Orden {i}: side debe ser 'BUY' o 'SELL'")
+            orders.append({
+                "symbol": order_req.symbol,
+                "side": order_side,
+                "quantity": order_req.quantity,
+                "order_type": order_req.order_type.upper(),
+                "price": order_req.price
+            })
+        
+        # Un único fetch de precios para todos los símbolos del lote
+        symbols = list(dict.fromkeys(order["symbol"] for order in orders))
+        try:
+            prices = await run_in_threadpool(_fetch_prices, symbols, db)
+        except Exception as e:
+            logger.error(f"Error obteniendo precios del lote: {e}")
+            raise HTTPException(status_code=400, detail=f"Error obteniendo precios: {str(e)}")
+        
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Sin precio para: {', '.join(missing)}")
+        
+        # Marcar precios, validar y ejecutar el lote en un único comando del escritor
+        def command(engine):
+            for symbol, price in prices.items():
+                engine.update_market_price(symbol, price)
+            return engine.place_orders_batch(orders, atomic=batch_req.atomic)
         
-        # Actualizar precios de posiciones actuales
-        for position in summary["positions"]:
-            symbol = position["symbol"]
-            if symbol in paper_engine.current_prices:
-                current_price = paper_engine.current_prices[symbol]
-                position["current_price"] = current_price
-                position["market_value"] = position["quantity"] * current_price
-                
-                # Recalcular PnL no realizado
-                unrealized_pnl = (current_price - position["avg_entry_price"]) * position["quantity"]
-                position["unrealized_pnl"] = unrealized_pnl
-                position["unrealized_pnl_percentage"] = (unrealized_pnl / (position["avg_entry_price"] * position["quantity"])) * 100
+        result = await paper_accounts.submit(account, command)
         
-        return summary
+        # Propagar los precios al resto de cuentas con exposición a los símbolos
+        for symbol, price in prices.items():
+            await paper_accounts.update_price(symbol, price, exclude=account)
+        
+        filled = sum(1 for r in result["results"] if r.get("status") == "FILLED")
+        rejected = sum(1 for r in result["results"] if "error" in r)
+        logger.info(f"📦 Lote de {len(orders)} órdenes en {account}: {filled} ejecutadas, {rejected} rechazadas")
+        
+        result.update({
+            "account": account,
+            "atomic": batch_req.atomic,
+            "total_orders": len(orders),
+            "filled_orders": filled,
+            "rejected_orders": rejected,
+            "market_prices": prices
+        })
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error ejecutando lote de órdenes: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.get("/orders")
+async def get_open_orders(symbol: Optional[str] = None, account: str = Depends(get_account)):
+    """Lista las órdenes pendientes (LIMIT, STOP_LOSS, TAKE_PROFIT)"""
+    try:
+        orders = await paper_accounts.submit(account, lambda engine: engine.get_open_orders(symbol))
+        return {"orders": orders, "total_orders": len(orders)}
+    except Exception as e:
+        logger.error(f"Error obteniendo órdenes: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.delete("/order/{order_id}")
+async def cancel_order(order_id: str, account: str = Depends(get_account)):
+    """Cancela una orden pendiente (local al worker que la recibió, también con Redis)"""
+    try:
+        result = await paper_accounts.submit(account, lambda engine: engine.cancel_order(order_id))
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cancelando orden {order_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.patch("/order/{order_id}")
+async def amend_order(order_id: str, amend_req: AmendOrderRequest, account: str = Depends(get_account)):
+    """Modifica precio y/o cantidad de una orden pendiente (local al worker que la recibió)"""
+    try:
+        result = await paper_accounts.submit(
+            account,
+            lambda engine: engine.amend_order(order_id, price=amend_req.price, quantity=amend_req.quantity)
+        )
+        if "error" in result:
+            status_code = 404 if "no encontrada" in result["error"] else 400
+            raise HTTPException(status_code=status_code, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error modificando orden {order_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.get("/portfolio")
+def get_portfolio(account: str = Depends(get_account)):
+    """Obtiene estado actual del portfolio de paper trading"""
+    try:
+        # Las posiciones ya están marcadas al último precio en update_market_price
+        return paper_accounts.snapshot(account).portfolio
         
     except Exception as e:
         logger.error(f"Error obteniendo portfolio: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @router.get("/trades")
-def get_trade_history():
-    """Obtiene historial de trades"""
+async def get_trade_history(
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[int] = Query(default=None, description="seq del último trade de la página anterior"),
+    symbol: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    descending: bool = Query(default=False),
+    stream: bool = Query(default=False, description="Transmitir todas las páginas como NDJSON"),
+    account: str = Depends(get_account)
+):
+    """Obtiene historial de trades paginado por cursor"""
     try:
-        return {
-            "trades": paper_engine.trade_history,
-            "total_trades": len(paper_engine.trade_history)
-        }
+        # Las lecturas pasan por el escritor del shard: con Redis sus lotes corren en un thread
+        filters = {"symbol": symbol, "start": start, "end": end, "descending": descending}
+        
+        def read_page(page_cursor: Optional[int]):
+            return lambda engine: engine.trade_log.page(cursor=page_cursor, limit=limit, **filters)
+        
+        if stream:
+            async def generate():
+                page_cursor = cursor
+                while True:
+                    trades, page_cursor = await paper_accounts.submit(account, read_page(page_cursor))
+                    if trades:
+                        yield "".join(json.dumps(trade, default=str) + "\n" for trade in trades)
+                    if page_cursor is None:
+                        break
+            
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+        
+        def read(engine):
+            trades, next_cursor = read_page(cursor)(engine)
+            return {
+                "trades": trades,
+                "next_cursor": next_cursor,
+                "total_trades": len(engine.trade_log),
+                "retained_trades": engine.trade_log.retained
+            }
+        
+        return await paper_accounts.submit(account, read)
     except Exception as e:
         logger.error(f"Error obteniendo historial: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @router.get("/statistics")
-def get_trade_statistics():
+def get_trade_statistics(account: str = Depends(get_account)):
     """Obtiene estadísticas de trading"""
     try:
-        return paper_engine.get_trade_statistics()
+        return paper_accounts.snapshot(account).statistics
     except Exception as e:
         logger.error(f"Error obteniendo estadísticas: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+@router.get("/round-trips")
+async def get_round_trips(
+    limit: int = Query(default=100, ge=1, le=1000),
+    account: str = Depends(get_account)
+):
+    """Últimos round trips cerrados (compra emparejada con venta por lotes)"""
+    try:
+        return await paper_accounts.submit(account, lambda engine: {
+            "round_trips": engine.get_round_trips(limit),
+            "total_round_trips": engine.ledger.round_trips
+        })
+    except Exception as e:
+        logger.error(f"Error obteniendo round trips: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
 @router.post("/reset")
-def reset_portfolio(reset_req: PortfolioResetRequest = PortfolioResetRequest()):
-    """Resetea el portfolio de paper trading"""
+async def reset_portfolio(
+    reset_req: PortfolioResetRequest = PortfolioResetRequest(),
+    account: str = Depends(get_account)
+):
+    """Resetea el portfolio de paper trading de una cuenta"""
     try:
-        paper_engine.reset_portfolio(reset_req.new_balance)
+        await paper_accounts.submit(account, lambda engine: engine.reset_portfolio(reset_req.new_balance))
         return {
             "message": "Portfolio reseteado exitosamente",
+            "account": account,
             "new_balance": reset_req.new_balance
         }
     except Exception as e:
@@ -134,10 +327,10 @@ def reset_portfolio(reset_req: PortfolioResetRequest = PortfolioResetRequest()):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @router.post("/close-position/{symbol}")
-def close_position(symbol: str):
+async def close_position(symbol: str, account: str = Depends(get_account)):
     """Cierra completamente una posición"""
     try:
-        result = paper_engine.close_position(symbol)
+        result = await paper_accounts.submit(account, lambda engine: engine.close_position(symbol))
         
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
@@ -154,57 +347,85 @@ def close_position(symbol: str):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @router.get("/positions")
-def get_positions_only():
+def get_positions_only(account: str = Depends(get_account)):
     """Obtiene solo las posiciones activas"""
     try:
-        portfolio = paper_engine.get_portfolio_summary()
+        positions = paper_accounts.snapshot(account).portfolio["positions"]
         return {
-            "positions": portfolio["positions"],
-            "num_positions": portfolio["num_positions"]
+            "positions": positions,
+            "num_positions": len(positions)
         }
     except Exception as e:
         logger.error(f"Error obteniendo posiciones: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @router.post("/update-price/{symbol}")
-def update_symbol_price(symbol: str, db: Session = Depends(get_db)):
+async def update_symbol_price(symbol: str, db: Session = Depends(get_db)):
     """Actualiza manualmente el precio de un símbolo"""
     try:
-        binance_svc = BinanceService(db=db)
-        df = binance_svc.get_klines_df(symbol=symbol, interval="1m", limit=1)
-        current_price = float(df.iloc[-1]['close'])
+        current_price, candle = await run_in_threadpool(_fetch_last_candle, symbol, db)
         
-        paper_engine.update_market_price(symbol, current_price)
+        filled_orders = await paper_accounts.update_price(
+            symbol, current_price, candle=Candle.from_row(candle) if candle is not None else None
+        )
         
         return {
             "symbol": symbol,
             "updated_price": current_price,
-            "timestamp": df.iloc[-1]['timestamp']
+            "timestamp": candle['close_time'] if candle is not None else None,
+            "filled_orders": filled_orders
         }
         
     except Exception as e:
         logger.error(f"Error actualizando precio {symbol}: {e}")
         raise HTTPException(status_code=400, detail=f"Error actualizando precio: {str(e)}")
 
+@router.post("/depth/{symbol}")
+async def update_symbol_depth(
+    symbol: str,
+    limit: int = Query(default=20, ge=5, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Carga un snapshot L2 de Binance para el modelo de ejecución por profundidad"""
+    try:
+        binance_svc = BinanceService(db=db)
+        depth = await run_in_threadpool(binance_svc.get_depth, symbol, limit)
+        paper_accounts.update_depth(symbol, depth["bids"], depth["asks"])
+        return {
+            "symbol": symbol,
+            "bid_levels": len(depth["bids"]),
+            "ask_levels": len(depth["asks"]),
+            "best_bid": depth["bids"][0][0] if depth["bids"] else None,
+            "best_ask": depth["asks"][0][0] if depth["asks"] else None
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error actualizando profundidad {symbol}: {e}")
+        raise HTTPException(status_code=400, detail=f"Error actualizando profundidad: {str(e)}")
+
 @router.get("/balance")
-def get_current_balance():
+def get_current_balance(account: str = Depends(get_account)):
     """Obtiene el balance actual disponible"""
     try:
+        portfolio = paper_accounts.snapshot(account).portfolio
         return {
-            "initial_balance": paper_engine.initial_balance,
-            "current_balance": paper_engine.current_balance,
-            "available_balance": paper_engine.current_balance
+            "initial_balance": portfolio["initial_balance"],
+            "current_balance": portfolio["current_balance"],
+            "available_balance": portfolio["current_balance"]
         }
     except Exception as e:
         logger.error(f"Error obteniendo balance: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @router.get("/performance")
-def get_performance_metrics():
+def get_performance_metrics(account: str = Depends(get_account)):
     """Obtiene métricas de performance del portfolio"""
     try:
-        portfolio = paper_engine.get_portfolio_summary()
-        statistics = paper_engine.get_trade_statistics()
+        snapshot = paper_accounts.snapshot(account)
+        portfolio = snapshot.portfolio
+        statistics = snapshot.statistics
+        last_trade = snapshot.last_trade
         
         return {
             "portfolio_summary": {
@@ -215,9 +436,50 @@ def get_performance_metrics():
                 "realized_pnl": portfolio["realized_pnl"]
             },
             "trading_statistics": statistics,
-            "timestamp": paper_engine.trade_history[-1]["timestamp"] if paper_engine.trade_history else None
+            "timestamp": last_trade["timestamp"] if last_trade else None
         }
         
     except Exception as e:
         logger.error(f"Error obteniendo métricas: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.get("/accounts")
+def list_accounts():
+    """Lista las cuentas de paper trading"""
+    try:
+        accounts = paper_accounts.list_accounts()
+        return {"accounts": accounts, "total_accounts": len(accounts)}
+    except Exception as e:
+        logger.error(f"Error listando cuentas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.post("/accounts")
+async def create_account(account_req: AccountCreateRequest):
+    """Crea una cuenta de paper trading con su propio engine"""
+    try:
+        engine = await paper_accounts.create_account(account_req.account_id, account_req.initial_balance)
+        return {
+            "message": "Cuenta creada exitosamente",
+            "account_id": account_req.account_id,
+            "initial_balance": engine.initial_balance,
+            "shard": paper_accounts.accounts[account_req.account_id].shard_id
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creando cuenta: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@router.delete("/accounts/{account_id}")
+async def delete_account(account_id: str):
+    """Elimina una cuenta de paper trading"""
+    try:
+        await paper_accounts.delete_account(account_id)
+        return {"message": "Cuenta eliminada exitosamente", "account_id": account_id}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        logger.error(f"Error eliminando cuenta: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
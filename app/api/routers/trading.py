@@ -1,3 +1,5 @@
+import re
+import time
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Query, Depends
@@ -7,12 +9,47 @@ from app.core.config import settings
 from app.core.database import get_db
 from app.services.binance_client import BinanceService
 from app.services.strategy_service import build_features
-from app.services.model_service import LocalClassifier
+from app.services.model_service import (
+    DEFAULT_MODEL_NAME,
+    EnsembleClassifier,
+    LocalClassifier,
+    model_version,
+)
+from app.services.prediction_cache import prediction_cache
 from app.services.logging_service import BinanceLogger, TimingContext
 
 
 router = APIRouter(prefix="/trading", tags=["trading"])
 
+MODEL_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _parse_model_names(models: Optional[str]) -> list[str]:
+    """Lista de modelos separada por comas (por defecto el modelo principal)"""
+    names = [n.strip() for n in (models or DEFAULT_MODEL_NAME).split(",") if n.strip()]
+    if not names or not all(MODEL_NAME_RE.match(n) for n in names):
+        raise HTTPException(status_code=400, detail="Nombre de modelo inválido")
+    return names
+
+
+def _models_version(names: list[str], vote: str):
+    """Versión conjunta de los modelos sin cargarlos (None si falta alguno)"""
+    versions = [model_version(settings.models_dir, n) for n in names]
+    if any(v is None for v in versions):
+        return None
+    if len(names) == 1:
+        return versions[0]
+    return (vote, *versions)
+
+
+def _load_model(names: list[str], vote: str):
+    if len(names) == 1:
+        return LocalClassifier(models_dir=settings.models_dir, name=names[0])
+    try:
+        return EnsembleClassifier(models_dir=settings.models_dir, names=names, method=vote)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
 @router.get("/klines")
 def get_klines(
@@ -38,25 +75,33 @@ def train_model(
     symbol: str = Query(default=settings.default_symbol),
     interval: str = Query(default=settings.default_interval),
     limit: int = Query(default=1000, ge=100, le=2000),
+    model_name: str = Query(default=DEFAULT_MODEL_NAME),
+    l2: float = Query(default=0.0, ge=0.0),
+    train_window: Optional[int] = Query(default=None, ge=50),
     db: Session = Depends(get_db)
 ):
+    if not MODEL_NAME_RE.match(model_name):
+        raise HTTPException(status_code=400, detail="Nombre de modelo inválido")
+    parameters = {"interval": interval, "limit": limit, "model_name": model_name, "l2": l2, "train_window": train_window}
+
     with TimingContext() as timer:
         try:
             svc = BinanceService(db=db)
             df = svc.get_klines_df(symbol=symbol, interval=interval, limit=limit)
             feat_df = build_features(df)
 
-            clf = LocalClassifier(models_dir=settings.models_dir)
-            metrics = clf.train(feat_df)
+            clf = LocalClassifier(models_dir=settings.models_dir, name=model_name)
+            metrics = clf.train(feat_df, l2=l2, window=train_window)
+            prediction_cache.invalidate()
             
-            result = {"trained": True, "metrics": metrics}
+            result = {"trained": True, "model_name": model_name, "metrics": metrics}
             
             # Log trading operation
             BinanceLogger.log_trading_operation(
                 db=db,
                 operation_type="train",
                 symbol=symbol,
-                parameters={"interval": interval, "limit": limit},
+                parameters=parameters,
                 result=result,
                 execution_time_ms=timer.execution_time_ms,
                 success=True,
@@ -69,7 +114,7 @@ def train_model(
                 db=db,
                 operation_type="train",
                 symbol=symbol,
-                parameters={"interval": interval, "limit": limit},
+                parameters=parameters,
                 execution_time_ms=timer.execution_time_ms,
                 success=False,
                 error_message=str(e)
@@ -82,31 +127,70 @@ def predict_signal(
     symbol: str = Query(default=settings.default_symbol),
     interval: str = Query(default=settings.default_interval),
     lookback: int = Query(default=100, ge=20, le=500),
+    models: Optional[str] = Query(default=None, description="Modelos separados por coma; más de uno forma un ensemble"),
+    vote: str = Query(default="mean", pattern="^(mean|majority|weighted)$"),
 ):
+    names = _parse_model_names(models)
+    version = _models_version(names, vote)
+    if version is None:
+        raise HTTPException(status_code=400, detail="Modelo no entrenado aún. Llama /api/trading/train primero.")
+
+    # Entre cierres de vela la predicción es la misma: servirla desde cache
+    series_key = (symbol, interval, lookback, tuple(names), vote)
+    cached = prediction_cache.get(series_key, version)
+    if cached is not None:
+        return cached
+
     svc = BinanceService()
-    df = svc.get_klines_df(symbol=symbol, interval=interval, limit=lookback)
+    df = svc.get_klines_df(symbol=symbol, interval=interval, limit=lookback + 1)
+
+    # Descartar la vela en curso: solo se predice sobre velas cerradas
+    now_ms = int(time.time() * 1000)
+    close_ms = df["close_time"].astype("int64") // 1_000_000
+    in_progress = close_ms > now_ms
+    if in_progress.any():
+        valid_until = int(close_ms[in_progress].iloc[-1]) + 1
+    else:
+        # Sin vela en curso la predicción vale hasta el cierre de la siguiente vela esperada
+        last_close = int(close_ms.iloc[-1])
+        last_open = int(df["open_time"].iloc[-1].value // 1_000_000)
+        valid_until = 2 * last_close - last_open + 2
+    df = df[~in_progress].tail(lookback).reset_index(drop=True)
     feat_df = build_features(df)
 
-    clf = LocalClassifier(models_dir=settings.models_dir)
+    clf = _load_model(names, vote)
     if not clf.available:
         raise HTTPException(status_code=400, detail="Modelo no entrenado aún. Llama /api/trading/train primero.")
 
     pred = clf.predict_latest(feat_df)
+    candle_open_time = int(df["open_time"].iloc[-1].value // 1_000_000)
+    if valid_until > now_ms:  # Datos atrasados: la siguiente vela ya cerró, no cachear
+        prediction_cache.put(series_key, version, candle_open_time, valid_until, pred)
     return pred
 
 
+@router.get("/predict/cache")
+def predict_cache_stats():
+    return prediction_cache.stats()
+
+
 @router.get("/backtest")
 def backtest(
     symbol: str = Query(default=settings.default_symbol),
     interval: str = Query(default=settings.default_interval),
     limit: int = Query(default=1000, ge=200, le=2000),
+    models: Optional[str] = Query(default=None, description="Modelos separados por coma; más de uno forma un ensemble"),
+    vote: str = Query(default="mean", pattern="^(mean|majority|weighted)$"),
 ):
+    names = _parse_model_names(models)
     svc = BinanceService()
     df = svc.get_klines_df(symbol=symbol, interval=interval, limit=limit)
     feat_df = build_features(df)
 
-    clf = LocalClassifier(models_dir=settings.models_dir)
+    clf = _load_model(names, vote)
     if not clf.available:
+        if len(names) > 1:
+            raise HTTPException(status_code=400, detail="Todos los modelos del ensemble deben estar entrenados.")
         # Entrenado rápido sobre el mismo set para demo/backtest simple
         clf.train(feat_df)
 
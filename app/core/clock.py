@@ -0,0 +1,158 @@
+"""
+Reloj inyectable: tiempo real o simulado (paso fijo / tan rápido como sea posible)
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+
+CLOCK_MODES = ("realtime", "fixed_step", "fast")
+
+
+class Clock(ABC):
+    """Interfaz de reloj que usan los servicios en lugar de datetime.now()/time.time().
+
+    - `now()`: fecha actual (naive, hora local como datetime.now()).
+    - `epoch()`: segundos epoch (UTC) de una fecha de este reloj; es la base de
+      las klines, así que sirve para comparar con la apertura de una vela.
+    - `time()`: segundos epoch de `now()`.
+    - `monotonic()`: segundos para medir duraciones.
+    - `sleep()` / `async_sleep()`: esperar; en los relojes simulados avanzan el
+      tiempo sin bloquear.
+    """
+
+    mode = "base"
+    simulated = False
+
+    @abstractmethod
+    def now(self) -> datetime:
+        """Fecha actual del reloj"""
+
+    def epoch(self, moment: datetime) -> float:
+        return moment.timestamp()
+
+    def time(self) -> float:
+        return self.epoch(self.now())
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """Segundos de un contador que nunca retrocede"""
+
+    @abstractmethod
+    def sleep(self, seconds: float) -> None:
+        """Espera (o avanza el tiempo simulado) `seconds` segundos"""
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.sleep(seconds)
+
+
+class RealTimeClock(Clock):
+    """Reloj de pared (comportamiento de producción)"""
+
+    mode = "realtime"
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    """Reloj simulado tan rápido como sea posible.
+
+    El tiempo solo avanza cuando lo mueve quien conduce la simulación
+    (`advance`/`advance_to`, p. ej. con el timestamp de cada vela) o con `sleep`,
+    que avanza al instante. Dos ejecuciones con los mismos datos producen los
+    mismos timestamps. Sus fechas naive son UTC, como las de las klines con las
+    que se conduce, para que el resultado no dependa de la zona horaria del host.
+    """
+
+    mode = "fast"
+    simulated = True
+
+    def __init__(self, start: datetime | None = None):
+        self._start = start or datetime(2024, 1, 1)
+        self._now = self._start
+
+    def now(self) -> datetime:
+        return self._now
+
+    def epoch(self, moment: datetime) -> float:
+        return moment.replace(tzinfo=timezone.utc).timestamp() if moment.tzinfo is None else moment.timestamp()
+
+    def monotonic(self) -> float:
+        return (self._now - self._start).total_seconds()
+
+    def advance(self, seconds: float) -> datetime:
+        if seconds < 0:
+            raise ValueError("El reloj simulado no puede retroceder")
+        self._now += timedelta(seconds=seconds)
+        return self._now
+
+    def advance_to(self, moment: datetime) -> datetime:
+        """Mueve el reloj a `moment`; los instantes anteriores se ignoran (el tiempo no retrocede)"""
+        if moment > self._now:
+            self._now = moment
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(max(0.0, seconds))
+
+
+class FixedStepClock(SimulatedClock):
+    """Reloj simulado que avanza en pasos fijos de `step` segundos.
+
+    `tick()` avanza un paso; `sleep` redondea hacia arriba a pasos enteros, de modo
+    que todos los timestamps caen en la rejilla start + k * step.
+    """
+
+    mode = "fixed_step"
+
+    def __init__(self, start: datetime | None = None, step: float = 60.0):
+        if step <= 0:
+            raise ValueError("El paso del reloj debe ser positivo")
+        super().__init__(start)
+        self.step = step
+
+    def tick(self, steps: int = 1) -> datetime:
+        return self.advance(self.step * steps)
+
+    def advance_to(self, moment: datetime) -> datetime:
+        if moment > self._now:
+            self.tick(math.ceil((moment - self._now).total_seconds() / self.step))
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.tick(math.ceil(seconds / self.step))
+
+
+def build_clock(mode: str, start: datetime | None = None, step: float = 60.0) -> Clock:
+    """Crea el reloj configurado"""
+    mode = mode.lower()
+    if mode == "realtime":
+        return RealTimeClock()
+    if mode == "fixed_step":
+        return FixedStepClock(start, step)
+    if mode == "fast":
+        return SimulatedClock(start)
+    raise ValueError(f"Modo de reloj inválido: {mode}")
+
+
+# Reloj por defecto de los servicios
+clock = build_clock(settings.clock_mode, settings.clock_start, settings.clock_step_seconds)
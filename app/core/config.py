@@ -1,3 +1,4 @@
+from datetime import datetime
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -22,10 +23,71 @@ class Settings(BaseSettings):
     default_symbol: str = "BTCUSDT"
     default_interval: str = "1h"
 
+    # Postgres (persistencia write-behind); sin URL se desactiva
+    database_url: str | None = None
+    persistence_batch_size: int = 500
+    persistence_flush_interval: float = 1.0  # Segundos máximos entre escrituras
+    persistence_max_queue: int = 100_000
+    learning_hydrate_limit: int = 10_000  # Trades cargados al arrancar
+
+    # Base de datos de logs (SQLAlchemy + alembic). Sin URL se usa SQLite en
+    # data_dir; puede apuntar al mismo Postgres que DATABASE_URL
+    logs_database_url: str | None = None
+    sqlite_cache_size_kb: int = 64_000  # PRAGMA cache_size (KiB)
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # PRAGMA mmap_size (bytes)
+    db_pool_size: int = 10  # Conexiones persistentes del pool (Postgres)
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 10.0
+    db_pool_recycle: int = 1800  # Segundos antes de renovar una conexión
+    db_statement_cache_size: int = 1_000  # Sentencias compiladas en caché por engine
+
+    # Logs de Binance: cola en memoria + hilo escritor con inserts en bloque
+    log_sink_enabled: bool = True
+    log_sink_batch_size: int = 500
+    log_sink_flush_interval: float = 0.5  # Segundos máximos entre escrituras
+    log_sink_max_queue: int = 50_000
+    log_sink_policy: str = "drop"  # Con la cola llena: "drop" (descartar) o "block" (esperar)
+    log_sink_block_timeout: float = 0.05  # Espera máxima con "block" antes de descartar
+
+    # Learning agent
+    learning_metrics_window: int = 50  # Trades en la ventana de métricas
+    learning_analysis_window: int = 30  # Trades en el análisis por condiciones de mercado
+    learning_background_adjustments: bool = True  # Ajustes de parámetros en un hilo (coalescing)
+    learning_tuner_workers: int = 0  # Procesos del tuner offline (0 = CPUs disponibles)
+    learning_tuner_max_policies: int = 1_000  # Políticas por tuning
+    learning_outcome_cap: int = 200_000  # Trades retenidos en memoria
+    learning_spill_enabled: bool = True  # Volcar a disco los trades que exceden el cap
+    learning_performance_history: int = 1_000  # Registros de métricas retenidos
+
+    # Reloj: realtime, fixed_step (simulado, pasos de clock_step_seconds) o fast
+    # (simulado, avanza solo con los datos); clock_start fija el inicio simulado
+    clock_mode: str = "realtime"
+    clock_step_seconds: float = 60.0
+    clock_start: datetime | None = None
+
+    # Redis (estado compartido entre workers)
+    redis_url: str = "redis://localhost:6379/0"
+    redis_state_namespace: str = "paper"
+
+    # Paper trading
+    paper_trading_initial_balance: float = 10000.0
+    paper_account_shards: int = 4  # Escritores (shards) entre los que se reparten las cuentas
+    paper_trade_log_retention: int = 100_000  # Trades retenidos en memoria
+    paper_lot_method: str = "FIFO"  # Emparejamiento de lotes: FIFO, LIFO o AVERAGE
+    paper_fill_model: str = "volume"  # Modelo de ejecución: fixed, volume o depth
+    paper_journal_enabled: bool = True  # Journal en disco para recuperar el estado al reiniciar
+    paper_journal_snapshot_every: int = 50_000  # Eventos entre snapshots (acota el replay)
+    paper_journal_fsync: bool = True
+    # "memory" (un solo proceso) o "redis" (portfolio único con varios workers de uvicorn;
+    # desactiva el journal en disco: Redis pasa a ser la fuente de verdad)
+    paper_state_backend: str = "memory"
+
     # Rutas locales
     base_dir: Path = Path("/app")
     data_dir: Path = base_dir / "data"
     models_dir: Path = base_dir / "models"
+    paper_journal_dir: Path | None = None  # Por defecto data_dir/paper_journal
+    learning_spill_dir: Path | None = None  # Por defecto data_dir/learning_spill
 
 
 settings = Settings()
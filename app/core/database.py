@@ -1,16 +1,52 @@
-from sqlalchemy import create_engine
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
-# URL de la base de datos SQLite
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{settings.data_dir}/binance_logs.db"
+# URL de la base de datos de logs: SQLite local por defecto o la configurada (p. ej. Postgres)
+SQLALCHEMY_DATABASE_URL = settings.logs_database_url or f"sqlite:///{settings.data_dir}/binance_logs.db"
+
+# Migraciones compartidas por SQLite y Postgres
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL: las lecturas no bloquean a la escritura; NORMAL: fsync solo en checkpoints"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Solo para SQLite
-)
+
+def build_engine(url: str) -> Engine:
+    """Engine con la configuración de cada backend"""
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": 30},  # Solo para SQLite
+            query_cache_size=settings.db_statement_cache_size
+        )
+        event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+        query_cache_size=settings.db_statement_cache_size
+    )
+
+
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -27,5 +63,10 @@ def get_db():
 
 
 def create_tables():
-    """Crear todas las tablas"""
-    Base.metadata.create_all(bind=engine)
+    """Crear o actualizar las tablas aplicando las migraciones de alembic"""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["configure_logger"] = False  # No pisar la configuración de logging de la app
+    command.upgrade(config, "head")
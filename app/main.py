@@ -8,6 +8,11 @@ from app.api.routers.trading import router as trading_router
 from app.api.routers.logs import router as logs_router
 from app.api.routers.paper_trading import router as paper_trading_router
 from app.api.routers.learning import router as learning_router
+from app.services.paper_accounts import paper_accounts
+from app.services.learning_agent import learning_agent
+from app.services.persistence_service import persistence_service
+from app.services.logging_service import BinanceLogger, log_sink
+from fastapi.concurrency import run_in_threadpool
 
 
 app = FastAPI(title="IA-Agents Trading API", version="0.1.0")
@@ -27,8 +32,62 @@ def on_startup() -> None:
     for path in [settings.data_dir, settings.models_dir]:
         path.mkdir(parents=True, exist_ok=True)
     
-    # Crear tablas de base de datos
+    # Crear/actualizar tablas de base de datos (migraciones de alembic)
     create_tables()
+    
+    # Logs de Binance fuera del request: cola + inserts en bloque
+    if settings.log_sink_enabled:
+        log_sink.start()
+        BinanceLogger.sink = log_sink
+
+
+@app.on_event("startup")
+async def start_paper_accounts() -> None:
+    # Un escritor único por shard de cuentas de paper trading
+    await paper_accounts.start()
+
+
+@app.on_event("startup")
+async def start_learning_adjustments() -> None:
+    # Ajustes del learning agent fuera del request (se reducen al último pendiente)
+    if settings.learning_background_adjustments:
+        learning_agent.start_adjustment_worker()
+
+
+@app.on_event("startup")
+async def start_persistence() -> None:
+    # Write-behind a Postgres; se conecta después de recuperar las cuentas
+    if not persistence_service.enabled:
+        return
+    await run_in_threadpool(
+        persistence_service.hydrate_learning_agent, learning_agent, settings.learning_hydrate_limit
+    )
+    learning_agent.outcome_sink = persistence_service.record_learning_trade
+    learning_agent.metrics_sink = persistence_service.record_learning_metrics
+    paper_accounts.set_trade_sink(persistence_service.paper_trade_sink)
+    persistence_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_paper_accounts() -> None:
+    await paper_accounts.stop()
+
+
+@app.on_event("shutdown")
+async def stop_learning_adjustments() -> None:
+    await run_in_threadpool(learning_agent.stop_adjustment_worker)
+
+
+@app.on_event("shutdown")
+async def stop_log_sink() -> None:
+    # Escribir los logs encolados antes de salir
+    await run_in_threadpool(log_sink.stop)
+
+
+@app.on_event("shutdown")
+async def stop_persistence() -> None:
+    # Vaciar las filas pendientes antes de salir
+    await run_in_threadpool(persistence_service.stop)
 
 
 app.include_router(health_router, prefix="/api")
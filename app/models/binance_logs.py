@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, Index
 from sqlalchemy.sql import func
 
 from app.core.database import Base
@@ -8,6 +8,13 @@ from app.core.database import Base
 class BinanceRequestLog(Base):
     """Tabla para logs de solicitudes a Binance"""
     __tablename__ = "binance_request_logs"
+    # Índices con la forma de las consultas de /logs: filtro + orden (timestamp, id) desc
+    __table_args__ = (
+        Index("ix_binance_request_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_binance_request_logs_symbol_timestamp_id", "symbol", "timestamp", "id"),
+        Index("ix_binance_request_logs_operation_type_timestamp_id", "operation_type", "timestamp", "id"),
+        Index("ix_binance_request_logs_success_timestamp_id", "success", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
@@ -21,18 +28,24 @@ class BinanceRequestLog(Base):
     error_message = Column(Text, nullable=True)
     
     # Campos específicos para trading
-    symbol = Column(String(20), nullable=True, index=True)
-    operation_type = Column(String(50), nullable=True, index=True)  # klines, order, account, etc.
+    symbol = Column(String(20), nullable=True)
+    operation_type = Column(String(50), nullable=True)  # klines, order, account, etc.
 
 
 class TradingOperation(Base):
     """Tabla para operaciones de trading específicas"""
     __tablename__ = "trading_operations"
+    __table_args__ = (
+        Index("ix_trading_operations_timestamp_id", "timestamp", "id"),
+        Index("ix_trading_operations_symbol_timestamp_id", "symbol", "timestamp", "id"),
+        Index("ix_trading_operations_operation_type_timestamp_id", "operation_type", "timestamp", "id"),
+        Index("ix_trading_operations_success_timestamp_id", "success", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    operation_type = Column(String(50), nullable=False, index=True)  # train, predict, backtest, order
-    symbol = Column(String(20), nullable=False, index=True)
+    operation_type = Column(String(50), nullable=False)  # train, predict, backtest, order
+    symbol = Column(String(20), nullable=False)
     parameters = Column(Text)  # JSON string de parámetros
     result = Column(Text)  # JSON string del resultado
     execution_time_ms = Column(Float)
@@ -91,6 +91,89 @@ class BinanceService:
         df = df.sort_values("open_time").reset_index(drop=True)
         return df
 
+    def get_prices(self, symbols: list[str]) -> dict[str, float]:
+        """Último precio de varios símbolos en una sola llamada a Binance"""
+        symbols = list(dict.fromkeys(symbols))
+        params = {"symbols": symbols}
+
+        with TimingContext() as timer:
+            try:
+                if len(symbols) == 1:
+                    raw = [self.client.ticker_price(symbol=symbols[0])]
+                else:
+                    raw = self.client.ticker_price(symbols=symbols)
+            except Exception as e:
+                if self.db:
+                    BinanceLogger.log_binance_request(
+                        self.db,
+                        endpoint="ticker_price",
+                        method="GET",
+                        request_params=params,
+                        response_status=500,
+                        response_time_ms=timer.execution_time_ms,
+                        success=False,
+                        error_message=str(e),
+                        operation_type="ticker_price"
+                    )
+                raise
+
+        if self.db:
+            BinanceLogger.log_binance_request(
+                self.db,
+                endpoint="ticker_price",
+                method="GET",
+                request_params=params,
+                response_data={"rows_count": len(raw)},
+                response_status=200,
+                response_time_ms=timer.execution_time_ms,
+                success=True,
+                operation_type="ticker_price"
+            )
+
+        return {row["symbol"]: float(row["price"]) for row in raw}
+
+    def get_depth(self, symbol: str, limit: int = 20) -> dict[str, list[list[float]]]:
+        """Snapshot L2 del libro de órdenes (bids y asks como [precio, cantidad])"""
+        params = {"symbol": symbol, "limit": limit}
+
+        with TimingContext() as timer:
+            try:
+                raw = self.client.depth(symbol=symbol, limit=limit)
+            except Exception as e:
+                if self.db:
+                    BinanceLogger.log_binance_request(
+                        self.db,
+                        endpoint="depth",
+                        method="GET",
+                        request_params=params,
+                        response_status=500,
+                        response_time_ms=timer.execution_time_ms,
+                        success=False,
+                        error_message=str(e),
+                        symbol=symbol,
+                        operation_type="depth"
+                    )
+                raise
+
+        if self.db:
+            BinanceLogger.log_binance_request(
+                self.db,
+                endpoint="depth",
+                method="GET",
+                request_params=params,
+                response_data={"bids": len(raw["bids"]), "asks": len(raw["asks"])},
+                response_status=200,
+                response_time_ms=timer.execution_time_ms,
+                success=True,
+                symbol=symbol,
+                operation_type="depth"
+            )
+
+        return {
+            "bids": [[float(p), float(q)] for p, q in raw["bids"]],
+            "asks": [[float(p), float(q)] for p, q in raw["asks"]],
+        }
+
     def place_order(
         self,
         symbol: str,
@@ -0,0 +1,182 @@
+"""
+Modelos de ejecución (fill models) para el paper trading engine
+"""
+from typing import Dict, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FILL_MODELS = ("fixed", "volume", "depth")
+MARKET_SLIPPAGE = 0.0005  # 0.05% slippage
+
+
+@dataclass(slots=True)
+class Candle:
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float  # Volumen en el activo base
+    open_time: Optional[float] = None  # Epoch (s) de apertura; None = sin hora (replays)
+
+    @classmethod
+    def from_row(cls, row) -> "Candle":
+        open_time = row.get("open_time")
+        return cls(
+            open=float(row["open"]),
+            high=float(row["high"]),
+            low=float(row["low"]),
+            close=float(row["close"]),
+            volume=float(row["volume"]),
+            open_time=open_time.timestamp() if open_time is not None else None
+        )
+
+
+class FillModel(ABC):
+    """Interfaz de un modelo de ejecución a mercado.
+
+    `market_fill` devuelve (precio, cantidad ejecutada) para una orden; la cantidad
+    puede ser menor que la pedida. `market_fills` es la versión vectorizada para
+    muchas órdenes a la vez (lotes y replays acelerados).
+    """
+
+    name = "base"
+
+    def market_fill(self, symbol: str, is_buy: bool, quantity: float, price: float,
+                    candle: Optional[Candle] = None) -> Tuple[float, float]:
+        prices, filled = self.market_fills(
+            symbol, np.array([is_buy]), np.array([quantity], dtype=float), price, candle
+        )
+        return float(prices[0]), float(filled[0])
+
+    @abstractmethod
+    def market_fills(self, symbol: str, is_buy: np.ndarray, quantity: np.ndarray, price: float,
+                     candle: Optional[Candle] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Precios y cantidades ejecutadas de cada orden"""
+
+
+class FixedSlippageModel(FillModel):
+    """Slippage fijo sobre el precio de referencia; siempre ejecuta toda la cantidad"""
+
+    name = "fixed"
+
+    def __init__(self, slippage: float = MARKET_SLIPPAGE):
+        self.slippage = slippage
+
+    def market_fill(self, symbol, is_buy, quantity, price, candle=None):
+        return (price * (1 + self.slippage) if is_buy else price * (1 - self.slippage)), quantity
+
+    def market_fills(self, symbol, is_buy, quantity, price, candle=None):
+        sign = np.where(is_buy, 1.0, -1.0)
+        return price * (1 + sign * self.slippage), quantity.astype(float)
+
+
+class VolumeSlippageModel(FillModel):
+    """Slippage que crece con la participación en el volumen de la vela.
+
+    slippage = base + impact * sqrt(cantidad / volumen), y la cantidad ejecutada se
+    limita a `max_participation` del volumen de la vela (el resto no se ejecuta).
+    Sin vela disponible se comporta como slippage fijo `base`.
+    """
+
+    name = "volume"
+
+    def __init__(self, base_slippage: float = MARKET_SLIPPAGE, impact: float = 0.01,
+                 max_participation: float = 0.1):
+        self.base_slippage = base_slippage
+        self.impact = impact
+        self.max_participation = max_participation
+
+    def market_fill(self, symbol, is_buy, quantity, price, candle=None):
+        if candle is None or candle.volume <= 0:
+            slippage, filled = self.base_slippage, quantity
+        else:
+            filled = min(quantity, self.max_participation * candle.volume)
+            slippage = self.base_slippage + self.impact * math.sqrt(filled / candle.volume)
+        return (price * (1 + slippage) if is_buy else price * (1 - slippage)), filled
+
+    def market_fills(self, symbol, is_buy, quantity, price, candle=None):
+        quantity = quantity.astype(float)
+        if candle is None or candle.volume <= 0:
+            filled = quantity
+            slippage = np.full(len(quantity), self.base_slippage)
+        else:
+            filled = np.minimum(quantity, self.max_participation * candle.volume)
+            slippage = self.base_slippage + self.impact * np.sqrt(filled / candle.volume)
+        sign = np.where(is_buy, 1.0, -1.0)
+        return price * (1 + sign * slippage), filled
+
+
+class DepthWalkModel(FillModel):
+    """Recorre un snapshot L2 (niveles de bids/asks) y ejecuta al VWAP consumido.
+
+    La cantidad ejecutada se limita a la profundidad disponible. Sin snapshot para
+    el símbolo se delega en `fallback`.
+    """
+
+    name = "depth"
+
+    def __init__(self, fallback: Optional[FillModel] = None):
+        self.fallback = fallback or VolumeSlippageModel()
+        # symbol -> (precios, cantidades acumuladas, nocional acumulado) por lado
+        self._asks: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._bids: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    @staticmethod
+    def _levels(levels: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        arr = np.asarray(levels, dtype=float).reshape(-1, 2)
+        prices, sizes = arr[:, 0], arr[:, 1]
+        return prices, np.cumsum(sizes), np.cumsum(prices * sizes)
+
+    def update_depth(self, symbol: str, bids: Sequence[Sequence[float]], asks: Sequence[Sequence[float]]):
+        """Guarda un snapshot L2; bids de mayor a menor precio y asks de menor a mayor"""
+        self._bids[symbol] = self._levels(bids)
+        self._asks[symbol] = self._levels(asks)
+
+    def has_depth(self, symbol: str) -> bool:
+        return symbol in self._asks and symbol in self._bids
+
+    def market_fills(self, symbol, is_buy, quantity, price, candle=None):
+        quantity = quantity.astype(float)
+        if not self.has_depth(symbol):
+            return self.fallback.market_fills(symbol, is_buy, quantity, price, candle)
+
+        prices = np.empty(len(quantity))
+        filled = np.empty(len(quantity))
+        for side_mask, book in ((is_buy, self._asks[symbol]), (~is_buy, self._bids[symbol])):
+            if not side_mask.any():
+                continue
+            level_prices, cum_size, cum_notional = book
+            if not len(level_prices):
+                prices[side_mask] = price
+                filled[side_mask] = 0.0
+                continue
+            qty = np.minimum(quantity[side_mask], cum_size[-1])
+            # Nivel en el que se completa cada orden y nocional consumido hasta él
+            idx = np.searchsorted(cum_size, qty, side="left")
+            idx = np.minimum(idx, len(level_prices) - 1)
+            prev_size = np.where(idx > 0, cum_size[idx - 1], 0.0)
+            prev_notional = np.where(idx > 0, cum_notional[idx - 1], 0.0)
+            notional = prev_notional + (qty - prev_size) * level_prices[idx]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                vwap = np.where(qty > 0, notional / qty, level_prices[0])
+            prices[side_mask] = vwap
+            filled[side_mask] = qty
+        return prices, filled
+
+
+def build_fill_model(name: str) -> FillModel:
+    """Crea el modelo de ejecución configurado"""
+    name = name.lower()
+    if name == "fixed":
+        return FixedSlippageModel()
+    if name == "volume":
+        return VolumeSlippageModel()
+    if name == "depth":
+        return DepthWalkModel()
+    raise ValueError(f"Modelo de ejecución inválido: {name}")
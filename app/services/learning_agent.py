@@ -1,32 +1,37 @@
 """
 Agente de Aprendizaje para Trading Automatizado
 """
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+from collections import deque
+from types import MappingProxyType
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 import json
 import logging
+import threading
+
+from app.core.clock import Clock, clock as default_clock
+from app.core.config import settings
+from app.services.learning_metrics import ConditionBuckets, RollingMetrics
+from app.services.outcome_index import OutcomeIndex
+from app.services.trade_outcomes import TradeOutcome, TradeOutcomeStore
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class TradeOutcome:
-    trade_id: str
-    symbol: str
-    side: str
-    entry_price: float
-    exit_price: float
-    quantity: float
-    pnl: float
-    pnl_percentage: float
-    hold_time_minutes: int
-    market_conditions: Dict
-    decision_confidence: float
-    timestamp: datetime
+# Motivos de should_trade_batch, indexados por la columna `reason`
+BATCH_REASONS = (
+    "Condiciones favorables",
+    "Score final insuficiente",
+    "Confianza menor que threshold",
+    "Filtros de mercado: Volatilidad demasiado alta",
+    "Filtros de mercado: Volatilidad demasiado baja",
+    "Filtros de mercado: Volumen insuficiente",
+    "Filtros de mercado: Performance reciente mala, aplicando filtros estrictos",
+)
 
-@dataclass
+@dataclass(slots=True)
 class LearningMetrics:
     total_trades: int
     win_rate: float
@@ -39,136 +44,307 @@ class LearningMetrics:
     best_trade: float
     worst_trade: float
 
+@dataclass(slots=True)
+class LearningPolicy:
+    """Reglas de ajuste del agente; los valores por defecto son los de producción"""
+    confidence_threshold: float = 0.6  # Threshold inicial
+    threshold_min: float = 0.5
+    threshold_max: float = 0.8
+    threshold_step: float = 0.05  # Paso por win rate alto/bajo
+    profit_factor_step: float = 0.02  # Paso extra con profit factor bajo
+    high_win_rate: float = 0.65
+    low_win_rate: float = 0.45
+    min_profit_factor: float = 1.2
+    weight_step: float = 0.1
+    weight_max: float = 2.0
+    final_score_threshold: float = 0.65
+    adjust_every: int = 5  # Trades entre ajustes
+
+@dataclass(frozen=True, slots=True)
+class LearningParameters:
+    """Snapshot inmutable de los parámetros que leen should_trade y la API.
+
+    Cada ajuste publica un snapshot nuevo con `version` + 1 reemplazando la
+    referencia de una vez, así que los lectores nunca ven un ajuste a medias
+    y no necesitan lock.
+    """
+    version: int
+    confidence_threshold: float
+    market_conditions_weights: Mapping[str, float]
+    optimal_conditions: Mapping[str, Any]
+    strict_filters: bool  # Performance reciente mala: filtros más estrictos
+    published_at: datetime
+
 class LearningAgent:
-    def __init__(self):
-        self.trade_outcomes: List[TradeOutcome] = []
-        self.performance_history: List[Dict] = []
-        
-        # Parámetros de aprendizaje ajustables
-        self.market_conditions_weights: Dict = {
-            "volatility": 1.0,
-            "trend_strength": 1.0,
-            "volume_ratio": 1.0,
-            "rsi_level": 1.0,
-            "macd_signal": 1.0
-        }
+    def __init__(self, clock: Optional[Clock] = None, policy: Optional[LearningPolicy] = None,
+                 outcome_store: Optional[TradeOutcomeStore] = None):
+        self.clock = clock or default_clock  # Reloj real o simulado (replays deterministas)
+        self.policy = policy or LearningPolicy()
+        # Columnar y acotado: TradeOutcome se materializa al leer
+        self.trade_outcomes = outcome_store if outcome_store is not None else TradeOutcomeStore(
+            max_retained=settings.learning_outcome_cap,
+            spill_dir=(settings.learning_spill_dir or settings.data_dir / "learning_spill")
+            if settings.learning_spill_enabled else None
+        )
+        # Ventana deslizante de métricas (O(1) por trade)
+        self.metrics_window = RollingMetrics(window=settings.learning_metrics_window)
+        # Agregados por condiciones de mercado de los últimos trades (análisis O(1))
+        self.condition_buckets = ConditionBuckets(window=settings.learning_analysis_window)
+        # Índice por tiempo y símbolo de toda la vida del agente (métricas de cualquier rango)
+        self.outcome_index = OutcomeIndex()
+        self.performance_history: Deque[Dict] = deque(maxlen=settings.learning_performance_history)
         
-        self.confidence_threshold = 0.6
         self.learning_rate = 0.1
         self.min_trades_for_learning = 5
         
-        # Métricas de mercado óptimas aprendidas
-        self.optimal_conditions = {
-            "volatility_range": (1.0, 3.0),  # Rango óptimo de volatilidad
-            "volume_ratio_min": 1.2,  # Ratio de volumen mínimo
-            "trend_strength_min": 0.7  # Fuerza de tendencia mínima
-        }
+        # Sinks opcionales de persistencia (write-behind)
+        self.outcome_sink: Optional[Callable[[TradeOutcome], None]] = None
+        self.metrics_sink: Optional[Callable[[Dict], None]] = None
+        
+        # Concurrencia: _state_lock protege historial y ventanas; _adjust_lock
+        # serializa los ajustes, únicos escritores de los parámetros de trabajo
+        self._state_lock = threading.RLock()
+        self._adjust_lock = threading.Lock()
+        self._adjust_event = threading.Event()
+        self._adjust_stop = threading.Event()
+        self._adjust_thread: Optional[threading.Thread] = None
+        self.adjustments_requested = 0
+        self.adjustments_run = 0
+        
+        # Parámetros de trabajo (solo los modifica el ajuste) y snapshot publicado
+        self.parameters: Optional[LearningParameters] = None
+        self.reset_parameters()
         
         logger.info("🧠 Learning Agent inicializado")
     
+    def reset_parameters(self):
+        """Vuelve a los parámetros iniciales y publica el snapshot"""
+        with self._adjust_lock:
+            # Parámetros de aprendizaje ajustables
+            self.market_conditions_weights: Dict = {
+                "volatility": 1.0,
+                "trend_strength": 1.0,
+                "volume_ratio": 1.0,
+                "rsi_level": 1.0,
+                "macd_signal": 1.0
+            }
+            
+            self.confidence_threshold = self.policy.confidence_threshold
+            
+            # Métricas de mercado óptimas aprendidas
+            self.optimal_conditions = {
+                "volatility_range": (1.0, 3.0),  # Rango óptimo de volatilidad
+                "volume_ratio_min": 1.2,  # Ratio de volumen mínimo
+                "trend_strength_min": 0.7  # Fuerza de tendencia mínima
+            }
+            self._publish_parameters()
+    
+    def set_confidence_threshold(self, threshold: float) -> float:
+        """Fija el threshold manualmente; devuelve el anterior"""
+        with self._adjust_lock:
+            old_threshold = self.confidence_threshold
+            self.confidence_threshold = threshold
+            self._publish_parameters()
+        return old_threshold
+    
+    def _publish_parameters(self):
+        """Publica un snapshot nuevo de los parámetros de trabajo (con _adjust_lock tomado)"""
+        recent = self.performance_history[-1]["metrics"] if self.performance_history else None
+        self.parameters = LearningParameters(
+            version=self.parameters.version + 1 if self.parameters is not None else 1,
+            confidence_threshold=self.confidence_threshold,
+            market_conditions_weights=MappingProxyType(dict(self.market_conditions_weights)),
+            optimal_conditions=MappingProxyType(dict(self.optimal_conditions)),
+            strict_filters=recent is not None and recent.win_rate < 0.3 and recent.profit_factor < 0.8,
+            published_at=self.clock.now()
+        )
+    
+    # ------------------------------------------------------------------ ajustes en segundo plano
+    
+    def start_adjustment_worker(self):
+        """Mueve los ajustes a un hilo; sin worker se ejecutan en línea (replays, tuner)"""
+        if self._adjust_thread is not None and self._adjust_thread.is_alive():
+            return
+        self._adjust_stop.clear()
+        self._adjust_thread = threading.Thread(target=self._adjustment_loop, name="learning-adjust", daemon=True)
+        self._adjust_thread.start()
+        logger.info("🧵 Worker de ajustes del learning agent iniciado")
+    
+    def stop_adjustment_worker(self, timeout: float = 5.0):
+        """Detiene el worker y ejecuta el ajuste pendiente, si lo hay"""
+        thread, self._adjust_thread = self._adjust_thread, None
+        if thread is None:
+            return
+        pending = self._adjust_event.is_set()
+        self._adjust_stop.set()
+        self._adjust_event.set()
+        thread.join(timeout)
+        if pending:
+            self._run_adjustment()
+    
+    def _adjustment_loop(self):
+        while True:
+            self._adjust_event.wait()
+            if self._adjust_stop.is_set():
+                return
+            # Coalescing: las peticiones que llegan mientras corre un ajuste se
+            # reducen a una sola ejecución posterior con el estado más reciente
+            self._adjust_event.clear()
+            try:
+                self._run_adjustment()
+            except Exception as e:
+                logger.error(f"Error en el ajuste de parámetros: {e}")
+    
+    def _schedule_adjustment(self):
+        with self._state_lock:
+            self.adjustments_requested += 1
+        if self._adjust_thread is None:
+            self._run_adjustment()
+        else:
+            self._adjust_event.set()
+    
+    def _run_adjustment(self):
+        with self._adjust_lock:
+            record = self._update_performance_metrics()
+            self._adjust_parameters()
+            self._publish_parameters()
+            self.adjustments_run += 1
+            if record is not None and self.metrics_sink is not None:
+                # Se persisten los parámetros ya ajustados con estas métricas
+                record["learning_parameters"] = self._learning_parameters()
+                self.metrics_sink(record)
+    
     def record_trade_outcome(self, outcome: TradeOutcome):
         """Registra el resultado de un trade para aprendizaje"""
-        self.trade_outcomes.append(outcome)
+        with self._state_lock:
+            # Primero los buckets: validan las condiciones antes de modificar nada
+            self.condition_buckets.push(outcome.market_conditions or {}, outcome.pnl_percentage)
+            self.trade_outcomes.append(outcome)
+            self.metrics_window.push(outcome.pnl, outcome.pnl_percentage, outcome.hold_time_minutes,
+                                     outcome.decision_confidence)
+            self.outcome_index.append(int(outcome.timestamp.timestamp() * 1_000_000), outcome.symbol,
+                                      outcome.pnl, outcome.pnl_percentage)
+            total = len(self.trade_outcomes)
+        if self.outcome_sink is not None:
+            self.outcome_sink(outcome)
         
         logger.info(f"📝 Trade registrado: {outcome.symbol} PnL: {outcome.pnl:.2f} ({outcome.pnl_percentage:.2f}%)")
         
-        # Actualizar métricas cada 5 trades
-        if len(self.trade_outcomes) % 5 == 0:
-            self._update_performance_metrics()
-            self._adjust_parameters()
+        # Actualizar métricas cada `adjust_every` trades (en el worker si está activo)
+        if total % self.policy.adjust_every == 0:
+            self._schedule_adjustment()
+    
+    def record_trade_outcomes_batch(self, columns: Dict, adjust_every: Optional[int] = None) -> int:
+        """Registra un lote de trades en columnas (ver TradeOutcomeStore.append_columns).
+
+        Métricas y ajuste de parámetros corren una vez por lote, o cada
+        `adjust_every` trades, en lugar de cada policy.adjust_every trades. Los
+        ajustes intermedios corren en línea para ver cada tramo; el último se
+        programa como en record_trade_outcome.
+        """
+        n = len(columns["trade_ids"])
+        step = adjust_every or n
+        for start in range(0, n, step):
+            chunk = {name: values[start:start + step] for name, values in columns.items()}
+            with self._state_lock:
+                self.condition_buckets.push_many(chunk["market_conditions"], chunk["pnl_percentage"])
+                self.trade_outcomes.append_columns(**chunk)
+                self.metrics_window.push_many(chunk["pnl"], chunk["pnl_percentage"],
+                                              chunk["hold_time_minutes"], chunk["decision_confidence"])
+                self.outcome_index.append_many(chunk["ts_us"], chunk["symbols"], chunk["pnl"],
+                                               chunk["pnl_percentage"])
+            if self.outcome_sink is not None:
+                for outcome in self._outcomes_from_columns(chunk):
+                    self.outcome_sink(outcome)
+            if start + step < n:
+                with self._state_lock:
+                    self.adjustments_requested += 1
+                self._run_adjustment()
+            else:
+                self._schedule_adjustment()
+        
+        logger.info(f"📝 {n} trades registrados en lote (total: {len(self.trade_outcomes)})")
+        return n
+    
+    @staticmethod
+    def _outcomes_from_columns(columns: Dict) -> List[TradeOutcome]:
+        sides = ("BUY", "SELL")
+        return [
+            TradeOutcome(
+                trade_id=columns["trade_ids"][j],
+                symbol=columns["symbols"][j],
+                side=sides[columns["sides"][j]],
+                entry_price=float(columns["entry_price"][j]),
+                exit_price=float(columns["exit_price"][j]),
+                quantity=float(columns["quantity"][j]),
+                pnl=float(columns["pnl"][j]),
+                pnl_percentage=float(columns["pnl_percentage"][j]),
+                hold_time_minutes=int(columns["hold_time_minutes"][j]),
+                market_conditions=columns["market_conditions"][j] or {},
+                decision_confidence=float(columns["decision_confidence"][j]),
+                timestamp=datetime.fromtimestamp(columns["ts_us"][j] / 1_000_000)
+            )
+            for j in range(len(columns["trade_ids"]))
+        ]
     
     def _update_performance_metrics(self):
         """Actualiza métricas de performance"""
-        if len(self.trade_outcomes) < self.min_trades_for_learning:
-            return
-        
-        # Usar últimos 50 trades para métricas
-        recent_trades = self.trade_outcomes[-50:]
-        
-        total_trades = len(recent_trades)
-        winning_trades = [t for t in recent_trades if t.pnl > 0]
-        losing_trades = [t for t in recent_trades if t.pnl < 0]
-        
-        win_rate = len(winning_trades) / total_trades if total_trades > 0 else 0
-        avg_pnl = np.mean([t.pnl for t in recent_trades])
-        avg_win = np.mean([t.pnl for t in winning_trades]) if winning_trades else 0
-        avg_loss = np.mean([t.pnl for t in losing_trades]) if losing_trades else 0
-        
-        # Calcular Sharpe ratio
-        returns = [t.pnl_percentage for t in recent_trades]
-        sharpe_ratio = np.mean(returns) / np.std(returns) if np.std(returns) > 0 else 0
-        
-        # Calcular max drawdown
-        cumulative_pnl = np.cumsum([t.pnl for t in recent_trades])
-        running_max = np.maximum.accumulate(cumulative_pnl)
-        drawdown = (cumulative_pnl - running_max)
-        max_drawdown = np.min(drawdown) if len(drawdown) > 0 else 0
-        
-        # Profit factor
-        total_wins = sum(t.pnl for t in winning_trades)
-        total_losses = abs(sum(t.pnl for t in losing_trades))
-        profit_factor = total_wins / total_losses if total_losses > 0 else float('inf')
-        
-        # Mejores y peores trades
-        best_trade = max([t.pnl for t in recent_trades]) if recent_trades else 0
-        worst_trade = min([t.pnl for t in recent_trades]) if recent_trades else 0
-        
-        metrics = LearningMetrics(
-            total_trades=total_trades,
-            win_rate=win_rate,
-            avg_pnl=avg_pnl,
-            avg_win=avg_win,
-            avg_loss=avg_loss,
-            sharpe_ratio=sharpe_ratio,
-            max_drawdown=max_drawdown,
-            profit_factor=profit_factor,
-            best_trade=best_trade,
-            worst_trade=worst_trade
-        )
+        with self._state_lock:
+            total = len(self.trade_outcomes)
+            if total < self.min_trades_for_learning:
+                return
+            # Métricas de la ventana (últimos learning_metrics_window trades), ya agregadas
+            metrics = LearningMetrics(**self.metrics_window.metrics())
+        win_rate, avg_pnl, sharpe_ratio = metrics.win_rate, metrics.avg_pnl, metrics.sharpe_ratio
         
         performance_record = {
-            "timestamp": datetime.now(),
+            "timestamp": self.clock.now(),
             "metrics": metrics,
-            "total_lifetime_trades": len(self.trade_outcomes),
-            "learning_parameters": {
-                "confidence_threshold": self.confidence_threshold,
-                "market_weights": self.market_conditions_weights.copy()
-            }
+            "total_lifetime_trades": total,
+            "learning_parameters": self._learning_parameters()
         }
         
         self.performance_history.append(performance_record)
         
         logger.info(f"📊 Métricas actualizadas: Win Rate: {win_rate:.2%}, Avg PnL: {avg_pnl:.2f}, Sharpe: {sharpe_ratio:.2f}")
         
-        return metrics
+        return performance_record
+    
+    def _learning_parameters(self) -> Dict:
+        return {
+            "confidence_threshold": self.confidence_threshold,
+            "market_weights": self.market_conditions_weights.copy(),
+            "optimal_conditions": dict(self.optimal_conditions)
+        }
     
     def _adjust_parameters(self):
         """Ajusta parámetros basado en performance reciente"""
         if len(self.performance_history) < 2:
             return
         
+        policy = self.policy
         current_metrics = self.performance_history[-1]["metrics"]
         previous_metrics = self.performance_history[-2]["metrics"]
         
         # Ajustar confidence threshold basado en win rate
-        if current_metrics.win_rate > 0.65:
+        if current_metrics.win_rate > policy.high_win_rate:
             # Win rate excelente: ser menos conservador
             old_threshold = self.confidence_threshold
-            self.confidence_threshold = max(0.5, self.confidence_threshold - 0.05)
+            self.confidence_threshold = max(policy.threshold_min, self.confidence_threshold - policy.threshold_step)
             if self.confidence_threshold != old_threshold:
                 logger.info(f"🎯 Confidence threshold reducido: {old_threshold:.3f} → {self.confidence_threshold:.3f}")
                 
-        elif current_metrics.win_rate < 0.45:
+        elif current_metrics.win_rate < policy.low_win_rate:
             # Win rate malo: ser más conservador
             old_threshold = self.confidence_threshold
-            self.confidence_threshold = min(0.8, self.confidence_threshold + 0.05)
+            self.confidence_threshold = min(policy.threshold_max, self.confidence_threshold + policy.threshold_step)
             if self.confidence_threshold != old_threshold:
                 logger.info(f"🛡️ Confidence threshold aumentado: {old_threshold:.3f} → {self.confidence_threshold:.3f}")
         
         # Ajustar basado en profit factor
-        if current_metrics.profit_factor < 1.2:
+        if current_metrics.profit_factor < policy.min_profit_factor:
             # Profit factor bajo: ser más selectivo
-            self.confidence_threshold = min(0.8, self.confidence_threshold + 0.02)
+            self.confidence_threshold = min(policy.threshold_max, self.confidence_threshold + policy.profit_factor_step)
         
         # Analizar condiciones de mercado
         self._analyze_market_conditions_performance()
@@ -181,50 +357,12 @@ class LearningAgent:
         if len(self.trade_outcomes) < 10:
             return
         
-        recent_trades = self.trade_outcomes[-30:]
-        
-        # Agrupar trades por condiciones de mercado
-        volatility_performance = {"HIGH": [], "MEDIUM": [], "LOW": []}
-        trend_performance = {"STRONG_BULLISH": [], "STRONG_BEARISH": [], "WEAK": []}
-        volume_performance = {"HIGH": [], "NORMAL": [], "LOW": []}
-        
-        for trade in recent_trades:
-            conditions = trade.market_conditions
-            
-            # Clasificar volatilidad
-            vol_level = conditions.get("volatility_level", "MEDIUM")
-            if vol_level in volatility_performance:
-                volatility_performance[vol_level].append(trade.pnl_percentage)
-            
-            # Clasificar tendencia
-            trend_level = conditions.get("trend_strength", "WEAK")
-            if trend_level in trend_performance:
-                trend_performance[trend_level].append(trade.pnl_percentage)
-            
-            # Clasificar volumen
-            volume_ratio = conditions.get("volume_ratio", 1.0)
-            if volume_ratio > 1.5:
-                volume_performance["HIGH"].append(trade.pnl_percentage)
-            elif volume_ratio > 0.8:
-                volume_performance["NORMAL"].append(trade.pnl_percentage)
-            else:
-                volume_performance["LOW"].append(trade.pnl_percentage)
-        
-        # Calcular performance promedio por condición
-        vol_scores = {
-            level: np.mean(pnls) if pnls else 0 
-            for level, pnls in volatility_performance.items()
-        }
-        
-        trend_scores = {
-            level: np.mean(pnls) if pnls else 0 
-            for level, pnls in trend_performance.items()
-        }
-        
-        volume_scores = {
-            level: np.mean(pnls) if pnls else 0 
-            for level, pnls in volume_performance.items()
-        }
+        # Performance promedio por condición, desde los agregados de la ventana
+        with self._state_lock:
+            vol_scores, trend_scores, volume_scores = (
+                {level: stats["avg_pnl"] for level, stats in self.condition_buckets.analysis(dimension).items()}
+                for dimension in ("volatility", "trend", "volume")
+            )
         
         # Log mejores condiciones
         best_vol = max(vol_scores, key=vol_scores.get) if vol_scores else "UNKNOWN"
@@ -234,18 +372,21 @@ class LearningAgent:
         logger.info(f"🔍 Análisis condiciones: Vol={best_vol}, Trend={best_trend}, Vol={best_volume}")
         
         # Ajustar pesos basado en performance (simplificado)
+        weights, policy = self.market_conditions_weights, self.policy
         if vol_scores.get("HIGH", 0) > vol_scores.get("LOW", 0):
-            self.market_conditions_weights["volatility"] = min(2.0, self.market_conditions_weights["volatility"] + 0.1)
+            weights["volatility"] = min(policy.weight_max, weights["volatility"] + policy.weight_step)
         
         if trend_scores.get("STRONG_BULLISH", 0) > trend_scores.get("WEAK", 0):
-            self.market_conditions_weights["trend_strength"] = min(2.0, self.market_conditions_weights["trend_strength"] + 0.1)
+            weights["trend_strength"] = min(policy.weight_max, weights["trend_strength"] + policy.weight_step)
     
     def _update_optimal_conditions(self):
         """Actualiza las condiciones óptimas de mercado basado en datos"""
         if len(self.trade_outcomes) < 20:
             return
         
-        profitable_trades = [t for t in self.trade_outcomes[-50:] if t.pnl > 0]
+        with self._state_lock:
+            recent_trades = self.trade_outcomes[-50:]
+        profitable_trades = [t for t in recent_trades if t.pnl > 0]
         
         if not profitable_trades:
             return
@@ -279,75 +420,124 @@ class LearningAgent:
         
         logger.info(f"📈 Condiciones óptimas actualizadas: {self.optimal_conditions}")
     
+    def hydrate(self, trades: List[Dict], parameters: Optional[Dict] = None):
+        """Restaura historial y parámetros aprendidos (p. ej. desde Postgres) sin volver a persistirlos"""
+        with self._state_lock:
+            self.clear_history()
+            outcomes = [TradeOutcome.from_record(t) for t in trades]
+            self.trade_outcomes.extend(outcomes)
+            self.outcome_index.append_many(
+                np.array([int(o.timestamp.timestamp() * 1_000_000) for o in outcomes], dtype=np.int64),
+                [o.symbol for o in outcomes],
+                np.array([o.pnl for o in outcomes]),
+                np.array([o.pnl_percentage for o in outcomes])
+            )
+            for outcome in self.trade_outcomes[-self.metrics_window.window:]:
+                self.metrics_window.push(outcome.pnl, outcome.pnl_percentage, outcome.hold_time_minutes,
+                                         outcome.decision_confidence)
+            for outcome in self.trade_outcomes[-self.condition_buckets.window:]:
+                self.condition_buckets.push(outcome.market_conditions, outcome.pnl_percentage)
+        
+        with self._adjust_lock:
+            if parameters:
+                if parameters.get("confidence_threshold") is not None:
+                    self.confidence_threshold = float(parameters["confidence_threshold"])
+                if parameters.get("market_weights"):
+                    self.market_conditions_weights.update(parameters["market_weights"])
+                optimal = parameters.get("optimal_conditions") or {}
+                if "volatility_range" in optimal:
+                    optimal["volatility_range"] = tuple(optimal["volatility_range"])
+                self.optimal_conditions.update(optimal)
+        
+            self._update_performance_metrics()  # Sin metrics_sink: no se vuelve a persistir
+            self._publish_parameters()
+    
+    def clear_history(self):
+        """Borra el historial de trades, la ventana de métricas y los registros de performance"""
+        with self._state_lock:
+            self.trade_outcomes.clear()
+            self.metrics_window.clear()
+            self.condition_buckets.clear()
+            self.outcome_index.clear()
+            self.performance_history.clear()
+    
     def should_trade(self, market_conditions: Dict, signal_confidence: float) -> Dict:
         """Decide si se debe realizar un trade basado en aprendizaje"""
+        params = self.parameters  # Snapshot publicado: sin lock y consistente durante la decisión
         
         # Verificar confidence threshold
-        if signal_confidence < self.confidence_threshold:
+        if signal_confidence < params.confidence_threshold:
             return {
                 "should_trade": False,
-                "reason": f"Confianza {signal_confidence:.3f} menor que threshold {self.confidence_threshold:.3f}",
+                "reason": f"Confianza {signal_confidence:.3f} menor que threshold {params.confidence_threshold:.3f}",
                 "confidence_score": signal_confidence,
-                "threshold": self.confidence_threshold
+                "threshold": params.confidence_threshold,
+                "parameters_version": params.version
             }
         
         # Evaluar condiciones de mercado
-        market_score = self._evaluate_market_conditions(market_conditions)
+        market_score = self._evaluate_market_conditions(market_conditions, params)
         
         # Aplicar filtros aprendidos
-        filters_passed, filter_reason = self._apply_learned_filters(market_conditions)
+        filters_passed, filter_reason = self._apply_learned_filters(market_conditions, params)
         
         if not filters_passed:
             return {
                 "should_trade": False,
                 "reason": f"Filtros de mercado: {filter_reason}",
                 "market_score": market_score,
-                "confidence_score": signal_confidence
+                "confidence_score": signal_confidence,
+                "parameters_version": params.version
             }
         
         # Combinar confidence con market score
         final_score = (signal_confidence * 0.7) + (market_score * 0.3)
         
-        should_trade = final_score > 0.65  # Threshold más alto para final score
+        should_trade = final_score > self.policy.final_score_threshold  # Threshold más alto para final score
         
         return {
             "should_trade": should_trade,
             "final_score": final_score,
             "signal_confidence": signal_confidence,
             "market_score": market_score,
-            "confidence_threshold": self.confidence_threshold,
+            "confidence_threshold": params.confidence_threshold,
+            "parameters_version": params.version,
             "reason": "Condiciones favorables" if should_trade else "Score final insuficiente"
         }
     
-    def _evaluate_market_conditions(self, conditions: Dict) -> float:
+    def _evaluate_market_conditions(self, conditions: Dict, params: Optional[LearningParameters] = None) -> float:
         """Evalúa qué tan favorables son las condiciones actuales"""
+        params = params or self.parameters
+        weights, optimal = params.market_conditions_weights, params.optimal_conditions
         score = 0.5  # Base score
         
         # Evaluar volatilidad
         vol_value = conditions.get("volatility_value", 2.0)
-        vol_range = self.optimal_conditions["volatility_range"]
+        vol_range = optimal["volatility_range"]
         if vol_range[0] <= vol_value <= vol_range[1]:
-            score += 0.15 * self.market_conditions_weights["volatility"]
+            score += 0.15 * weights["volatility"]
         
         # Evaluar volumen
         volume_ratio = conditions.get("volume_ratio", 1.0)
-        if volume_ratio >= self.optimal_conditions["volume_ratio_min"]:
-            score += 0.1 * self.market_conditions_weights["volume_ratio"]
+        if volume_ratio >= optimal["volume_ratio_min"]:
+            score += 0.1 * weights["volume_ratio"]
         
         # Evaluar tendencia
         trend_strength = conditions.get("trend_strength", "WEAK")
         if trend_strength in ["STRONG_BULLISH", "STRONG_BEARISH"]:
-            score += 0.2 * self.market_conditions_weights["trend_strength"]
+            score += 0.2 * weights["trend_strength"]
         
         # Evaluar RSI si está disponible
         rsi = conditions.get("rsi", 50)
         if 30 <= rsi <= 70:  # RSI en rango normal
-            score += 0.05 * self.market_conditions_weights["rsi_level"]
+            score += 0.05 * weights["rsi_level"]
         
         return min(1.0, score)
     
-    def _apply_learned_filters(self, conditions: Dict) -> Tuple[bool, str]:
+    def _apply_learned_filters(self, conditions: Dict,
+                               params: Optional[LearningParameters] = None) -> Tuple[bool, str]:
         """Aplica filtros aprendidos a las condiciones de mercado"""
+        params = params or self.parameters
         
         # Filtro de volatilidad extrema
         vol_value = conditions.get("volatility_value", 2.0)
@@ -362,18 +552,84 @@ class LearningAgent:
         if volume_ratio < 0.5:  # Volumen muy bajo
             return False, "Volumen insuficiente"
         
-        # Filtro basado en performance reciente
-        if len(self.performance_history) > 0:
-            recent_performance = self.performance_history[-1]["metrics"]
-            
-            # Si performance reciente es muy mala, ser más conservador
-            if recent_performance.win_rate < 0.3 and recent_performance.profit_factor < 0.8:
-                # Aplicar filtros más estrictos
-                if vol_value < 1.0 or volume_ratio < 1.0:
-                    return False, "Performance reciente mala, aplicando filtros estrictos"
+        # Filtro basado en performance reciente: si es muy mala, ser más conservador
+        if params.strict_filters:
+            # Aplicar filtros más estrictos
+            if vol_value < 1.0 or volume_ratio < 1.0:
+                return False, "Performance reciente mala, aplicando filtros estrictos"
         
         return True, "Filtros pasados"
     
+    def should_trade_batch(self, signal_confidence: np.ndarray, volatility_value: Optional[np.ndarray] = None,
+                           volume_ratio: Optional[np.ndarray] = None, trend_strength: Optional[List] = None,
+                           rsi: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Versión vectorizada de should_trade para muchos candidatos a la vez.
+
+        Cada condición es una columna alineada con `signal_confidence`; los NaN
+        (o None en trend_strength) toman los mismos valores por defecto que
+        should_trade. Devuelve columnas `should_trade`, `final_score`,
+        `market_score` y `reason` (índice en BATCH_REASONS), con la misma
+        precedencia de rechazos que la versión escalar.
+        """
+        params = self.parameters
+        confidence = np.asarray(signal_confidence, dtype=float)
+        n = len(confidence)
+
+        def column(values, default: float) -> np.ndarray:
+            if values is None:
+                return np.full(n, default)
+            values = np.asarray(values, dtype=float)
+            return np.where(np.isnan(values), default, values)
+
+        vol_value = column(volatility_value, 2.0)
+        volume = column(volume_ratio, 1.0)
+        rsi_value = column(rsi, 50)
+        strong_trend = (np.isin(np.asarray(trend_strength, dtype=object), ["STRONG_BULLISH", "STRONG_BEARISH"])
+                        if trend_strength is not None else np.zeros(n, dtype=bool))
+
+        # Score de mercado (_evaluate_market_conditions)
+        weights, optimal = params.market_conditions_weights, params.optimal_conditions
+        vol_low, vol_high = optimal["volatility_range"]
+        market_score = (
+            0.5
+            + 0.15 * weights["volatility"] * ((vol_value >= vol_low) & (vol_value <= vol_high))
+            + 0.1 * weights["volume_ratio"] * (volume >= optimal["volume_ratio_min"])
+            + 0.2 * weights["trend_strength"] * strong_trend
+            + 0.05 * weights["rsi_level"] * ((rsi_value >= 30) & (rsi_value <= 70))
+        )
+        market_score = np.minimum(1.0, market_score)
+        final_score = confidence * 0.7 + market_score * 0.3
+
+        # Rechazos en orden de precedencia; el último aplicado es el primero que gana
+        reason = np.where(final_score > self.policy.final_score_threshold, 0, 1).astype(np.int8)
+        if params.strict_filters:
+            reason[(vol_value < 1.0) | (volume < 1.0)] = 6
+        reason[volume < 0.5] = 5
+        reason[vol_value < 0.5] = 4
+        reason[vol_value > 5.0] = 3
+        reason[confidence < params.confidence_threshold] = 2
+
+        return {
+            "should_trade": reason == 0,
+            "final_score": final_score,
+            "market_score": market_score,
+            "reason": reason,
+            "parameters": params,
+        }
+    
+    def performance_in_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             symbol: Optional[str] = None) -> Dict:
+        """Métricas de los trades en [start, end] (opcionalmente de un símbolo) en O(log n)"""
+        def to_us(moment: Optional[datetime]) -> Optional[int]:
+            return int(moment.timestamp() * 1_000_000) if moment is not None else None
+        
+        with self._state_lock:
+            metrics = self.outcome_index.metrics(to_us(start), to_us(end), symbol)
+        for key in ("first_ts_us", "last_ts_us"):
+            if key in metrics:
+                metrics[key.replace("_ts_us", "_trade_at")] = datetime.fromtimestamp(metrics.pop(key) / 1_000_000)
+        return metrics
+    
     def get_performance_summary(self) -> Dict:
         """Obtiene resumen de performance y aprendizaje"""
         if not self.performance_history:
@@ -384,6 +640,7 @@ class LearningAgent:
             }
         
         latest_metrics = self.performance_history[-1]["metrics"]
+        params = self.parameters
         
         # Calcular tendencia de performance
         performance_trend = "estable"
@@ -407,12 +664,14 @@ class LearningAgent:
                 "max_drawdown": round(latest_metrics.max_drawdown, 2),
                 "profit_factor": round(latest_metrics.profit_factor, 2),
                 "best_trade": round(latest_metrics.best_trade, 2),
-                "worst_trade": round(latest_metrics.worst_trade, 2)
+                "worst_trade": round(latest_metrics.worst_trade, 2),
+                **{k: round(v, 2) for k, v in self.metrics_window.averages().items()}
             },
             "learning_parameters": {
-                "confidence_threshold": round(self.confidence_threshold, 3),
-                "market_conditions_weights": {k: round(v, 2) for k, v in self.market_conditions_weights.items()},
-                "optimal_conditions": self.optimal_conditions
+                "version": params.version,
+                "confidence_threshold": round(params.confidence_threshold, 3),
+                "market_conditions_weights": {k: round(v, 2) for k, v in params.market_conditions_weights.items()},
+                "optimal_conditions": dict(params.optimal_conditions)
             },
             "learning_status": {
                 "total_lifetime_trades": len(self.trade_outcomes),
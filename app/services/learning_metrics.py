@@ -0,0 +1,314 @@
+"""
+Métricas de performance del learning agent sobre una ventana deslizante
+"""
+from typing import Deque, Dict, Optional, Sequence, Tuple
+from collections import deque
+from dataclasses import dataclass, field
+import math
+
+import numpy as np
+
+RESYNC_EVERY = 4096  # Pushes entre recálculos exactos de las sumas (acota el error de redondeo)
+
+# Buckets del análisis por condiciones de mercado, en el orden de las respuestas
+CONDITION_BUCKETS = {
+    "volatility": ("HIGH", "MEDIUM", "LOW"),
+    "trend": ("STRONG_BULLISH", "STRONG_BEARISH", "WEAK"),
+    "volume": ("HIGH", "NORMAL", "LOW"),
+}
+
+
+class RollingMetrics:
+    """Ventana de los últimos `window` trades en ring buffers numpy.
+
+    - pnl, pnl_percentage, hold time y confianza se guardan en buffers de
+      capacidad fija; el trade que sale de la ventana se resta de los agregados.
+    - Media y varianza de pnl_percentage se mantienen con Welford deslizante;
+      sumas de ganancias/pérdidas y contadores, con sumas deslizantes; mejor y
+      peor trade, con deques monotónicos. Cada push es O(1).
+    - El drawdown se calcula sobre el buffer (vectorizado, O(window)) solo al
+      leer las métricas.
+    """
+
+    def __init__(self, window: int = 50):
+        self.window = window
+        self.pnl = np.zeros(window)
+        self.pnl_pct = np.zeros(window)
+        self.hold_minutes = np.zeros(window)
+        self.confidence = np.zeros(window)
+        self.clear()
+
+    def clear(self):
+        self.count = 0  # Trades vistos (vida completa)
+        self._head = 0  # Próxima posición a escribir
+        self._mean_pct = 0.0
+        self._m2_pct = 0.0
+        self._sum_pnl = 0.0
+        self._sum_hold = 0.0
+        self._sum_confidence = 0.0
+        self._wins = 0
+        self._losses = 0
+        self._sum_wins = 0.0
+        self._sum_losses = 0.0
+        self._max: Deque[Tuple[int, float]] = deque()  # (seq, pnl) decreciente
+        self._min: Deque[Tuple[int, float]] = deque()  # (seq, pnl) creciente
+
+    @property
+    def size(self) -> int:
+        return min(self.count, self.window)
+
+    def push(self, pnl: float, pnl_pct: float, hold_minutes: float, confidence: float):
+        i = self._head
+        n_before = self.size
+        if n_before == self.window:
+            old_pnl, old_pct = self.pnl[i], self.pnl_pct[i]
+            self._remove_pnl(old_pnl)
+            self._sum_hold -= self.hold_minutes[i]
+            self._sum_confidence -= self.confidence[i]
+            # Welford deslizante: reemplazar old_pct por pnl_pct con n constante
+            old_mean = self._mean_pct
+            self._mean_pct += (pnl_pct - old_pct) / n_before
+            self._m2_pct += (pnl_pct - old_pct) * (pnl_pct - self._mean_pct + old_pct - old_mean)
+        else:
+            delta = pnl_pct - self._mean_pct
+            self._mean_pct += delta / (n_before + 1)
+            self._m2_pct += delta * (pnl_pct - self._mean_pct)
+
+        self.pnl[i] = pnl
+        self.pnl_pct[i] = pnl_pct
+        self.hold_minutes[i] = hold_minutes
+        self.confidence[i] = confidence
+        self._sum_pnl += pnl
+        self._sum_hold += hold_minutes
+        self._sum_confidence += confidence
+        if pnl > 0:
+            self._wins += 1
+            self._sum_wins += pnl
+        elif pnl < 0:
+            self._losses += 1
+            self._sum_losses += -pnl
+
+        seq = self.count
+        while self._max and self._max[-1][1] <= pnl:
+            self._max.pop()
+        self._max.append((seq, pnl))
+        while self._min and self._min[-1][1] >= pnl:
+            self._min.pop()
+        self._min.append((seq, pnl))
+        oldest = seq - self.window + 1
+        if self._max[0][0] < oldest:
+            self._max.popleft()
+        if self._min[0][0] < oldest:
+            self._min.popleft()
+
+        self._head = (i + 1) % self.window
+        self.count += 1
+        if self.count % RESYNC_EVERY == 0:
+            self._resync()
+
+    def push_many(self, pnl: np.ndarray, pnl_pct: np.ndarray, hold_minutes: np.ndarray,
+                  confidence: np.ndarray):
+        """Agrega un lote; solo los últimos `window` trades afectan a la ventana"""
+        n = len(pnl)
+        if n < self.window:
+            for values in zip(pnl.tolist(), pnl_pct.tolist(), hold_minutes.tolist(), confidence.tolist()):
+                self.push(*values)
+            return
+        # El lote reemplaza la ventana completa: se reconstruye con sus últimos trades
+        skipped = self.count + n - self.window
+        self.clear()
+        tail = slice(n - self.window, n)
+        for values in zip(pnl[tail].tolist(), pnl_pct[tail].tolist(), hold_minutes[tail].tolist(),
+                          confidence[tail].tolist()):
+            self.push(*values)
+        self.count += skipped
+        self._max = deque((seq + skipped, value) for seq, value in self._max)
+        self._min = deque((seq + skipped, value) for seq, value in self._min)
+
+    def _remove_pnl(self, pnl: float):
+        self._sum_pnl -= pnl
+        if pnl > 0:
+            self._wins -= 1
+            self._sum_wins -= pnl
+        elif pnl < 0:
+            self._losses -= 1
+            self._sum_losses -= -pnl
+
+    def _resync(self):
+        """Recalcula las sumas desde los buffers (la ventana está llena)"""
+        self._sum_pnl = float(self.pnl.sum())
+        self._sum_hold = float(self.hold_minutes.sum())
+        self._sum_confidence = float(self.confidence.sum())
+        self._sum_wins = float(self.pnl[self.pnl > 0].sum())
+        self._sum_losses = float(-self.pnl[self.pnl < 0].sum())
+        self._mean_pct = float(self.pnl_pct.mean())
+        self._m2_pct = float(((self.pnl_pct - self._mean_pct) ** 2).sum())
+
+    def _ordered(self, buffer: np.ndarray) -> np.ndarray:
+        """Contenido de la ventana en orden cronológico"""
+        if self.count < self.window:
+            return buffer[:self.count]
+        return np.concatenate((buffer[self._head:], buffer[:self._head]))
+
+    def metrics(self) -> Dict:
+        """Métricas de la ventana con los mismos nombres que LearningMetrics"""
+        n = self.size
+        if not n:
+            return {}
+        std = math.sqrt(max(self._m2_pct, 0.0) / n)
+        cumulative = np.cumsum(self._ordered(self.pnl))
+        drawdown = cumulative - np.maximum.accumulate(cumulative)
+        return {
+            "total_trades": n,
+            "win_rate": self._wins / n,
+            "avg_pnl": self._sum_pnl / n,
+            "avg_win": self._sum_wins / self._wins if self._wins else 0,
+            "avg_loss": -self._sum_losses / self._losses if self._losses else 0,
+            "sharpe_ratio": self._mean_pct / std if std > 0 else 0,
+            "max_drawdown": float(drawdown.min()),
+            "profit_factor": self._sum_wins / self._sum_losses if self._sum_losses > 0 else float('inf'),
+            "best_trade": self._max[0][1],
+            "worst_trade": self._min[0][1],
+        }
+
+    def averages(self) -> Dict:
+        n = self.size
+        return {
+            "avg_hold_minutes": self._sum_hold / n if n else 0,
+            "avg_decision_confidence": self._sum_confidence / n if n else 0,
+        }
+
+
+def classify_conditions(conditions: Dict) -> Tuple[Optional[str], Optional[str], str]:
+    """Bucket de volatilidad, tendencia y volumen de un trade (None si el nivel es desconocido).
+
+    Lanza ValueError si volume_ratio no es numérico.
+    """
+    vol_level = conditions.get("volatility_level", "MEDIUM")
+    trend_level = conditions.get("trend_strength", "WEAK")
+    try:
+        volume_ratio = float(conditions.get("volume_ratio", 1.0))
+    except (TypeError, ValueError):
+        raise ValueError(f"volume_ratio debe ser numérico: {conditions.get('volume_ratio')!r}") from None
+    if volume_ratio > 1.5:
+        volume_level = "HIGH"
+    elif volume_ratio > 0.8:
+        volume_level = "NORMAL"
+    else:
+        volume_level = "LOW"
+    return (
+        vol_level if vol_level in CONDITION_BUCKETS["volatility"] else None,
+        trend_level if trend_level in CONDITION_BUCKETS["trend"] else None,
+        volume_level,
+    )
+
+
+@dataclass(slots=True)
+class BucketStats:
+    count: int = 0
+    total: float = 0.0
+    wins: int = 0
+    maxima: Deque[Tuple[int, float]] = field(default_factory=deque)  # (seq, pnl%) decreciente
+    minima: Deque[Tuple[int, float]] = field(default_factory=deque)  # (seq, pnl%) creciente
+
+
+class ConditionBuckets:
+    """Agregados por bucket de condiciones de mercado sobre los últimos `window` trades.
+
+    Cada trade suma su pnl_percentage a sus buckets de volatilidad, tendencia y
+    volumen (conteo, suma, ganadores y mejor/peor con deques monotónicos); el
+    trade que sale de la ventana se resta. Registrar es O(1) amortizado y leer
+    el análisis es O(número de buckets), sin recorrer el historial.
+    """
+
+    def __init__(self, window: int = 30):
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self._trades: Deque[Tuple[int, Tuple, float]] = deque()  # (seq, buckets, pnl%)
+        self._stats: Dict[Tuple[str, str], BucketStats] = {
+            (dimension, level): BucketStats()
+            for dimension, levels in CONDITION_BUCKETS.items() for level in levels
+        }
+
+    @property
+    def size(self) -> int:
+        return len(self._trades)
+
+    @staticmethod
+    def _buckets(conditions: Dict) -> Tuple[Tuple[str, str], ...]:
+        return tuple(
+            (dimension, level) for dimension, level in zip(CONDITION_BUCKETS, classify_conditions(conditions))
+            if level is not None
+        )
+
+    def push(self, conditions: Dict, pnl_pct: float):
+        # Clasificar antes de tocar la ventana: unas condiciones inválidas no la modifican
+        self._push(self._buckets(conditions), pnl_pct)
+
+    def _push(self, buckets: Tuple[Tuple[str, str], ...], pnl_pct: float):
+        if len(self._trades) == self.window:
+            self._evict()
+        seq = self.count
+        for key in buckets:
+            stats = self._stats[key]
+            stats.count += 1
+            stats.total += pnl_pct
+            stats.wins += pnl_pct > 0
+            while stats.maxima and stats.maxima[-1][1] <= pnl_pct:
+                stats.maxima.pop()
+            stats.maxima.append((seq, pnl_pct))
+            while stats.minima and stats.minima[-1][1] >= pnl_pct:
+                stats.minima.pop()
+            stats.minima.append((seq, pnl_pct))
+        self._trades.append((seq, buckets, pnl_pct))
+        self.count += 1
+        if self.count % RESYNC_EVERY == 0:
+            self._resync()
+
+    def push_many(self, conditions: Sequence[Optional[Dict]], pnl_pct: Sequence[float]):
+        """Agrega un lote; solo sus últimos `window` trades pueden quedar en la ventana"""
+        tail = max(0, len(pnl_pct) - self.window)
+        buckets = [self._buckets(trade_conditions or {}) for trade_conditions in conditions[tail:]]
+        self.count += tail
+        for trade_buckets, value in zip(buckets, pnl_pct[tail:]):
+            self._push(trade_buckets, float(value))
+
+    def _evict(self):
+        seq, buckets, pnl_pct = self._trades.popleft()
+        for key in buckets:
+            stats = self._stats[key]
+            stats.count -= 1
+            stats.total -= pnl_pct
+            stats.wins -= pnl_pct > 0
+            if stats.maxima[0][0] == seq:
+                stats.maxima.popleft()
+            if stats.minima[0][0] == seq:
+                stats.minima.popleft()
+
+    def _resync(self):
+        """Recalcula las sumas desde la ventana (acota el error de redondeo)"""
+        for stats in self._stats.values():
+            stats.total = 0.0
+        for _, buckets, pnl_pct in self._trades:
+            for key in buckets:
+                self._stats[key].total += pnl_pct
+
+    def analysis(self, dimension: str) -> Dict[str, Dict]:
+        """Estadísticas por nivel de una dimensión (volatility, trend o volume)"""
+        result = {}
+        for level in CONDITION_BUCKETS[dimension]:
+            stats = self._stats[(dimension, level)]
+            if stats.count:
+                result[level] = {
+                    "avg_pnl": stats.total / stats.count,
+                    "win_rate": stats.wins / stats.count,
+                    "trade_count": stats.count,
+                    "best_trade": stats.maxima[0][1],
+                    "worst_trade": stats.minima[0][1],
+                }
+            else:
+                result[level] = {"avg_pnl": 0, "win_rate": 0, "trade_count": 0, "best_trade": 0, "worst_trade": 0}
+        return result
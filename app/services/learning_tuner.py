@@ -0,0 +1,106 @@
+"""
+Tuner offline del learning agent: replay de outcomes con muchas políticas en paralelo
+"""
+from typing import Dict, List, Optional, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from app.core.clock import SimulatedClock
+from app.services.learning_agent import LearningAgent, LearningPolicy
+from app.services.trade_outcomes import TradeOutcome, TradeOutcomeStore
+
+logger = logging.getLogger(__name__)
+
+POLICY_FIELDS = {f.name: f.type for f in fields(LearningPolicy)}
+
+# Outcomes del proceso worker: se reciben una sola vez en el initializer
+_stream: List[TradeOutcome] = []
+
+
+def _policy_value(name: str, value) -> float:
+    """Valor de un campo de LearningPolicy; los campos enteros no aceptan decimales"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{name}: valor inválido {value!r}")
+    if POLICY_FIELDS[name] is int:
+        if not float(value).is_integer():
+            raise ValueError(f"{name} debe ser entero: {value}")
+        return int(value)
+    return float(value)
+
+
+def build_grid(grid: Dict[str, Sequence]) -> List[LearningPolicy]:
+    """Producto cartesiano de valores por campo de LearningPolicy"""
+    unknown = set(grid) - set(POLICY_FIELDS)
+    if unknown:
+        raise ValueError(f"Parámetros de política desconocidos: {sorted(unknown)}")
+    names = list(grid)
+    policies = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = {name: _policy_value(name, value) for name, value in zip(names, values)}
+        if params.get("adjust_every", 1) < 1:
+            raise ValueError("adjust_every debe ser al menos 1")
+        policies.append(LearningPolicy(**params))
+    return policies
+
+
+def replay(policy: LearningPolicy, stream: Sequence[TradeOutcome]) -> Dict:
+    """Reproduce el stream con un agente nuevo que usa `policy`.
+
+    El agente decide con should_trade cada outcome en orden y solo aprende de los
+    trades que tomaría. Es un replay contrafactual limitado: la política solo
+    puede filtrar trades del stream, no generar otros.
+    """
+    start = stream[0].timestamp if stream else None
+    agent = LearningAgent(clock=SimulatedClock(start), policy=policy, outcome_store=TradeOutcomeStore())
+    taken = []
+    for outcome in stream:
+        agent.clock.advance_to(outcome.timestamp)
+        if agent.should_trade(outcome.market_conditions, outcome.decision_confidence)["should_trade"]:
+            agent.record_trade_outcome(outcome)
+            taken.append(outcome.pnl)
+
+    pnl = np.asarray(taken, dtype=float)
+    cumulative = np.cumsum(pnl)
+    gains, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+    return {
+        "policy": asdict(policy),
+        "trades_taken": len(pnl),
+        "total_pnl": float(pnl.sum()),
+        "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+        "profit_factor": float(gains / losses) if losses > 0 else None,
+        "max_drawdown": float((cumulative - np.maximum.accumulate(cumulative)).min()) if len(pnl) else 0.0,
+        "final_confidence_threshold": agent.confidence_threshold,
+        "final_market_weights": dict(agent.market_conditions_weights),
+    }
+
+
+def _init_worker(stream: List[TradeOutcome]):
+    global _stream
+    _stream = stream
+    # Un replay registra miles de trades: sin logs por trade
+    logging.getLogger("app.services.learning_agent").setLevel(logging.WARNING)
+
+
+def _replay_worker(policy: LearningPolicy) -> Dict:
+    return replay(policy, _stream)
+
+
+def run_tuning(stream: List[TradeOutcome], policies: List[LearningPolicy],
+               workers: Optional[int] = None) -> List[Dict]:
+    """Reproduce el stream con cada política en un pool de procesos; ordena por PnL total"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(policies)))
+    logger.info(f"🧪 Tuning: {len(policies)} políticas sobre {len(stream)} trades con {workers} procesos")
+    # spawn: no heredar hilos (Redis, persistencia) del proceso del servidor
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(stream,)) as pool:
+        chunksize = max(1, len(policies) // (workers * 4))
+        results = list(pool.map(_replay_worker, policies, chunksize=chunksize))
+    results.sort(key=lambda result: result["total_pnl"], reverse=True)
+    return results
@@ -1,16 +1,164 @@
 import json
+import logging
+import queue
+import threading
 import time
-from datetime import datetime
-from typing import Any, Optional, Dict
+from datetime import datetime, timezone
+from typing import Any, Optional, Dict, List
 from sqlalchemy.orm import Session
 
+from app.core.clock import Clock, clock as default_clock
+from app.core.config import settings
 from app.models.binance_logs import BinanceRequestLog, TradingOperation
-from app.core.database import get_db
+from app.core.database import get_db, engine
+
+logger = logging.getLogger(__name__)
+
+SINK_POLICIES = ("drop", "block")
+
+_STOP = object()
+
+
+class BinanceLogSink:
+    """Escribe los logs de Binance desde un hilo propio (write-behind).
+
+    - Registrar un log solo encola un dict (microsegundos); el request nunca
+      espera a SQLite (ni commit ni fsync ni el SELECT del refresh).
+    - El hilo escritor agrupa filas por tabla y las inserta con un executemany
+      por tabla en una sola transacción cuando el lote llega a `batch_size` o
+      pasan `flush_interval` segundos.
+    - Con la cola llena, "drop" descarta la fila y "block" espera hasta
+      `block_timeout` antes de descartarla; los descartes se cuentan.
+    - `stop()` vacía la cola antes de terminar.
+    """
+
+    def __init__(self, bind=None, batch_size: int = 500, flush_interval: float = 0.5,
+                 max_queue: int = 50_000, policy: str = "drop", block_timeout: float = 0.05):
+        if policy not in SINK_POLICIES:
+            raise ValueError(f"Política de log sink inválida: {policy}")
+        self.bind = bind if bind is not None else engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def enqueue(self, table, row: Dict[str, Any]):
+        try:
+            if self.policy == "block":
+                self._queue.put((table, row), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((table, row))
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logger.warning(f"⚠️ Cola de logs llena: {self.rows_dropped} logs descartados")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="binance-log-sink", daemon=True)
+        self._thread.start()
+        logger.info("📝 Log sink de Binance iniciado")
+
+    def stop(self, timeout: float = 10.0):
+        """Escribe los logs pendientes y detiene el hilo escritor"""
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        logger.info(f"📝 Log sink de Binance detenido ({self.rows_written} logs escritos)")
+
+    def _run(self):
+        pending: Dict[Any, List[Dict]] = {}
+        count = 0
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            # Drenar lo que ya está en la cola sin esperar
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                table, row = item
+                pending.setdefault(table, []).append(row)
+                count += 1
+                if count >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if count and (count >= self.batch_size or stopping or time.monotonic() >= deadline):
+                self._flush(pending)
+                count = 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, pending: Dict[Any, List[Dict]]):
+        """Inserta las filas pendientes en una transacción; si falla se descartan (son logs)"""
+        rows = sum(len(batch) for batch in pending.values())
+        try:
+            with self.bind.begin() as conn:
+                for table, batch in pending.items():
+                    if batch:
+                        conn.execute(table.__table__.insert(), batch)
+            self.rows_written += rows
+        except Exception as e:
+            self.rows_failed += rows
+            logger.error(f"Error escribiendo {rows} logs de Binance: {e}")
+        for batch in pending.values():
+            batch.clear()
 
 
 class BinanceLogger:
     """Servicio para registrar todas las operaciones de Binance"""
 
+    # Con un reloj simulado los logs llevan el tiempo simulado en vez del de la BD
+    clock: Clock = default_clock
+    # Con el sink activo los logs se encolan y se escriben en bloque desde otro hilo
+    sink: Optional[BinanceLogSink] = None
+
+    @classmethod
+    def _timestamp(cls) -> Dict[str, datetime]:
+        # Hora fijada al registrar: con el sink se escribe más tarde, y en SQLite
+        # CURRENT_TIMESTAMP no guarda microsegundos, lo que rompería la igualdad del
+        # cursor (timestamp, id) de /logs. Siempre naive en UTC, como el
+        # datetime.utcnow() con el que filtra /logs (las fechas naive del reloj
+        # simulado ya son UTC)
+        moment = cls.clock.now() if cls.clock.simulated else datetime.now(timezone.utc)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return {"timestamp": moment}
+
+    @classmethod
+    def _write(cls, db: Session, model, values: Dict[str, Any]):
+        """Encola en el sink o, sin sink, inserta en la sesión y devuelve la fila"""
+        sink = cls.sink
+        if sink is not None and sink.running:
+            sink.enqueue(model, values)
+            return None
+        entry = model(**values)
+        db.add(entry)
+        db.commit()
+        db.refresh(entry)
+        return entry
+
     @staticmethod
     def log_binance_request(
         db: Session,
@@ -24,10 +172,10 @@ class BinanceLogger:
         error_message: Optional[str] = None,
         symbol: Optional[str] = None,
         operation_type: Optional[str] = None
-    ) -> BinanceRequestLog:
-        """Registrar una solicitud a Binance"""
+    ) -> Optional[BinanceRequestLog]:
+        """Registrar una solicitud a Binance (None si se encoló en el sink)"""
         
-        log_entry = BinanceRequestLog(
+        return BinanceLogger._write(db, BinanceRequestLog, dict(
             endpoint=endpoint,
             method=method,
             request_params=json.dumps(request_params) if request_params else None,
@@ -37,13 +185,9 @@ class BinanceLogger:
             success=success,
             error_message=error_message,
             symbol=symbol,
-            operation_type=operation_type
-        )
-        
-        db.add(log_entry)
-        db.commit()
-        db.refresh(log_entry)
-        return log_entry
+            operation_type=operation_type,
+            **BinanceLogger._timestamp()
+        ))
 
     @staticmethod
     def log_trading_operation(
@@ -58,10 +202,10 @@ class BinanceLogger:
         model_accuracy: Optional[float] = None,
         prediction_signal: Optional[str] = None,
         prediction_probability: Optional[float] = None
-    ) -> TradingOperation:
-        """Registrar una operación de trading"""
+    ) -> Optional[TradingOperation]:
+        """Registrar una operación de trading (None si se encoló en el sink)"""
         
-        operation_log = TradingOperation(
+        return BinanceLogger._write(db, TradingOperation, dict(
             operation_type=operation_type,
             symbol=symbol,
             parameters=json.dumps(parameters) if parameters else None,
@@ -71,31 +215,38 @@ class BinanceLogger:
             error_message=error_message,
             model_accuracy=model_accuracy,
             prediction_signal=prediction_signal,
-            prediction_probability=prediction_probability
-        )
-        
-        db.add(operation_log)
-        db.commit()
-        db.refresh(operation_log)
-        return operation_log
+            prediction_probability=prediction_probability,
+            **BinanceLogger._timestamp()
+        ))
 
 
 class TimingContext:
     """Context manager para medir tiempo de ejecución"""
     
-    def __init__(self):
+    def __init__(self, clock: Optional[Clock] = None):
+        self.clock = clock or BinanceLogger.clock
         self.start_time = None
         self.end_time = None
     
     def __enter__(self):
-        self.start_time = time.time()
+        self.start_time = self.clock.monotonic()
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.end_time = time.time()
+        self.end_time = self.clock.monotonic()
     
     @property
     def execution_time_ms(self) -> float:
-        if self.start_time and self.end_time:
+        if self.start_time is not None and self.end_time is not None:
             return (self.end_time - self.start_time) * 1000
         return 0.0
+
+
+# Sink global de logs; main lo arranca y lo asigna a BinanceLogger.sink
+log_sink = BinanceLogSink(
+    batch_size=settings.log_sink_batch_size,
+    flush_interval=settings.log_sink_flush_interval,
+    max_queue=settings.log_sink_max_queue,
+    policy=settings.log_sink_policy,
+    block_timeout=settings.log_sink_block_timeout
+)
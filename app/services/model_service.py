@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import os
 import pickle
 from dataclasses import dataclass
 from pathlib import Path
@@ -11,24 +12,63 @@ import pandas as pd
 
 
 FEATURE_COLS = ["bias", "return", "sma_fast", "sma_slow", "rsi", "volatility"]
+DEFAULT_MODEL_NAME = "model"
+VOTE_METHODS = ("mean", "majority", "weighted")
 
 
 @dataclass
 class ModelState:
     weights: np.ndarray
     feature_names: list[str]
+    train_accuracy: float = 0.0
+    l2: float = 0.0
+    window: int | None = None
+
+
+def model_version(models_dir: Path, name: str = DEFAULT_MODEL_NAME) -> int | None:
+    """Versión del modelo guardado sin cargar el pickle (None si no existe)."""
+    try:
+        return os.stat(Path(models_dir) / f"{name}.pkl").st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    z = np.clip(z, -30, 30)
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def _prepare_xy(feat_df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    X = feat_df[FEATURE_COLS].to_numpy(dtype=float)
+    y = feat_df["target"].to_numpy(dtype=float)
+    return X, y
+
+
+def _backtest_probs(feat_df: pd.DataFrame, probs: np.ndarray, y: np.ndarray, fee: float) -> dict[str, Any]:
+    signals = (probs >= 0.5).astype(int)  # 1 buy, 0 sell
+
+    # Retorno de la siguiente vela según posición
+    rets = feat_df["return"].shift(-1).fillna(0.0).to_numpy()
+    pnl = ((signals * rets) - fee * np.abs(np.diff(np.r_[signals[0], signals]))).cumsum()
+    accuracy = float((signals == y).mean())
+    return {
+        "final_pnl": float(pnl[-1]),
+        "accuracy": round(accuracy, 4),
+        "samples": int(len(feat_df)),
+    }
 
 
 class LocalClassifier:
     """Clasificador logístico muy simple entrenado localmente con numpy.
 
-    - Guarda/lee el estado del modelo como pickle en `models_dir/model.pkl`.
-    - Entrena con descenso de gradiente.
+    - Guarda/lee el estado del modelo como pickle en `models_dir/<name>.pkl`.
+    - Entrena con descenso de gradiente (con regularización L2 opcional).
     """
 
-    def __init__(self, models_dir: Path) -> None:
+    def __init__(self, models_dir: Path, name: str = DEFAULT_MODEL_NAME) -> None:
         self.models_dir = Path(models_dir)
-        self.model_path = self.models_dir / "model.pkl"
+        self.name = name
+        self.model_path = self.models_dir / f"{name}.pkl"
         self.state: ModelState | None = None
         if self.model_path.exists():
             self._load()
@@ -37,6 +77,11 @@ class LocalClassifier:
     def available(self) -> bool:
         return self.state is not None
 
+    @property
+    def version(self) -> int | None:
+        """Versión del modelo en disco (mtime en ns); cambia en cada reentrenamiento."""
+        return model_version(self.models_dir, self.name)
+
     def _save(self) -> None:
         assert self.state is not None
         with open(self.model_path, "wb") as f:
@@ -48,31 +93,43 @@ class LocalClassifier:
 
     @staticmethod
     def _sigmoid(z: np.ndarray) -> np.ndarray:
-        z = np.clip(z, -30, 30)
-        return 1.0 / (1.0 + np.exp(-z))
+        return _sigmoid(z)
 
     def _prepare_xy(self, feat_df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
-        X = feat_df[FEATURE_COLS].to_numpy(dtype=float)
-        y = feat_df["target"].to_numpy(dtype=float)
-        return X, y
-
-    def train(self, feat_df: pd.DataFrame, epochs: int = 400, lr: float = 0.05) -> dict[str, Any]:
+        return _prepare_xy(feat_df)
+
+    def train(
+        self,
+        feat_df: pd.DataFrame,
+        epochs: int = 400,
+        lr: float = 0.05,
+        l2: float = 0.0,
+        window: int | None = None,
+    ) -> dict[str, Any]:
+        if window:
+            feat_df = feat_df.tail(window)
         X, y = self._prepare_xy(feat_df)
         n_features = X.shape[1]
         w = np.zeros(n_features)
 
+        # No se regulariza el bias
+        reg_mask = np.ones(n_features)
+        reg_mask[FEATURE_COLS.index("bias")] = 0.0
+
         for _ in range(epochs):
             logits = X @ w
             probs = self._sigmoid(logits)
-            grad = X.T @ (probs - y) / X.shape[0]
+            grad = X.T @ (probs - y) / X.shape[0] + l2 * reg_mask * w
             w -= lr * grad
 
-        self.state = ModelState(weights=w, feature_names=FEATURE_COLS)
-        self._save()
-
         # Métrica simple en train (accuracy)
         preds = (self._sigmoid(X @ w) >= 0.5).astype(int)
         acc = float((preds == y).mean())
+
+        self.state = ModelState(
+            weights=w, feature_names=FEATURE_COLS, train_accuracy=acc, l2=l2, window=window
+        )
+        self._save()
         return {"train_accuracy": round(acc, 4)}
 
     def predict_latest(self, feat_df: pd.DataFrame) -> dict[str, Any]:
@@ -89,17 +146,96 @@ class LocalClassifier:
             raise RuntimeError("Modelo no disponible")
         X, y = self._prepare_xy(feat_df)
         probs = self._sigmoid(X @ self.state.weights)  # type: ignore[attr-defined]
-        signals = (probs >= 0.5).astype(int)  # 1 buy, 0 sell
+        return _backtest_probs(feat_df, probs, y, fee)
 
-        # Retorno de la siguiente vela según posición
-        rets = feat_df["return"].shift(-1).fillna(0.0).to_numpy()
-        pnl = ((signals * rets) - fee * np.abs(np.diff(np.r_[signals[0], signals]))).cumsum()
-        accuracy = float((signals == y).mean())
-        return {
-            "final_pnl": float(pnl[-1]),
-            "accuracy": round(accuracy, 4),
-            "samples": int(len(feat_df)),
-        }
 
+class EnsembleClassifier:
+    """Ensemble de K clasificadores logísticos compatibles.
 
+    - Apila los vectores de pesos en una matriz (features × K) y puntúa todos
+      los modelos con un único producto matricial.
+    - Agrega por media de probabilidades, mayoría de votos o voto ponderado
+      (por defecto con la accuracy de entrenamiento de cada modelo).
+    - Los votos devuelven la fracción (ponderada) de modelos que predicen
+      subida; un empate exacto se resuelve con la media (ponderada) de
+      probabilidades en lugar de caer siempre en BUY.
+    """
+
+    def __init__(
+        self,
+        models_dir: Path,
+        names: list[str],
+        method: str = "mean",
+        vote_weights: list[float] | None = None,
+    ) -> None:
+        if method not in VOTE_METHODS:
+            raise ValueError(f"Método de votación inválido: {method}")
+        if vote_weights is not None and len(vote_weights) != len(names):
+            raise ValueError("vote_weights debe tener un peso por modelo")
+
+        self.models_dir = Path(models_dir)
+        self.names = list(names)
+        self.method = method
+        self.W: np.ndarray | None = None
+        self.vote_weights: np.ndarray | None = None
+
+        members = [LocalClassifier(self.models_dir, name) for name in self.names]
+        if not members or not all(m.available for m in members):
+            return
+
+        feature_names = members[0].state.feature_names  # type: ignore[union-attr]
+        for m in members[1:]:
+            if list(m.state.feature_names) != list(feature_names):  # type: ignore[union-attr]
+                raise ValueError(f"Modelo incompatible en el ensemble: {m.name}")
+
+        self.W = np.column_stack([m.state.weights for m in members])  # type: ignore[union-attr]
+        if vote_weights is None:
+            vote_weights = [max(m.state.train_accuracy, 1e-6) for m in members]  # type: ignore[union-attr]
+        w = np.asarray(vote_weights, dtype=float)
+        self.vote_weights = w / w.sum()
+
+    @property
+    def available(self) -> bool:
+        return self.W is not None
 
+    @property
+    def version(self) -> tuple:
+        return (self.method, *(model_version(self.models_dir, n) for n in self.names))
+
+    def _member_probs(self, X: np.ndarray) -> np.ndarray:
+        return _sigmoid(X @ self.W)  # (n, K) en una sola llamada BLAS
+
+    def _aggregate(self, P: np.ndarray) -> np.ndarray:
+        if self.method == "mean":
+            return P.mean(axis=1)
+        votes = (P >= 0.5).astype(float)
+        if self.method == "majority":
+            share, fallback = votes.mean(axis=1), P.mean(axis=1)
+        else:
+            share, fallback = votes @ self.vote_weights, P @ self.vote_weights
+        return np.where(np.isclose(share, 0.5), fallback, share)
+
+    def predict_latest(self, feat_df: pd.DataFrame) -> dict[str, Any]:
+        if not self.available:
+            raise RuntimeError("Modelo no disponible")
+        X, _ = _prepare_xy(feat_df)
+        P = self._member_probs(X[-1:])
+        p = float(self._aggregate(P)[0])
+        signal = "BUY" if p >= 0.5 else "SELL"
+        return {
+            "prob_up": round(p, 4),
+            "signal": signal,
+            "ensemble": {
+                "method": self.method,
+                "models": self.names,
+                "member_probs": [round(float(v), 4) for v in P[0]],
+            },
+        }
+
+    def simple_backtest(self, feat_df: pd.DataFrame, fee: float = 0.0005) -> dict[str, Any]:
+        if not self.available:
+            raise RuntimeError("Modelo no disponible")
+        X, y = _prepare_xy(feat_df)
+        result = _backtest_probs(feat_df, self._aggregate(self._member_probs(X)), y, fee)
+        result["ensemble"] = {"method": self.method, "models": self.names}
+        return result
@@ -0,0 +1,84 @@
+"""
+Libro de órdenes pendientes indexado por precio para paper trading
+"""
+from typing import Dict, List, Tuple
+import heapq
+import itertools
+
+
+class OrderBook:
+    """Órdenes pendientes de un símbolo indexadas por nivel de disparo.
+
+    Se usan dos heaps:
+    - `_below`: max-heap de niveles que se disparan cuando el precio baja hasta
+      ellos (BUY LIMIT, SELL STOP_LOSS, BUY TAKE_PROFIT).
+    - `_above`: min-heap de niveles que se disparan cuando el precio sube hasta
+      ellos (SELL LIMIT, SELL TAKE_PROFIT, BUY STOP_LOSS).
+
+    En cada tick solo se extraen las órdenes cruzadas: O(k log n). Cancelar y
+    modificar usan borrado perezoso (la entrada vieja se descarta al salir).
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self._below: List[Tuple[float, int, str]] = []
+        self._above: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, int] = {}  # order_id -> seq de la entrada vigente
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self._live
+
+    def add(self, order_id: str, level: float, triggers_below: bool):
+        """Agrega (o reemplaza) una orden en su nivel de disparo"""
+        seq = next(self._seq)
+        self._live[order_id] = seq
+        if triggers_below:
+            heapq.heappush(self._below, (-level, seq, order_id))
+        else:
+            heapq.heappush(self._above, (level, seq, order_id))
+        self._maybe_compact()
+
+    def cancel(self, order_id: str) -> bool:
+        """Retira una orden del libro; devuelve False si no estaba"""
+        return self._live.pop(order_id, None) is not None
+
+    def amend(self, order_id: str, level: float, triggers_below: bool) -> bool:
+        """Mueve una orden a un nuevo nivel (pierde prioridad temporal)"""
+        if order_id not in self._live:
+            return False
+        self.add(order_id, level, triggers_below)
+        return True
+
+    def match(self, low: float, high: float) -> List[str]:
+        """Extrae las órdenes cuyos niveles fueron cruzados por el rango [low, high]"""
+        crossed: List[Tuple[int, str]] = []
+
+        while self._below and -self._below[0][0] >= low:
+            _, seq, order_id = heapq.heappop(self._below)
+            if self._live.get(order_id) == seq:
+                del self._live[order_id]
+                crossed.append((seq, order_id))
+
+        while self._above and self._above[0][0] <= high:
+            _, seq, order_id = heapq.heappop(self._above)
+            if self._live.get(order_id) == seq:
+                del self._live[order_id]
+                crossed.append((seq, order_id))
+
+        # Ejecutar en orden de llegada
+        crossed.sort()
+        return [order_id for _, order_id in crossed]
+
+    def _maybe_compact(self):
+        """Elimina entradas obsoletas cuando dominan los heaps"""
+        stale = len(self._below) + len(self._above) - len(self._live)
+        if stale <= 1024 or stale <= 2 * len(self._live):
+            return
+        self._below = [e for e in self._below if self._live.get(e[2]) == e[1]]
+        self._above = [e for e in self._above if self._live.get(e[2]) == e[1]]
+        heapq.heapify(self._below)
+        heapq.heapify(self._above)
@@ -0,0 +1,267 @@
+"""
+Índice de outcomes por tiempo y símbolo para métricas de cualquier rango en O(log n)
+"""
+from typing import Dict, Optional, Sequence, Tuple
+import math
+
+import numpy as np
+
+# Columnas de las sumas prefijas
+CUM_PNL, CUM_WINS, CUM_LOSSES, CUM_GAINS, CUM_LOSS_SUM = range(5)
+PREFIX_COLUMNS = 5
+
+# Nodo del árbol de segmentos: suma, máximo y mínimo de las sumas prefijas del
+# segmento, peor drawdown dentro del segmento, mejor y peor trade, y número de
+# trades, media y suma de cuadrados de desviaciones (M2) del pnl%
+T, MAX_PREFIX, MIN_PREFIX, DRAWDOWN, HIGH, LOW, N, MEAN_PCT, M2_PCT = range(9)
+IDENTITY = (0.0, -math.inf, math.inf, 0.0, -math.inf, math.inf, 0.0, 0.0, 0.0)
+
+
+def _combine(left: Tuple, right: Tuple) -> Tuple:
+    """Une dos segmentos consecutivos (no conmutativo)"""
+    # Media y M2 por la fórmula de Chan (Welford en paralelo): con medias grandes
+    # no se anula como E[x²] - media²
+    n = left[N] + right[N]
+    weight = right[N] / n if n else 0.0
+    delta = right[MEAN_PCT] - left[MEAN_PCT]
+    return (
+        left[T] + right[T],
+        max(left[MAX_PREFIX], left[T] + right[MAX_PREFIX]),
+        min(left[MIN_PREFIX], left[T] + right[MIN_PREFIX]),
+        min(left[DRAWDOWN], right[DRAWDOWN], left[T] + right[MIN_PREFIX] - left[MAX_PREFIX]),
+        max(left[HIGH], right[HIGH]),
+        min(left[LOW], right[LOW]),
+        n,
+        left[MEAN_PCT] + delta * weight,
+        left[M2_PCT] + right[M2_PCT] + delta * delta * left[N] * weight,
+    )
+
+
+def _combine_arrays(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """_combine vectorizado sobre filas de nodos"""
+    with np.errstate(invalid="ignore"):
+        nodes = np.empty_like(left)
+        nodes[:, T] = left[:, T] + right[:, T]
+        nodes[:, MAX_PREFIX] = np.maximum(left[:, MAX_PREFIX], left[:, T] + right[:, MAX_PREFIX])
+        nodes[:, MIN_PREFIX] = np.minimum(left[:, MIN_PREFIX], left[:, T] + right[:, MIN_PREFIX])
+        nodes[:, DRAWDOWN] = np.minimum(
+            np.minimum(left[:, DRAWDOWN], right[:, DRAWDOWN]),
+            left[:, T] + right[:, MIN_PREFIX] - left[:, MAX_PREFIX]
+        )
+        nodes[:, HIGH] = np.maximum(left[:, HIGH], right[:, HIGH])
+        nodes[:, LOW] = np.minimum(left[:, LOW], right[:, LOW])
+        nodes[:, N] = left[:, N] + right[:, N]
+        weight = np.divide(right[:, N], nodes[:, N], out=np.zeros(len(nodes)), where=nodes[:, N] > 0)
+        delta = right[:, MEAN_PCT] - left[:, MEAN_PCT]
+        nodes[:, MEAN_PCT] = left[:, MEAN_PCT] + delta * weight
+        nodes[:, M2_PCT] = left[:, M2_PCT] + right[:, M2_PCT] + delta * delta * left[:, N] * weight
+    return nodes
+
+
+class OutcomeSeries:
+    """Trades de un grupo (todos o un símbolo) ordenados por tiempo.
+
+    - Sumas prefijas de pnl, ganadores, perdedores y ganancias/pérdidas:
+      cualquier suma de un rango es O(1).
+    - Árbol de segmentos sobre el pnl con (suma, máx/mín prefijo, drawdown,
+      mejor, peor) y sobre el pnl% con (n, media, M2): drawdown, mejor/peor
+      trade y desviación del pnl% de un rango en O(log n). Usa 2n nodos en vez
+      de los n log n de una sparse table.
+    - Los appends solo se acumulan; prefijos y árbol se extienden (vectorizado)
+      en la siguiente consulta. Un trade con timestamp anterior al último
+      fuerza a reordenar y reconstruir en esa consulta.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._ts = np.zeros(capacity, dtype=np.int64)
+        self._pnl = np.zeros(capacity)
+        self._pct = np.zeros(capacity)
+        self._size = 0
+        self._built = 0  # Filas ya incluidas en prefijos y árbol
+        self._sorted = True
+        self._prefix = np.zeros((capacity + 1, PREFIX_COLUMNS))
+        self._tree_capacity = 1
+        self._tree = np.array([IDENTITY, IDENTITY])
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, n: int):
+        if self._size + n > len(self._ts):
+            capacity = max(len(self._ts) * 2, self._size + n)
+            for name in ("_ts", "_pnl", "_pct"):
+                data = getattr(self, name)
+                grown = np.zeros(capacity, dtype=data.dtype)
+                grown[:self._size] = data[:self._size]
+                setattr(self, name, grown)
+
+    def append(self, ts_us: int, pnl: float, pnl_pct: float):
+        self._reserve(1)
+        i = self._size
+        if i and ts_us < self._ts[i - 1]:
+            self._sorted = False
+        self._ts[i] = ts_us
+        self._pnl[i] = pnl
+        self._pct[i] = pnl_pct
+        self._size = i + 1
+
+    def append_many(self, ts_us: np.ndarray, pnl: np.ndarray, pnl_pct: np.ndarray):
+        n = len(ts_us)
+        if not n:
+            return
+        self._reserve(n)
+        ts_us = np.asarray(ts_us, dtype=np.int64)
+        if (self._size and ts_us[0] < self._ts[self._size - 1]) or np.any(np.diff(ts_us) < 0):
+            self._sorted = False
+        stop = self._size + n
+        self._ts[self._size:stop] = ts_us
+        self._pnl[self._size:stop] = pnl
+        self._pct[self._size:stop] = pnl_pct
+        self._size = stop
+
+    # ------------------------------------------------------------------ construcción
+
+    def _build(self):
+        if not self._sorted:
+            order = np.argsort(self._ts[:self._size], kind="stable")
+            for name in ("_ts", "_pnl", "_pct"):
+                data = getattr(self, name)
+                data[:self._size] = data[:self._size][order]
+            self._sorted = True
+            self._built = 0
+        if self._built == self._size:
+            return
+        self._extend_prefix(self._built, self._size)
+        self._extend_tree(self._built, self._size)
+        self._built = self._size
+
+    def _extend_prefix(self, start: int, stop: int):
+        if stop + 1 > len(self._prefix):
+            grown = np.zeros((max(len(self._prefix) * 2, stop + 1), PREFIX_COLUMNS))
+            grown[:start + 1] = self._prefix[:start + 1]
+            self._prefix = grown
+        pnl = self._pnl[start:stop]
+        rows = np.column_stack((
+            pnl, pnl > 0, pnl < 0, np.where(pnl > 0, pnl, 0.0), np.where(pnl < 0, -pnl, 0.0)
+        ))
+        self._prefix[start + 1:stop + 1] = self._prefix[start] + np.cumsum(rows, axis=0)
+
+    def _extend_tree(self, start: int, stop: int):
+        capacity = self._tree_capacity
+        if stop > capacity:
+            # Capacidad potencia de dos; al crecer se reconstruye todo el árbol
+            while capacity < stop:
+                capacity *= 2
+            self._tree_capacity = capacity
+            self._tree = np.tile(np.array(IDENTITY), (2 * capacity, 1))
+            start = 0
+        pnl = self._pnl[start:stop]
+        leaves = self._tree[capacity + start:capacity + stop]
+        leaves[:, T] = pnl
+        leaves[:, MAX_PREFIX] = pnl
+        leaves[:, MIN_PREFIX] = pnl
+        leaves[:, DRAWDOWN] = 0.0
+        leaves[:, HIGH] = pnl
+        leaves[:, LOW] = pnl
+        leaves[:, N] = 1.0
+        leaves[:, MEAN_PCT] = self._pct[start:stop]
+        leaves[:, M2_PCT] = 0.0
+        # Recalcular solo los ancestros del tramo nuevo, nivel por nivel
+        lo, hi = (capacity + start) // 2, (capacity + stop - 1) // 2
+        while lo >= 1:
+            parents = np.arange(lo, hi + 1)
+            self._tree[parents] = _combine_arrays(self._tree[2 * parents], self._tree[2 * parents + 1])
+            lo, hi = lo // 2, hi // 2
+
+    def _query_tree(self, start: int, stop: int) -> Tuple:
+        left, right = IDENTITY, IDENTITY
+        lo, hi = start + self._tree_capacity, stop + self._tree_capacity
+        while lo < hi:
+            if lo & 1:
+                left = _combine(left, tuple(self._tree[lo]))
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right = _combine(tuple(self._tree[hi]), right)
+            lo //= 2
+            hi //= 2
+        return _combine(left, right)
+
+    # ------------------------------------------------------------------ consultas
+
+    def range(self, from_us: Optional[int] = None, to_us: Optional[int] = None) -> Tuple[int, int]:
+        """Filas [start, stop) con timestamp en [from_us, to_us]"""
+        self._build()
+        ts = self._ts[:self._size]
+        start = int(np.searchsorted(ts, from_us, side="left")) if from_us is not None else 0
+        stop = int(np.searchsorted(ts, to_us, side="right")) if to_us is not None else self._size
+        return start, max(start, stop)
+
+    def metrics(self, from_us: Optional[int] = None, to_us: Optional[int] = None) -> Dict:
+        """Métricas del rango con los mismos nombres que LearningMetrics"""
+        start, stop = self.range(from_us, to_us)
+        n = stop - start
+        if not n:
+            return {"total_trades": 0}
+        sums = self._prefix[stop] - self._prefix[start]
+        wins, losses = int(round(sums[CUM_WINS])), int(round(sums[CUM_LOSSES]))
+        node = self._query_tree(start, stop)
+        mean_pct = node[MEAN_PCT]
+        std = math.sqrt(node[M2_PCT] / n)
+        return {
+            "total_trades": n,
+            "win_rate": wins / n,
+            "avg_pnl": sums[CUM_PNL] / n,
+            "avg_win": sums[CUM_GAINS] / wins if wins else 0,
+            "avg_loss": -sums[CUM_LOSS_SUM] / losses if losses else 0,
+            "sharpe_ratio": mean_pct / std if std > 0 else 0,
+            "max_drawdown": node[DRAWDOWN],
+            "profit_factor": sums[CUM_GAINS] / sums[CUM_LOSS_SUM] if sums[CUM_LOSS_SUM] > 0 else float('inf'),
+            "best_trade": node[HIGH],
+            "worst_trade": node[LOW],
+            "total_pnl": sums[CUM_PNL],
+            "first_ts_us": int(self._ts[start]),
+            "last_ts_us": int(self._ts[stop - 1]),
+        }
+
+
+class OutcomeIndex:
+    """Series de outcomes para todos los símbolos y por símbolo"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.all = OutcomeSeries()
+        self.by_symbol: Dict[str, OutcomeSeries] = {}
+
+    def __len__(self) -> int:
+        return len(self.all)
+
+    def append(self, ts_us: int, symbol: str, pnl: float, pnl_pct: float):
+        self.all.append(ts_us, pnl, pnl_pct)
+        series = self.by_symbol.get(symbol)
+        if series is None:
+            series = self.by_symbol[symbol] = OutcomeSeries()
+        series.append(ts_us, pnl, pnl_pct)
+
+    def append_many(self, ts_us: np.ndarray, symbols: Sequence[str], pnl: np.ndarray, pnl_pct: np.ndarray):
+        ts_us = np.asarray(ts_us, dtype=np.int64)
+        pnl, pnl_pct = np.asarray(pnl, dtype=float), np.asarray(pnl_pct, dtype=float)
+        self.all.append_many(ts_us, pnl, pnl_pct)
+        groups: Dict[str, list] = {}
+        for j, symbol in enumerate(symbols):
+            groups.setdefault(symbol, []).append(j)
+        for symbol, rows in groups.items():
+            series = self.by_symbol.get(symbol)
+            if series is None:
+                series = self.by_symbol[symbol] = OutcomeSeries()
+            rows = np.asarray(rows) if len(rows) < len(ts_us) else slice(None)
+            series.append_many(ts_us[rows], pnl[rows], pnl_pct[rows])
+
+    def metrics(self, from_us: Optional[int] = None, to_us: Optional[int] = None,
+                symbol: Optional[str] = None) -> Dict:
+        series = self.all if symbol is None else self.by_symbol.get(symbol)
+        if series is None:
+            return {"total_trades": 0}
+        return series.metrics(from_us, to_us)
@@ -0,0 +1,326 @@
+"""
+Cuentas de paper trading aisladas, repartidas en shards de escritores
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from pathlib import Path
+import asyncio
+import logging
+import re
+import shutil
+import zlib
+
+from app.core.clock import Clock, clock as default_clock
+from app.core.config import settings
+from app.services.fill_models import Candle, DepthWalkModel, build_fill_model
+from app.services.paper_engine_actor import EngineSnapshot, PaperEngineActor
+from app.services.paper_journal import PaperJournal
+from app.services.paper_trading_service import PaperTradingEngine
+from app.services.redis_state import RedisStateBackend, SharedAccountState
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_ACCOUNT = "default"
+ACCOUNT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class PaperAccountManager:
+    """Gestiona cuentas con su propio engine sobre una tabla de precios compartida.
+
+    - Cada cuenta vive en un shard (un PaperEngineActor) elegido por crc32 del id.
+      Los shards son tareas del mismo event loop: se intercalan y solapan sus
+      esperas (group commit del journal en threads), pero no corren en paralelo;
+      un comando lento de un shard retrasa a los demás.
+    - El historial, las posiciones y el balance son independientes por cuenta;
+      solo la tabla de precios es común.
+    - Con `journal_dir`, cada cuenta tiene su journal en `journal_dir/<cuenta>` y
+      al arrancar se reconstruyen todas las cuentas encontradas en disco.
+    - Con `state_backend` (Redis), precios, balances y posiciones son comunes a
+      todos los workers: los fills se validan de forma atómica en Redis y cada
+      worker aplica los eventos de los demás a su copia local (caché de lectura).
+      Los shards ejecutan entonces sus lotes en threads para que la ida y vuelta
+      a Redis no bloquee el event loop.
+    - Las órdenes pendientes (límite/stop) NO se comparten: viven en el OrderBook
+      del worker que las recibió. Consultarlas, cancelarlas o modificarlas desde
+      otro worker devuelve 404, así que con varios workers los clientes deben
+      fijarse a uno (sticky sessions por cuenta en el balanceador).
+    """
+
+    def __init__(self, num_shards: int = 4, initial_balance: float = 10000.0,
+                 journal_dir: Optional[Path] = None, snapshot_every: int = 50_000,
+                 fsync: bool = True, state_backend: Optional[RedisStateBackend] = None,
+                 clock: Optional[Clock] = None):
+        self.clock = clock or default_clock  # Compartido por engines y journals
+        self.prices: Dict[str, float] = {}
+        self.fill_model = build_fill_model(settings.paper_fill_model)  # Compartido: datos de mercado comunes
+        self.shards = [PaperEngineActor(shard_id=i) for i in range(max(1, num_shards))]
+        self.accounts: Dict[str, PaperEngineActor] = {}
+        self.default_balance = initial_balance
+        self.journal_dir = Path(journal_dir) if journal_dir is not None else None
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self._journals_ready = False
+        self._trade_sink_factory: Optional[Callable[[str], Callable[[Dict], None]]] = None
+        self.state_backend = state_backend
+        self._shared_ready = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._add_account(DEFAULT_ACCOUNT, initial_balance)
+
+    def shard_for(self, account_id: str) -> PaperEngineActor:
+        return self.shards[zlib.crc32(account_id.encode()) % len(self.shards)]
+
+    async def create_account(self, account_id: str, initial_balance: Optional[float] = None) -> PaperTradingEngine:
+        """Crea una cuenta nueva con su propio engine (y la registra en Redis si es compartida)"""
+        if not ACCOUNT_ID_RE.match(account_id):
+            raise ValueError("Id de cuenta inválido")
+        if account_id in self.accounts:
+            raise ValueError(f"La cuenta ya existe: {account_id}")
+        initial_balance = initial_balance if initial_balance is not None else self.default_balance
+        if self._shared_ready:
+            created = await asyncio.to_thread(self.state_backend.ensure_account, account_id, initial_balance)
+            # Otra petición o worker pudo crearla mientras tanto
+            if not created or account_id in self.accounts:
+                raise ValueError(f"La cuenta ya existe: {account_id}")
+        return self._add_account(account_id, initial_balance)
+
+    def _add_account(self, account_id: str, initial_balance: float) -> PaperTradingEngine:
+        """Registra localmente el engine de una cuenta en su shard"""
+        engine = PaperTradingEngine(
+            initial_balance=initial_balance,
+            prices=self.prices,
+            fill_model=self.fill_model,
+            clock=self.clock
+        )
+        shard = self.shard_for(account_id)
+        shard.add_engine(account_id, engine)
+        self.accounts[account_id] = shard
+        if self._journals_ready:
+            self._open_journal(account_id, engine)
+        if self._trade_sink_factory is not None:
+            engine.trade_sink = self._trade_sink_factory(account_id)
+        if self._shared_ready:
+            engine.shared_state = SharedAccountState(self.state_backend, account_id)
+        logger.info(f"👤 Cuenta de paper trading creada: {account_id} (shard {shard.shard_id})")
+        return engine
+
+    async def delete_account(self, account_id: str, publish: bool = True):
+        """Elimina una cuenta (la cuenta por defecto no se puede eliminar).
+
+        El engine sale del shard con un comando del actor: los comandos ya
+        encolados para la cuenta y su group commit terminan antes de cerrar
+        el journal, y después ningún commit puede escribir en el directorio.
+        """
+        if account_id == DEFAULT_ACCOUNT:
+            raise ValueError("La cuenta por defecto no se puede eliminar")
+        shard = self.accounts.pop(account_id, None)
+        if shard is None:
+            raise KeyError(f"Cuenta no encontrada: {account_id}")
+        if self._shared_ready and publish:
+            await asyncio.to_thread(self.state_backend.delete_account, account_id)
+
+        removed = []
+
+        def command(engines: Dict[str, PaperTradingEngine]) -> Dict:
+            engine = engines.get(account_id)
+            shard.remove_engine(account_id)
+            if engine is not None and engine.journal is not None:
+                engine.journal.close()
+                removed.append(engine.journal.directory)
+            return {}
+
+        await shard.submit(None, command)
+        for directory in removed:
+            await asyncio.to_thread(shutil.rmtree, directory, ignore_errors=True)
+
+    def engine(self, account_id: str) -> PaperTradingEngine:
+        return self.accounts[account_id].engines[account_id]
+
+    def snapshot(self, account_id: str) -> EngineSnapshot:
+        return self.accounts[account_id].snapshot(account_id)
+
+    async def submit(self, account_id: str, command: Callable[[PaperTradingEngine], T]) -> T:
+        """Ejecuta un comando en el escritor del shard de la cuenta"""
+        shard = self.accounts.get(account_id)
+        if shard is None:
+            raise KeyError(f"Cuenta no encontrada: {account_id}")
+        return await shard.submit(account_id, command)
+
+    async def update_price(self, symbol: str, price: float, exclude: Optional[str] = None,
+                           candle: Optional[Candle] = None, publish: bool = True) -> Dict[str, List[Dict]]:
+        """Publica un precio en la tabla compartida y marca las cuentas con exposición al símbolo.
+
+        Devuelve las órdenes pendientes ejecutadas por cuenta. Con estado compartido
+        el precio se publica también al resto de workers.
+        """
+        self.prices[symbol] = price
+        if self._shared_ready and publish:
+            await asyncio.to_thread(self.state_backend.publish_price, symbol, price, candle)
+
+        def command(engines: Dict[str, PaperTradingEngine]) -> Dict[str, List[Dict]]:
+            fills = {}
+            for account_id, engine in engines.items():
+                if account_id == exclude:
+                    continue
+                if candle is not None:
+                    engine.last_candles[symbol] = candle
+                if symbol in engine.positions or engine.order_books.get(symbol):
+                    fills[account_id] = engine.update_market_price(symbol, price, candle)
+            return fills
+
+        results = await asyncio.gather(*(shard.submit(None, command) for shard in self.shards))
+        merged: Dict[str, List[Dict]] = {}
+        for shard_fills in results:
+            merged.update(shard_fills)
+        return merged
+
+    def update_depth(self, symbol: str, bids: List[List[float]], asks: List[List[float]]):
+        """Publica un snapshot L2 para el modelo de ejecución por profundidad"""
+        if not isinstance(self.fill_model, DepthWalkModel):
+            raise ValueError(f"El modelo de ejecución '{self.fill_model.name}' no usa profundidad")
+        self.fill_model.update_depth(symbol, bids, asks)
+
+    def list_accounts(self) -> List[Dict[str, Any]]:
+        accounts = []
+        for account_id, shard in self.accounts.items():
+            portfolio = shard.snapshot(account_id).portfolio
+            accounts.append({
+                "account_id": account_id,
+                "shard": shard.shard_id,
+                "initial_balance": portfolio["initial_balance"],
+                "total_value": portfolio["total_value"],
+                "num_positions": portfolio["num_positions"],
+                "num_trades": portfolio["num_trades"]
+            })
+        return accounts
+
+    def set_trade_sink(self, factory: Optional[Callable[[str], Callable[[Dict], None]]]):
+        """Conecta (o desconecta) un sink de fills por cuenta, p. ej. la persistencia en Postgres"""
+        self._trade_sink_factory = factory
+        for account_id in self.accounts:
+            self.engine(account_id).trade_sink = factory(account_id) if factory is not None else None
+
+    def _new_journal(self, account_id: str) -> PaperJournal:
+        return PaperJournal(self.journal_dir / account_id, snapshot_every=self.snapshot_every,
+                            fsync=self.fsync, clock=self.clock)
+
+    def _open_journal(self, account_id: str, engine: PaperTradingEngine):
+        """Crea el journal de una cuenta nueva; el primer evento fija su balance inicial"""
+        engine.journal = self._new_journal(account_id)
+        engine.journal.record_reset(engine.initial_balance)
+        engine.journal.commit()
+
+    def recover(self):
+        """Reconstruye las cuentas desde sus journals y abre journal a las que no tienen"""
+        if self.journal_dir is None or self._journals_ready:
+            return
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+
+        for directory in sorted(p for p in self.journal_dir.iterdir() if p.is_dir()):
+            account_id = directory.name
+            if not ACCOUNT_ID_RE.match(account_id):
+                continue
+            if account_id in self.accounts:
+                engine = self.engine(account_id)
+            else:
+                engine = PaperTradingEngine(initial_balance=self.default_balance, prices=self.prices,
+                                            fill_model=self.fill_model, clock=self.clock)
+                self.accounts[account_id] = self.shard_for(account_id)
+            engine.journal = self._new_journal(account_id)
+            engine.journal.recover(engine)
+            # Republicar el snapshot de lectura con el estado recuperado
+            self.accounts[account_id].add_engine(account_id, engine)
+
+        for account_id in self.accounts:
+            engine = self.engine(account_id)
+            if engine.journal is None:
+                self._open_journal(account_id, engine)
+        self._journals_ready = True
+
+    def _load_shared_state(self, balances: Dict[str, float]) -> Tuple[Dict[str, float], Dict[str, Dict]]:
+        """Registra las cuentas locales en Redis y lee precios, balances y posiciones (E/S)"""
+        backend = self.state_backend
+        for account_id, initial_balance in balances.items():
+            backend.ensure_account(account_id, initial_balance)
+        return backend.load_prices(), backend.load_accounts()
+
+    def _sync_shared_state(self, prices: Dict[str, float], accounts: Dict[str, Dict]):
+        """Alinea las cuentas locales con el estado compartido"""
+        backend = self.state_backend
+        self.prices.update(prices)
+        for account_id, state in accounts.items():
+            if not ACCOUNT_ID_RE.match(account_id):
+                continue
+            if account_id in self.accounts:
+                engine = self.engine(account_id)
+            else:
+                engine = self._add_account(account_id, state["initial_balance"])
+            engine.sync_shared_state(state["balance"], state["initial_balance"], state["positions"])
+            # Republicar el snapshot de lectura con el estado compartido
+            self.accounts[account_id].add_engine(account_id, engine)
+        for account_id in self.accounts:
+            self.engine(account_id).shared_state = SharedAccountState(backend, account_id)
+        for shard in self.shards:
+            shard.offload = True
+        self._shared_ready = True
+
+    def _on_shared_event(self, event: Dict):
+        """Recibe un evento de otro worker (hilo de pub/sub) y lo aplica en el event loop"""
+        asyncio.run_coroutine_threadsafe(self._apply_shared_event(event), self._loop)
+
+    async def _apply_shared_event(self, event: Dict):
+        kind = event["type"]
+        account_id = event.get("account")
+        try:
+            if kind == "price":
+                candle = Candle(**event["candle"]) if event.get("candle") else None
+                await self.update_price(event["symbol"], event["price"], candle=candle, publish=False)
+            elif kind == "account_created":
+                if account_id not in self.accounts:
+                    self._add_account(account_id, event["balance"])
+            elif kind == "account_deleted":
+                if account_id in self.accounts:
+                    await self.delete_account(account_id, publish=False)
+            elif account_id in self.accounts:
+                if kind == "fill":
+                    await self.submit(account_id, lambda engine: engine.apply_shared_fill(event))
+                elif kind == "reset":
+                    await self.submit(account_id, lambda engine: engine.apply_shared_reset(event))
+        except Exception as e:
+            logger.error(f"Error aplicando evento compartido {kind}: {e}")
+
+    async def start(self):
+        self.recover()
+        for shard in self.shards:
+            await shard.start()
+        if self.state_backend is not None and not self._shared_ready:
+            self._loop = asyncio.get_running_loop()
+            # Suscribirse antes de cargar el estado para no perder eventos intermedios
+            self.state_backend.start_listener(self._on_shared_event)
+            balances = {account_id: self.engine(account_id).initial_balance for account_id in self.accounts}
+            prices, accounts = await asyncio.to_thread(self._load_shared_state, balances)
+            self._sync_shared_state(prices, accounts)
+            logger.info(f"🔗 Estado de paper trading compartido vía Redis ({len(self.accounts)} cuentas)")
+
+    async def stop(self):
+        if self.state_backend is not None:
+            self.state_backend.stop()
+        for shard in self.shards:
+            await shard.stop()
+        for shard in self.shards:
+            for engine in shard.engines.values():
+                if engine.journal is not None:
+                    engine.journal.close()
+
+
+# Instancia global de las cuentas de paper trading
+paper_accounts = PaperAccountManager(
+    num_shards=settings.paper_account_shards,
+    initial_balance=settings.paper_trading_initial_balance,
+    journal_dir=(settings.paper_journal_dir or settings.data_dir / "paper_journal")
+    if settings.paper_journal_enabled and settings.paper_state_backend != "redis" else None,
+    snapshot_every=settings.paper_journal_snapshot_every,
+    fsync=settings.paper_journal_fsync,
+    state_backend=RedisStateBackend(settings.redis_url, namespace=settings.redis_state_namespace)
+    if settings.paper_state_backend == "redis" else None
+)
@@ -0,0 +1,198 @@
+"""
+Escritor único (actor) para los paper trading engines de un shard
+"""
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+from dataclasses import dataclass, field
+from datetime import datetime
+import asyncio
+import logging
+
+from app.services.paper_trading_service import PaperTradingEngine
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+# account_id None indica un comando sobre todo el shard: recibe el dict de engines y
+# devuelve un dict con el resultado de cada cuenta que modificó
+QueuedCommand = Tuple[Optional[str], Callable[[Any], Any], asyncio.Future]
+# (future, resultado, error, cuentas que modificó el comando)
+Outcome = Tuple[asyncio.Future, Any, Optional[Exception], Set[str]]
+
+
+@dataclass(frozen=True)
+class EngineSnapshot:
+    """Vista inmutable de un engine publicada al final de cada lote de comandos"""
+    version: int
+    taken_at: datetime
+    portfolio: Dict = field(default_factory=dict)
+    statistics: Dict = field(default_factory=dict)
+    last_trade: Optional[Dict] = None
+
+
+class PaperEngineActor:
+    """Serializa todas las mutaciones de los engines de un shard en una única tarea asyncio.
+
+    - Los endpoints envían comandos (funciones que reciben el engine) a una cola.
+    - La tarea los procesa por lotes y, tras cada lote, publica un snapshot
+      inmutable de cada cuenta tocada que sirve las lecturas sin tomar locks.
+    - Si las cuentas tienen journal, al final del lote se hace un único group
+      commit y solo entonces se responden los comandos del lote; si el commit
+      de una cuenta falla, sus comandos responden con el error (el estado en
+      memoria cambió, pero no es durable).
+    - Con `offload` los comandos del lote se ejecutan en un thread: es necesario
+      cuando hacen E/S bloqueante (fills validados en Redis) para no frenar el
+      event loop ni a los demás shards. La tarea sigue siendo el único escritor.
+    """
+
+    def __init__(self, shard_id: int = 0, max_batch: int = 256):
+        self.shard_id = shard_id
+        self.max_batch = max_batch
+        # Copy-on-write: un lote en un thread puede estar recorriendo el dict anterior
+        self.engines: Dict[str, PaperTradingEngine] = {}
+        self.offload = False
+        self._snapshots: Dict[str, EngineSnapshot] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._version = 0
+        self.batches_processed = 0
+        self.commands_processed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_engine(self, account_id: str, engine: PaperTradingEngine):
+        self.engines = {**self.engines, account_id: engine}
+        self._snapshots[account_id] = self._build_snapshot(engine)
+
+    def remove_engine(self, account_id: str):
+        self.engines = {key: value for key, value in self.engines.items() if key != account_id}
+        self._snapshots.pop(account_id, None)
+
+    async def start(self):
+        """Arranca la tarea escritora en el event loop actual"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name=f"paper-engine-actor-{self.shard_id}")
+        logger.info(f"🧵 Paper engine actor {self.shard_id} iniciado")
+
+    async def stop(self):
+        """Procesa los comandos pendientes y detiene la tarea escritora"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info(f"🧵 Paper engine actor {self.shard_id} detenido")
+
+    async def submit(self, account_id: Optional[str], command: Callable[[Any], T]) -> T:
+        """Encola un comando para una cuenta (o para todo el shard) y espera su resultado"""
+        if not self.running:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((account_id, command, future))
+        return await future
+
+    def snapshot(self, account_id: str) -> EngineSnapshot:
+        """Último snapshot publicado de la cuenta (lectura sin locks)"""
+        return self._snapshots[account_id]
+
+    def _build_snapshot(self, engine: PaperTradingEngine) -> EngineSnapshot:
+        self._version += 1
+        return EngineSnapshot(
+            version=self._version,
+            taken_at=engine.clock.now(),
+            portfolio=engine.get_portfolio_summary(),
+            statistics=engine.get_trade_statistics(),
+            last_trade=engine.trade_log.last()
+        )
+
+    def _commit_journals(self, engines: Dict[str, PaperTradingEngine]) -> Dict[str, Exception]:
+        """Group commit de cada cuenta; devuelve el error de las que no quedaron en disco"""
+        failed: Dict[str, Exception] = {}
+        for account_id, engine in engines.items():
+            try:
+                engine.journal.commit()
+            except Exception as e:
+                logger.error(f"Error escribiendo el journal de {account_id} (shard {self.shard_id}): {e}")
+                failed[account_id] = e
+                continue
+            try:
+                if engine.journal.should_snapshot():
+                    engine.journal.snapshot(engine)
+            except Exception as e:
+                # Los eventos ya son durables en el segmento: solo se pierde el atajo de recuperación
+                logger.error(f"Error guardando el snapshot de {account_id}: {e}")
+        return failed
+
+    def _execute(self, batch: List[QueuedCommand]) -> Tuple[Set[str], List[Outcome]]:
+        """Ejecuta los comandos del lote; los futures se resuelven después en el event loop"""
+        touched: Set[str] = set()
+        outcomes: List[Outcome] = []
+        for account_id, command, future in batch:
+            try:
+                if account_id is None:
+                    result = command(self.engines)
+                    accounts = set(result)
+                else:
+                    engine = self.engines.get(account_id)
+                    if engine is None:
+                        raise KeyError(f"Cuenta no encontrada: {account_id}")
+                    touched.add(account_id)
+                    result = command(engine)
+                    accounts = {account_id}
+            except Exception as e:
+                logger.error(f"Error en comando del paper engine: {e}")
+                outcomes.append((future, None, e, set()))
+            else:
+                touched.update(accounts)
+                outcomes.append((future, result, None, accounts))
+        return touched, outcomes
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch: List[QueuedCommand] = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            if self.offload:
+                touched, outcomes = await asyncio.to_thread(self._execute, batch)
+            else:
+                touched, outcomes = self._execute(batch)
+
+            # Group commit del journal antes de responder
+            journaled = {
+                account_id: self.engines[account_id] for account_id in touched
+                if account_id in self.engines and self.engines[account_id].journal is not None
+            }
+            failed = await asyncio.to_thread(self._commit_journals, journaled) if journaled else {}
+
+            for future, result, error, accounts in outcomes:
+                if future.done():
+                    continue
+                if error is None and failed:
+                    error = next((failed[account_id] for account_id in accounts if account_id in failed), None)
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            for account_id in touched:
+                engine = self.engines.get(account_id)
+                if engine is None:
+                    continue
+                try:
+                    self._snapshots[account_id] = self._build_snapshot(engine)
+                except Exception as e:
+                    logger.error(f"Error publicando snapshot de {account_id}: {e}")
+
+            self.batches_processed += 1
+            self.commands_processed += len(batch)
+            for _ in batch:
+                queue.task_done()
@@ -0,0 +1,310 @@
+"""
+Journal binario append-only del paper trading engine con snapshots y recuperación
+"""
+from typing import List, Optional, Tuple
+from datetime import datetime
+from pathlib import Path
+import logging
+import math
+import os
+import pickle
+import struct
+import zlib
+
+from app.core.clock import Clock, clock as default_clock
+from app.services.paper_trading_service import (
+    OrderSide, OrderStatus, PaperOrder, PaperTradingEngine
+)
+
+logger = logging.getLogger(__name__)
+
+# Cada registro: [u32 longitud][u32 crc32 del payload][payload]
+HEADER = struct.Struct("<II")
+# Payload: [u8 tipo][i64 timestamp en µs][campos del evento]
+EVENT_HEAD = struct.Struct("<Bq")
+F64 = struct.Struct("<d")
+FILL_TAIL = struct.Struct("<Bddd")  # side, quantity, price, transaction_cost
+PLACE_TAIL = struct.Struct("<Bdd")  # side, quantity, price
+AMEND_TAIL = struct.Struct("<dd")  # price, quantity (NaN = sin cambio)
+
+EVENT_FILL = 1
+EVENT_MARK = 2
+EVENT_RESET = 3
+EVENT_PLACE = 4
+EVENT_CANCEL = 5
+EVENT_AMEND = 6
+
+SIDES = (OrderSide.BUY, OrderSide.SELL)
+SEGMENT_SUFFIX = ".journal"
+SNAPSHOT_SUFFIX = ".snapshot"
+
+
+def _ts_us(ts: datetime) -> int:
+    return int(ts.timestamp() * 1_000_000)
+
+
+def _from_us(ts_us: int) -> datetime:
+    return datetime.fromtimestamp(ts_us / 1_000_000)
+
+
+def _pack_str(value: str) -> bytes:
+    raw = value.encode()
+    return bytes((len(raw),)) + raw
+
+
+def _unpack_str(buf: memoryview, offset: int) -> Tuple[str, int]:
+    size = buf[offset]
+    start = offset + 1
+    return bytes(buf[start:start + size]).decode(), start + size
+
+
+class PaperJournal:
+    """Journal de eventos de una cuenta de paper trading.
+
+    - Los eventos (fills, marcas de precio, resets y alta/baja/modificación de
+      órdenes pendientes) se acumulan en un buffer y se escriben juntos en
+      `commit()`: el actor hace un group commit al final de cada lote.
+    - Cada `snapshot_every` eventos se guarda un snapshot del engine y se rota
+      el segmento, de modo que la recuperación solo reproduce la cola reciente.
+    - Al reproducir, los fills se aplican sin revalidar y las marcas solo fijan
+      el precio (los fills que provocaron ya están en el journal).
+    """
+
+    def __init__(self, directory: Path, snapshot_every: int = 50_000, fsync: bool = True,
+                 clock: Optional[Clock] = None):
+        self.directory = Path(directory)
+        self.clock = clock or default_clock
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.seq = 0  # Eventos registrados desde la creación de la cuenta
+        self.snapshot_seq = 0
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._file = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    # ------------------------------------------------------------------ escritura
+
+    def _append(self, event_type: int, ts: Optional[datetime], body: bytes):
+        payload = EVENT_HEAD.pack(event_type, _ts_us(ts or self.clock.now())) + body
+        self._buffer += HEADER.pack(len(payload), zlib.crc32(payload))
+        self._buffer += payload
+        self._buffered += 1
+        self.seq += 1
+
+    def record_fill(self, order: PaperOrder, transaction_cost: float):
+        body = (_pack_str(order.id) + _pack_str(order.symbol) + _pack_str(order.order_type)
+                + FILL_TAIL.pack(SIDES.index(order.side), order.quantity, order.filled_price,
+                                 transaction_cost))
+        self._append(EVENT_FILL, order.filled_at, body)
+
+    def record_mark(self, symbol: str, price: float):
+        self._append(EVENT_MARK, None, _pack_str(symbol) + F64.pack(price))
+
+    def record_reset(self, new_balance: float):
+        self._append(EVENT_RESET, None, F64.pack(new_balance))
+
+    def record_place(self, order: PaperOrder):
+        body = (_pack_str(order.id) + _pack_str(order.symbol) + _pack_str(order.order_type)
+                + PLACE_TAIL.pack(SIDES.index(order.side), order.quantity, order.price))
+        self._append(EVENT_PLACE, order.created_at, body)
+
+    def record_cancel(self, order_id: str):
+        self._append(EVENT_CANCEL, None, _pack_str(order_id))
+
+    def record_amend(self, order_id: str, price: Optional[float], quantity: Optional[float]):
+        body = _pack_str(order_id) + AMEND_TAIL.pack(
+            math.nan if price is None else price,
+            math.nan if quantity is None else quantity
+        )
+        self._append(EVENT_AMEND, None, body)
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def commit(self) -> int:
+        """Escribe (y opcionalmente sincroniza a disco) el buffer acumulado; devuelve los bytes"""
+        if not self._buffer:
+            return 0
+        if self._file is None:
+            self._open_segment(self.seq - self._buffered)
+        size = len(self._buffer)
+        self._file.write(self._buffer)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._buffer.clear()
+        self._buffered = 0
+        return size
+
+    def should_snapshot(self) -> bool:
+        return self.seq - self.snapshot_seq >= self.snapshot_every
+
+    def snapshot(self, engine: PaperTradingEngine):
+        """Guarda un snapshot del engine, rota el segmento y borra los archivos superados"""
+        self.commit()
+        seq = self.seq
+        path = self._path(seq, SNAPSHOT_SUFFIX)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({"seq": seq, "state": engine.export_state()}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        self._close_segment()
+        self._open_segment(seq)
+        self.snapshot_seq = seq
+        for old in self._files(SEGMENT_SUFFIX) + self._files(SNAPSHOT_SUFFIX):
+            if self._seq_of(old) < seq:
+                old.unlink(missing_ok=True)
+        logger.info(f"📸 Snapshot del journal {self.directory.name} en el evento {seq}")
+
+    def close(self):
+        self.commit()
+        self._close_segment()
+
+    # ------------------------------------------------------------------ recuperación
+
+    def recover(self, engine: PaperTradingEngine) -> int:
+        """Reconstruye el engine desde el último snapshot más la cola del journal.
+
+        Devuelve el número de eventos reproducidos. Un registro truncado o con CRC
+        inválido (escritura interrumpida) marca el final del journal y se descarta.
+        """
+        for path in reversed(self._files(SNAPSHOT_SUFFIX)):
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+            except Exception as e:
+                logger.error(f"Snapshot inválido {path.name}: {e}")
+                continue
+            engine.restore_state(data["state"])
+            self.seq = self.snapshot_seq = data["seq"]
+            break
+
+        journal = engine.journal
+        engine.journal = None  # No volver a registrar lo que se reproduce
+        replayed = 0
+        last_segment = None
+        try:
+            for segment in self._files(SEGMENT_SUFFIX):
+                start = self._seq_of(segment)
+                if start < self.seq:
+                    continue  # Ya incluido en el snapshot
+                count, valid_size, complete = self._replay_segment(segment, engine)
+                replayed += count
+                self.seq = start + count
+                last_segment = segment
+                if not complete:
+                    logger.warning(f"⚠️ Journal {segment.name} truncado en el byte {valid_size}")
+                    with open(segment, "r+b") as f:
+                        f.truncate(valid_size)
+                    # Descartar segmentos posteriores a un corte
+                    for later in self._files(SEGMENT_SUFFIX):
+                        if self._seq_of(later) > start:
+                            later.unlink(missing_ok=True)
+                    break
+        finally:
+            engine.journal = journal
+
+        engine.recompute_position_aggregates()
+        if last_segment is not None:
+            self._file = open(last_segment, "ab")
+        logger.info(f"♻️ Cuenta {self.directory.name} recuperada: {replayed} eventos reproducidos")
+        return replayed
+
+    def _replay_segment(self, segment: Path, engine: PaperTradingEngine) -> Tuple[int, int, bool]:
+        data = memoryview(segment.read_bytes())
+        offset = 0
+        count = 0
+        end = len(data)
+        while offset < end:
+            if offset + HEADER.size > end:
+                return count, offset, False
+            length, crc = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return count, offset, False
+            self._apply(engine, payload)
+            count += 1
+            offset = start + length
+        return count, offset, True
+
+    @staticmethod
+    def _apply(engine: PaperTradingEngine, payload: memoryview):
+        event_type, ts_us = EVENT_HEAD.unpack_from(payload, 0)
+        offset = EVENT_HEAD.size
+
+        if event_type == EVENT_MARK:
+            symbol, offset = _unpack_str(payload, offset)
+            engine.current_prices[symbol] = F64.unpack_from(payload, offset)[0]
+
+        elif event_type == EVENT_FILL:
+            order_id, offset = _unpack_str(payload, offset)
+            symbol, offset = _unpack_str(payload, offset)
+            order_type, offset = _unpack_str(payload, offset)
+            side, quantity, price, cost = FILL_TAIL.unpack_from(payload, offset)
+            pending = engine.orders.pop(order_id, None)
+            if pending is not None:
+                engine._book(symbol).cancel(order_id)
+            filled_at = _from_us(ts_us)
+            order = PaperOrder(
+                id=order_id, symbol=symbol, side=SIDES[side], quantity=quantity, price=price,
+                order_type=order_type, status=OrderStatus.FILLED,
+                created_at=pending.created_at if pending is not None else filled_at,
+                filled_at=filled_at, filled_price=price, filled_quantity=quantity
+            )
+            engine._apply_fill(order, cost)
+
+        elif event_type == EVENT_PLACE:
+            order_id, offset = _unpack_str(payload, offset)
+            symbol, offset = _unpack_str(payload, offset)
+            order_type, offset = _unpack_str(payload, offset)
+            side, quantity, price = PLACE_TAIL.unpack_from(payload, offset)
+            engine._book_order(PaperOrder(
+                id=order_id, symbol=symbol, side=SIDES[side], quantity=quantity, price=price,
+                order_type=order_type, status=OrderStatus.PENDING, created_at=_from_us(ts_us)
+            ))
+
+        elif event_type == EVENT_CANCEL:
+            order_id, offset = _unpack_str(payload, offset)
+            order = engine.orders.pop(order_id, None)
+            if order is not None:
+                engine._book(order.symbol).cancel(order_id)
+
+        elif event_type == EVENT_AMEND:
+            order_id, offset = _unpack_str(payload, offset)
+            price, quantity = AMEND_TAIL.unpack_from(payload, offset)
+            order = engine.orders.get(order_id)
+            if order is not None:
+                engine._apply_amend(order, None if math.isnan(price) else price,
+                                    None if math.isnan(quantity) else quantity)
+
+        elif event_type == EVENT_RESET:
+            engine.reset_portfolio(F64.unpack_from(payload, offset)[0])
+
+        else:
+            raise ValueError(f"Evento de journal desconocido: {event_type}")
+
+    # ------------------------------------------------------------------ archivos
+
+    def _path(self, seq: int, suffix: str) -> Path:
+        return self.directory / f"{seq:016d}{suffix}"
+
+    @staticmethod
+    def _seq_of(path: Path) -> int:
+        return int(path.stem)
+
+    def _files(self, suffix: str) -> List[Path]:
+        return sorted(self.directory.glob(f"*{suffix}"), key=self._seq_of)
+
+    def _open_segment(self, start_seq: int):
+        self._file = open(self._path(start_seq, SEGMENT_SUFFIX), "ab")
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
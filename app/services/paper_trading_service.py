@@ -1,13 +1,22 @@
 """
 Paper Trading Engine para simulación de operaciones sin dinero real
 """
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 import uuid
 from enum import Enum
 import logging
 
+import numpy as np
+
+from app.core.clock import Clock, clock as default_clock
+from app.core.config import settings
+from app.services.fill_models import Candle, FillModel, build_fill_model
+from app.services.order_book import OrderBook
+from app.services.trade_ledger import TradeLedger
+from app.services.trade_log import TradeLog
+
 logger = logging.getLogger(__name__)
 
 class OrderStatus(Enum):
@@ -20,21 +29,23 @@ class OrderSide(Enum):
     BUY = "BUY"
     SELL = "SELL"
 
-@dataclass
+ORDER_TYPES = ("MARKET", "LIMIT", "STOP_LOSS", "TAKE_PROFIT")
+
+@dataclass(slots=True)
 class PaperOrder:
     id: str
     symbol: str
     side: OrderSide
     quantity: float
     price: float
-    order_type: str  # MARKET, LIMIT
+    order_type: str  # MARKET, LIMIT, STOP_LOSS, TAKE_PROFIT
     status: OrderStatus
     created_at: datetime
     filled_at: Optional[datetime] = None
     filled_price: Optional[float] = None
     filled_quantity: Optional[float] = None
 
-@dataclass
+@dataclass(slots=True)
 class PaperPosition:
     symbol: str
     quantity: float
@@ -44,40 +55,92 @@ class PaperPosition:
     created_at: datetime
 
 class PaperTradingEngine:
-    def __init__(self, initial_balance: float = 10000.0):
+    def __init__(self, initial_balance: float = 10000.0, trade_log_retention: Optional[int] = None,
+                 prices: Optional[Dict[str, float]] = None, fill_model: Optional[FillModel] = None,
+                 clock: Optional[Clock] = None):
+        self.clock = clock or default_clock  # Reloj real o simulado para todos los timestamps
         self.initial_balance = initial_balance
         self.current_balance = initial_balance
         self.positions: Dict[str, PaperPosition] = {}
-        self.orders: List[PaperOrder] = []
-        self.trade_history: List[Dict] = []
-        self.current_prices: Dict[str, float] = {}
+        self.orders: Dict[str, PaperOrder] = {}  # Órdenes pendientes por id
+        self.order_books: Dict[str, OrderBook] = {}
+        self.trade_log = TradeLog(retention=trade_log_retention or settings.paper_trade_log_retention)
+        self.ledger = TradeLedger(method=settings.paper_lot_method)  # Round trips por lotes
+        # Tabla de precios propia o compartida entre cuentas
+        self._shared_prices = prices is not None
+        self.current_prices: Dict[str, float] = prices if prices is not None else {}
         self.transaction_fee = 0.001  # 0.1% fee
+        # Modelo de ejecución (slippage, liquidez) y última vela conocida por símbolo
+        self.fill_model = fill_model or build_fill_model(settings.paper_fill_model)
+        self.last_candles: Dict[str, Candle] = {}
+        self.journal = None  # PaperJournal opcional: registra cada mutación para recuperación
+        self.trade_sink: Optional[Callable[[Dict], None]] = None  # Persistencia write-behind de fills
+        # Estado compartido opcional (Redis): valida los fills de forma atómica entre workers
+        self.shared_state = None
+        self.state_seq = 0  # Última secuencia del estado compartido aplicada
+        self._reset_aggregates()
+    
+    def _reset_aggregates(self):
+        """Totales acumulados que se actualizan en cada fill y en cada marca de precio"""
+        self._positions_value = 0.0
+        self._unrealized_pnl = 0.0
+        self._realized_pnl = 0.0
+        self._total_fees = 0.0
+        self._num_trades = 0
     
-    def update_market_price(self, symbol: str, price: float):
-        """Actualiza precio de mercado para un símbolo"""
+    # El valor de una posición se deriva de su última marca (costo + PnL no realizado)
+    # y no de la tabla de precios, que puede ser compartida y cambiar por otra cuenta
+    def _remove_position_aggregates(self, symbol: str):
+        pos = self.positions.get(symbol)
+        if pos is not None:
+            self._positions_value -= pos.quantity * pos.avg_entry_price + pos.unrealized_pnl
+            self._unrealized_pnl -= pos.unrealized_pnl
+    
+    def _add_position_aggregates(self, symbol: str):
+        pos = self.positions.get(symbol)
+        if pos is not None:
+            self._positions_value += pos.quantity * pos.avg_entry_price + pos.unrealized_pnl
+            self._unrealized_pnl += pos.unrealized_pnl
+        elif not self.positions:
+            # Sin posiciones abiertas: evitar arrastrar error de redondeo
+            self._positions_value = 0.0
+            self._unrealized_pnl = 0.0
+    
+    def update_market_price(self, symbol: str, price: float, candle: Optional[Candle] = None) -> List[Dict]:
+        """Actualiza precio de mercado para un símbolo y ejecuta órdenes pendientes cruzadas.
+
+        Con `candle` (cerrada), las órdenes pendientes que ya existían al abrirse se
+        cruzan contra su rango high/low, y su volumen alimenta el modelo de ejecución.
+        """
+        if self.journal is not None:
+            self.journal.record_mark(symbol, price)
+        if candle is not None:
+            self.last_candles[symbol] = candle
+        self._remove_position_aggregates(symbol)
         self.current_prices[symbol] = price
         self._update_unrealized_pnl(symbol)
+        self._add_position_aggregates(symbol)
+        return self._match_pending_orders(symbol, price, candle)
     
     def place_order(self, symbol: str, side: OrderSide, quantity: float, 
                    order_type: str = "MARKET", price: Optional[float] = None) -> Dict:
         """Coloca una orden de paper trading"""
         
         # Validaciones básicas
+        if order_type not in ORDER_TYPES:
+            return {"error": f"Tipo de orden no soportado: {order_type}"}
+        if quantity <= 0:
+            return {"error": "La cantidad debe ser positiva"}
+        
         if order_type == "MARKET":
             if symbol not in self.current_prices:
                 return {"error": "No hay precio de mercado disponible"}
             execution_price = self.current_prices[symbol]
         else:
+            if price is None or price <= 0:
+                return {"error": f"Las órdenes {order_type} requieren precio"}
             execution_price = price
         
-        # Agregar slippage realista para órdenes de mercado
-        if order_type == "MARKET":
-            slippage = 0.0005  # 0.05% slippage
-            if side == OrderSide.BUY:
-                execution_price *= (1 + slippage)
-            else:
-                execution_price *= (1 - slippage)
-        
         # Crear orden
         order = PaperOrder(
             id=str(uuid.uuid4()),
@@ -87,77 +150,492 @@ class PaperTradingEngine:
             price=execution_price,
             order_type=order_type,
             status=OrderStatus.PENDING,
-            created_at=datetime.now()
+            created_at=self.clock.now()
         )
         
         # Ejecutar inmediatamente para MARKET orders
         if order_type == "MARKET":
-            return self._execute_order(order)
+            return self._execute_order(order, *self._market_fill(symbol, side, quantity, execution_price))
         
-        self.orders.append(order)
-        return {"order_id": order.id, "status": "PENDING"}
-    
-    def _execute_order(self, order: PaperOrder) -> Dict:
-        """Ejecuta una orden de paper trading"""
+        # Si el nivel ya está cruzado se ejecuta contra el precio actual
+        market_price = self.current_prices.get(symbol)
+        if market_price is not None and self._is_crossed(order, market_price, market_price):
+            return self._execute_order(order, *self._trigger_fill(order, market_price))
         
-        # Calcular costos de transacción
-        transaction_cost = order.quantity * order.price * self.transaction_fee
+        self._book_order(order)
+        if self.journal is not None:
+            self.journal.record_place(order)
+        return {
+            "order_id": order.id,
+            "status": "PENDING",
+            "order_type": order.order_type,
+            "price": order.price
+        }
+    
+    def cancel_order(self, order_id: str) -> Dict:
+        """Cancela una orden pendiente"""
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return {"error": f"Orden pendiente no encontrada: {order_id}"}
         
-        # Verificar saldo disponible para compras
-        if order.side == OrderSide.BUY:
-            required_balance = (order.quantity * order.price) + transaction_cost
-            if required_balance > self.current_balance:
-                order.status = OrderStatus.REJECTED
-                return {"error": "Saldo insuficiente", "order_id": order.id}
+        self._book(order.symbol).cancel(order_id)
+        order.status = OrderStatus.CANCELLED
+        if self.journal is not None:
+            self.journal.record_cancel(order_id)
+        return {"order_id": order_id, "status": order.status.value}
+    
+    def amend_order(self, order_id: str, price: Optional[float] = None,
+                    quantity: Optional[float] = None) -> Dict:
+        """Modifica precio y/o cantidad de una orden pendiente"""
+        order = self.orders.get(order_id)
+        if order is None:
+            return {"error": f"Orden pendiente no encontrada: {order_id}"}
+        if price is not None and price <= 0:
+            return {"error": "El precio debe ser positivo"}
+        if quantity is not None and quantity <= 0:
+            return {"error": "La cantidad debe ser positiva"}
         
-        # Verificar posición disponible para ventas
-        elif order.side == OrderSide.SELL:
-            position = self.positions.get(order.symbol)
-            if not position or position.quantity < order.quantity:
-                order.status = OrderStatus.REJECTED
-                return {"error": "Posición insuficiente", "order_id": order.id}
+        if self.journal is not None:
+            self.journal.record_amend(order_id, price, quantity)
+        self._apply_amend(order, price, quantity)
+        if price is not None:
+            market_price = self.current_prices.get(order.symbol)
+            if market_price is not None and self._is_crossed(order, market_price, market_price):
+                self._book(order.symbol).cancel(order_id)
+                return self._execute_pending(order, market_price)
         
-        # Ejecutar orden
-        order.status = OrderStatus.FILLED
-        order.filled_at = datetime.now()
-        order.filled_price = order.price
-        order.filled_quantity = order.quantity
+        return self._order_to_dict(order)
+    
+    def place_orders_batch(self, orders: List[Dict], atomic: bool = False) -> Dict:
+        """Coloca varias órdenes validadas contra un mismo snapshot de balance y precios.
+
+        Cada orden es un dict con symbol, side (OrderSide), quantity, order_type y price.
+        - atomic=True: si alguna orden no pasa la validación no se ejecuta ninguna.
+        - atomic=False: se ejecutan las órdenes válidas y se reportan las rechazadas.
+        Las órdenes se validan y ejecutan en el orden recibido, así que las ventas
+        listadas antes liberan saldo para las compras posteriores.
+        """
+        errors = self._validate_batch(orders)
+
+        if atomic and any(errors):
+            return {
+                "executed": False,
+                "results": [
+                    {"index": i, "error": error or "No ejecutada: el lote es atómico y otra orden fue rechazada"}
+                    for i, error in enumerate(errors)
+                ]
+            }
+
+        results = []
+        for i, (order, error) in enumerate(zip(orders, errors)):
+            if error:
+                results.append({"index": i, "error": error})
+                continue
+            result = self.place_order(
+                symbol=order["symbol"],
+                side=order["side"],
+                quantity=order["quantity"],
+                order_type=order.get("order_type", "MARKET"),
+                price=order.get("price")
+            )
+            result["index"] = i
+            results.append(result)
+
+        return {"executed": True, "results": results}
+
+    def _validate_batch(self, orders: List[Dict]) -> List[Optional[str]]:
+        """Simula el lote sobre una proyección de balance y posiciones sin mutar el engine"""
+        balance = self.current_balance
+        holdings = {symbol: pos.quantity for symbol, pos in self.positions.items()}
+        errors: List[Optional[str]] = []
+
+        # Ejecuciones de las órdenes a mercado, calculadas vectorizadas por símbolo
+        market_orders: Dict[str, List[int]] = {}
+        for i, order in enumerate(orders):
+            if (order.get("order_type", "MARKET") == "MARKET" and order["quantity"] > 0
+                    and order["symbol"] in self.current_prices):
+                market_orders.setdefault(order["symbol"], []).append(i)
+        market_fills: Dict[int, Tuple[float, float]] = {}
+        for symbol, indexes in market_orders.items():
+            fill_prices, fill_quantities = self.fill_model.market_fills(
+                symbol,
+                np.array([orders[i]["side"] == OrderSide.BUY for i in indexes]),
+                np.array([orders[i]["quantity"] for i in indexes], dtype=float),
+                self.current_prices[symbol],
+                self.last_candles.get(symbol)
+            )
+            for i, fill_price, fill_quantity in zip(indexes, fill_prices, fill_quantities):
+                market_fills[i] = (float(fill_price), float(fill_quantity))
+
+        for i, order in enumerate(orders):
+            symbol = order["symbol"]
+            side = order["side"]
+            quantity = order["quantity"]
+            order_type = order.get("order_type", "MARKET")
+            price = order.get("price")
+            market_price = self.current_prices.get(symbol)
+
+            if order_type not in ORDER_TYPES:
+                errors.append(f"Tipo de orden no soportado: {order_type}")
+                continue
+            if quantity <= 0:
+                errors.append("La cantidad debe ser positiva")
+                continue
+
+            if order_type == "MARKET":
+                if market_price is None:
+                    errors.append("No hay precio de mercado disponible")
+                    continue
+                fill_price, quantity = market_fills[i]
+            else:
+                if price is None or price <= 0:
+                    errors.append(f"Las órdenes {order_type} requieren precio")
+                    continue
+                probe = PaperOrder(
+                    id="", symbol=symbol, side=side, quantity=quantity, price=price,
+                    order_type=order_type, status=OrderStatus.PENDING, created_at=self.clock.now()
+                )
+                if market_price is None or not self._is_crossed(probe, market_price, market_price):
+                    # Queda pendiente en el libro: no consume saldo al colocarse
+                    errors.append(None)
+                    continue
+                fill_price, quantity = self._trigger_fill(probe, market_price)
+
+            if quantity <= 0:
+                errors.append("Sin liquidez para ejecutar la orden")
+                continue
+            notional = quantity * fill_price
+            if side == OrderSide.BUY:
+                required_balance = notional + notional * self.transaction_fee
+                if required_balance > balance:
+                    errors.append("Saldo insuficiente")
+                    continue
+                balance -= required_balance
+                holdings[symbol] = holdings.get(symbol, 0.0) + quantity
+            else:
+                if holdings.get(symbol, 0.0) < quantity:
+                    errors.append("Posición insuficiente")
+                    continue
+                balance += notional - notional * self.transaction_fee
+                holdings[symbol] -= quantity
+            errors.append(None)
+
+        return errors
+
+    def _book_order(self, order: PaperOrder):
+        self.orders[order.id] = order
+        self._book(order.symbol).add(order.id, order.price, self._triggers_below(order))
+    
+    def _apply_amend(self, order: PaperOrder, price: Optional[float], quantity: Optional[float]):
+        if quantity is not None:
+            order.quantity = quantity
+        if price is not None and price != order.price:
+            order.price = price
+            self._book(order.symbol).amend(order.id, price, self._triggers_below(order))
+    
+    def get_open_orders(self, symbol: Optional[str] = None) -> List[Dict]:
+        """Lista órdenes pendientes, opcionalmente filtradas por símbolo"""
+        return [
+            self._order_to_dict(order)
+            for order in self.orders.values()
+            if symbol is None or order.symbol == symbol
+        ]
+    
+    def _book(self, symbol: str) -> OrderBook:
+        book = self.order_books.get(symbol)
+        if book is None:
+            book = self.order_books[symbol] = OrderBook(symbol)
+        return book
+    
+    @staticmethod
+    def _triggers_below(order: PaperOrder) -> bool:
+        """True si la orden se dispara cuando el precio baja hasta su nivel"""
+        is_buy = order.side == OrderSide.BUY
+        if order.order_type == "STOP_LOSS":
+            return not is_buy
+        return is_buy  # LIMIT y TAKE_PROFIT
+    
+    def _is_crossed(self, order: PaperOrder, low: float, high: float) -> bool:
+        if self._triggers_below(order):
+            return low <= order.price
+        return high >= order.price
+    
+    def _market_fill(self, symbol: str, side: OrderSide, quantity: float, price: float) -> Tuple[float, float]:
+        """Precio y cantidad de ejecución a mercado según el modelo de ejecución"""
+        return self.fill_model.market_fill(
+            symbol, side == OrderSide.BUY, quantity, price, self.last_candles.get(symbol)
+        )
+    
+    def _trigger_fill(self, order: PaperOrder, market_price: float,
+                      candle: Optional[Candle] = None) -> Tuple[float, float]:
+        """Precio y cantidad de ejecución de una orden pendiente cruzada"""
+        if candle is not None:
+            # Cruzada dentro de la vela: se ejecuta en su nivel, o en la apertura si hubo gap
+            if self._triggers_below(order):
+                reference = min(order.price, candle.open)
+            else:
+                reference = max(order.price, candle.open)
+        elif order.order_type == "LIMIT":
+            # Nunca peor que el límite; mejor si el mercado ya lo superó
+            if order.side == OrderSide.BUY:
+                reference = min(order.price, market_price)
+            else:
+                reference = max(order.price, market_price)
+        else:
+            reference = market_price
         
-        # Actualizar posiciones y balance
-        self._update_position(order, transaction_cost)
+        if order.order_type == "LIMIT":
+            return reference, order.quantity
+        # STOP_LOSS / TAKE_PROFIT se ejecutan como orden a mercado
+        return self._market_fill(order.symbol, order.side, order.quantity, reference)
+    
+    def _match_pending_orders(self, symbol: str, price: float, candle: Optional[Candle] = None) -> List[Dict]:
+        """Ejecuta las órdenes pendientes cruzadas por el nuevo precio (o por el rango de la vela)"""
+        book = self.order_books.get(symbol)
+        if not book:
+            return []
         
-        # Registrar trade
-        trade_record = {
-            "id": order.id,
+        low, high = (candle.low, candle.high) if candle is not None else (price, price)
+        fills = []
+        for order_id in book.match(low, high):
+            order = self.orders[order_id]
+            if candle is None or self._existed_during(order, candle):
+                fills.append(self._execute_pending(order, price, candle))
+            elif self._is_crossed(order, price, price):
+                # Posterior a la apertura de la vela: solo cuenta el precio actual
+                fills.append(self._execute_pending(order, price))
+            else:
+                # El rango de la vela es anterior a la orden: vuelve al libro
+                book.add(order.id, order.price, self._triggers_below(order))
+        return fills
+    
+    def _existed_during(self, order: PaperOrder, candle: Candle) -> bool:
+        """True si la orden ya estaba en el libro al abrirse la vela (ambos en epoch UTC)"""
+        return candle.open_time is None or self.clock.epoch(order.created_at) <= candle.open_time
+    
+    def _execute_pending(self, order: PaperOrder, market_price: float, candle: Optional[Candle] = None) -> Dict:
+        """Ejecuta una orden pendiente ya retirada del libro"""
+        del self.orders[order.id]
+        result = self._execute_order(order, *self._trigger_fill(order, market_price, candle))
+        if "error" in result and self.journal is not None:
+            # Rechazada al dispararse: sale del libro sin fill
+            self.journal.record_cancel(order.id)
+        return result
+    
+    @staticmethod
+    def _order_to_dict(order: PaperOrder) -> Dict:
+        return {
+            "order_id": order.id,
             "symbol": order.symbol,
             "side": order.side.value,
             "quantity": order.quantity,
             "price": order.price,
-            "transaction_cost": transaction_cost,
-            "timestamp": order.filled_at,
-            "balance_after": self.current_balance
+            "order_type": order.order_type,
+            "status": order.status.value,
+            "created_at": order.created_at
         }
-        self.trade_history.append(trade_record)
+    
+    def _execute_order(self, order: PaperOrder, fill_price: Optional[float] = None,
+                       fill_quantity: Optional[float] = None) -> Dict:
+        """Ejecuta una orden de paper trading.
+
+        Si el modelo de ejecución solo llena parte de la cantidad, se ejecuta esa
+        parte y el resto se cancela (immediate-or-cancel).
+        """
+        
+        fill_price = order.price if fill_price is None else fill_price
+        requested_quantity = order.quantity
+        if fill_quantity is not None and fill_quantity < order.quantity:
+            if fill_quantity <= 0:
+                order.status = OrderStatus.REJECTED
+                return {"error": "Sin liquidez para ejecutar la orden", "order_id": order.id}
+            order.quantity = fill_quantity
+        
+        # Calcular costos de transacción
+        transaction_cost = order.quantity * fill_price * self.transaction_fee
+        
+        # Con estado compartido, saldo y posición se validan en el backend (atómico)
+        if self.shared_state is None:
+            # Verificar saldo disponible para compras
+            if order.side == OrderSide.BUY:
+                required_balance = (order.quantity * fill_price) + transaction_cost
+                if required_balance > self.current_balance:
+                    order.status = OrderStatus.REJECTED
+                    return {"error": "Saldo insuficiente", "order_id": order.id}
+            
+            # Verificar posición disponible para ventas
+            elif order.side == OrderSide.SELL:
+                position = self.positions.get(order.symbol)
+                if not position or position.quantity < order.quantity:
+                    order.status = OrderStatus.REJECTED
+                    return {"error": "Posición insuficiente", "order_id": order.id}
+        
+        # Ejecutar orden
+        order.filled_at = self.clock.now()
+        order.filled_price = fill_price
+        order.filled_quantity = order.quantity
+        if self.shared_state is not None:
+            fill = self.shared_state.fill(order, transaction_cost)
+            if "error" in fill:
+                order.status = OrderStatus.REJECTED
+                return {"error": fill["error"], "order_id": order.id}
+            order.status = OrderStatus.FILLED
+            self.apply_shared_fill(fill, order)
+        else:
+            order.status = OrderStatus.FILLED
+            self._apply_fill(order, transaction_cost)
         
-        logger.info(f"✅ Paper Trade: {order.side.value} {order.quantity:.6f} {order.symbol} @ {order.price:.4f}")
+        logger.info(f"✅ Paper Trade: {order.side.value} {order.quantity:.6f} {order.symbol} @ {fill_price:.4f} ({order.order_type})")
         
         return {
             "order_id": order.id,
-            "status": "FILLED",
-            "filled_price": order.price,
+            "status": "FILLED" if order.quantity == requested_quantity else "PARTIALLY_FILLED",
+            "order_type": order.order_type,
+            "filled_price": fill_price,
             "filled_quantity": order.quantity,
+            "requested_quantity": requested_quantity,
             "transaction_cost": transaction_cost
         }
     
-    def _update_position(self, order: PaperOrder, transaction_cost: float):
-        """Actualiza posiciones después de ejecutar orden"""
+    def _apply_fill(self, order: PaperOrder, transaction_cost: float):
+        """Aplica un fill ya validado (también al reproducir el journal, sin revalidar)"""
+        if self.journal is not None:
+            self.journal.record_fill(order, transaction_cost)
+        
+        # Actualizar posiciones, balance y totales acumulados
+        self._remove_position_aggregates(order.symbol)
+        realized_pnl = self._update_position(order, transaction_cost)
+        self._update_unrealized_pnl(order.symbol)
+        self._add_position_aggregates(order.symbol)
+        self._update_trade_aggregates(order, transaction_cost, realized_pnl)
+        
+        # Registrar trade
+        self.trade_log.append(
+            order_id=order.id,
+            symbol=order.symbol,
+            side=order.side.value,
+            order_type=order.order_type,
+            quantity=order.quantity,
+            price=order.filled_price,
+            transaction_cost=transaction_cost,
+            timestamp=order.filled_at,
+            balance_after=self.current_balance
+        )
+        
+        if self.trade_sink is not None:
+            self.trade_sink(self._fill_record(order, realized_pnl))
+    
+    def apply_shared_fill(self, fill: Dict, order: Optional[PaperOrder] = None):
+        """Aplica un fill validado por el estado compartido con sus valores autoritativos.
+
+        Antes y después del fill se fijan el balance y la posición publicados, así la
+        copia local converge aunque se haya perdido un evento. Un fill con secuencia
+        ya superada solo se agrega al historial, sin tocar balance ni posición.
+        """
+        if order is None:
+            # Fill de otro worker
+            filled_at = datetime.fromtimestamp(fill["timestamp"])
+            order = PaperOrder(
+                id=fill["order_id"], symbol=fill["symbol"], side=OrderSide(fill["side"]),
+                quantity=fill["quantity"], price=fill["price"], order_type=fill["order_type"],
+                status=OrderStatus.FILLED, created_at=filled_at, filled_at=filled_at,
+                filled_price=fill["price"], filled_quantity=fill["quantity"]
+            )
+        symbol = order.symbol
+        stale = fill["seq"] <= self.state_seq
+        current = self._position_state(symbol)
+        self._set_position_state(symbol, fill["balance_before"], fill["position_before"], fill["avg_before"])
+        self._apply_fill(order, fill["fee"])
+        if stale:
+            self._set_position_state(symbol, *current)
+        else:
+            self._set_position_state(symbol, fill["balance"], fill["position"], fill["avg_entry_price"])
+            self.state_seq = fill["seq"]
+    
+    def apply_shared_reset(self, event: Dict):
+        """Aplica un reset publicado por otro worker"""
+        if event["seq"] > self.state_seq:
+            self.state_seq = event["seq"]
+            self._reset_state(event["balance"])
+    
+    def sync_shared_state(self, balance: float, initial_balance: float,
+                          positions: Dict[str, Tuple[float, float]]):
+        """Alinea balance y posiciones con el estado compartido (al arrancar un worker)"""
+        self.initial_balance = initial_balance
+        for symbol in list(self.positions):
+            if symbol not in positions:
+                self._set_position_state(symbol, balance, 0.0, 0.0)
+        for symbol, (quantity, avg_entry_price) in positions.items():
+            self._set_position_state(symbol, balance, quantity, avg_entry_price)
+        self.current_balance = balance
+    
+    def _position_state(self, symbol: str) -> Tuple[float, float, float]:
+        pos = self.positions.get(symbol)
+        if pos is None:
+            return self.current_balance, 0.0, 0.0
+        return self.current_balance, pos.quantity, pos.avg_entry_price
+    
+    def _set_position_state(self, symbol: str, balance: float, quantity: float, avg_entry_price: float):
+        """Fija balance y posición de un símbolo manteniendo los totales acumulados"""
+        self._remove_position_aggregates(symbol)
+        self.current_balance = balance
+        pos = self.positions.get(symbol)
+        if quantity <= 0:
+            self.positions.pop(symbol, None)
+        elif pos is None:
+            self.positions[symbol] = PaperPosition(
+                symbol=symbol,
+                quantity=quantity,
+                avg_entry_price=avg_entry_price,
+                unrealized_pnl=0.0,
+                realized_pnl=0.0,
+                created_at=self.clock.now()
+            )
+        else:
+            pos.quantity = quantity
+            pos.avg_entry_price = avg_entry_price
+        self._update_unrealized_pnl(symbol)
+        self._add_position_aggregates(symbol)
+    
+    @staticmethod
+    def _fill_record(order: PaperOrder, realized_pnl: Optional[float]) -> Dict:
+        """Fila de paper_trades: las compras abren (OPEN) y las ventas cierran (CLOSED)"""
+        if realized_pnl is None:
+            return {
+                "id": order.id, "symbol": order.symbol, "side": order.side.value,
+                "quantity": order.quantity, "entry_price": order.filled_price, "exit_price": None,
+                "pnl": None, "pnl_percentage": None, "status": "OPEN",
+                "created_at": order.filled_at, "closed_at": None
+            }
+        entry_price = order.filled_price - realized_pnl / order.quantity
+        return {
+            "id": order.id, "symbol": order.symbol, "side": order.side.value,
+            "quantity": order.quantity, "entry_price": entry_price, "exit_price": order.filled_price,
+            "pnl": realized_pnl, "pnl_percentage": realized_pnl / (entry_price * order.quantity) * 100,
+            "status": "CLOSED", "created_at": order.filled_at, "closed_at": order.filled_at
+        }
+    
+    def _update_trade_aggregates(self, order: PaperOrder, transaction_cost: float,
+                                 realized_pnl: Optional[float]):
+        """Actualiza contadores de trades y fees, y empareja el fill con los lotes abiertos"""
+        self._num_trades += 1
+        self._total_fees += transaction_cost
+        if realized_pnl is None:
+            self.ledger.buy(order.symbol, order.quantity, order.filled_price, transaction_cost, order.filled_at)
+            return
+        
+        self._realized_pnl += realized_pnl
+        self.ledger.sell(order.symbol, order.quantity, order.filled_price, transaction_cost, order.filled_at)
+    
+    def _update_position(self, order: PaperOrder, transaction_cost: float) -> Optional[float]:
+        """Actualiza posiciones después de ejecutar orden; devuelve el PnL realizado en ventas"""
         symbol = order.symbol
         
         if order.side == OrderSide.BUY:
             # Compra: agregar a posición o crear nueva
             if symbol in self.positions:
                 pos = self.positions[symbol]
-                total_cost = (pos.quantity * pos.avg_entry_price) + (order.quantity * order.price)
+                total_cost = (pos.quantity * pos.avg_entry_price) + (order.quantity * order.filled_price)
                 total_quantity = pos.quantity + order.quantity
                 pos.avg_entry_price = total_cost / total_quantity
                 pos.quantity = total_quantity
@@ -165,36 +643,39 @@ class PaperTradingEngine:
                 self.positions[symbol] = PaperPosition(
                     symbol=symbol,
                     quantity=order.quantity,
-                    avg_entry_price=order.price,
+                    avg_entry_price=order.filled_price,
                     unrealized_pnl=0.0,
                     realized_pnl=0.0,
-                    created_at=datetime.now()
+                    created_at=order.filled_at or self.clock.now()
                 )
             
             # Reducir balance (incluir costos de transacción)
-            self.current_balance -= (order.quantity * order.price) + transaction_cost
+            self.current_balance -= (order.quantity * order.filled_price) + transaction_cost
+            return None
         
         else:  # SELL
             # Venta: reducir posición
             pos = self.positions[symbol]
             
             # Calcular PnL realizado
-            realized_pnl = (order.price - pos.avg_entry_price) * order.quantity
+            realized_pnl = (order.filled_price - pos.avg_entry_price) * order.quantity
             pos.realized_pnl += realized_pnl
             
             # Actualizar posición
             pos.quantity -= order.quantity
             
             # Aumentar balance (menos costos de transacción)
-            self.current_balance += (order.quantity * order.price) - transaction_cost
+            self.current_balance += (order.quantity * order.filled_price) - transaction_cost
             
             # Eliminar posición si está cerrada
             if pos.quantity <= 0:
                 del self.positions[symbol]
+            
+            return realized_pnl
     
     def _update_unrealized_pnl(self, symbol: str):
         """Actualiza PnL no realizado para un símbolo"""
-        if symbol in self.positions:
+        if symbol in self.positions and symbol in self.current_prices:
             pos = self.positions[symbol]
             current_price = self.current_prices[symbol]
             pos.unrealized_pnl = (current_price - pos.avg_entry_price) * pos.quantity
@@ -212,99 +693,120 @@ class PaperTradingEngine:
             order_type="MARKET"
         )
     
-    def get_portfolio_summary(self) -> Dict:
-        """Obtiene resumen del portfolio"""
-        total_unrealized_pnl = sum(pos.unrealized_pnl for pos in self.positions.values())
-        total_realized_pnl = sum(pos.realized_pnl for pos in self.positions.values())
-        
-        # Calcular valor total del portfolio
-        positions_value = sum(
-            pos.quantity * self.current_prices.get(pos.symbol, pos.avg_entry_price) 
+    def get_positions(self) -> List[Dict]:
+        """Obtiene las posiciones abiertas con su valor de mercado"""
+        return [
+            {
+                "symbol": pos.symbol,
+                "quantity": pos.quantity,
+                "avg_entry_price": pos.avg_entry_price,
+                "current_price": self.current_prices.get(pos.symbol, 0),
+                "market_value": pos.quantity * self.current_prices.get(pos.symbol, pos.avg_entry_price),
+                "unrealized_pnl": pos.unrealized_pnl,
+                "unrealized_pnl_percentage": (pos.unrealized_pnl / (pos.avg_entry_price * pos.quantity)) * 100,
+                "realized_pnl": pos.realized_pnl
+            }
             for pos in self.positions.values()
-        )
-        total_value = self.current_balance + positions_value
+        ]
+    
+    def get_portfolio_summary(self, include_positions: bool = True) -> Dict:
+        """Obtiene resumen del portfolio (O(1) sin el detalle de posiciones)"""
+        total_value = self.current_balance + self._positions_value
         
         # Calcular retorno total
         total_return = ((total_value - self.initial_balance) / self.initial_balance) * 100
         
-        return {
+        summary = {
             "initial_balance": self.initial_balance,
             "current_balance": self.current_balance,
-            "positions_value": positions_value,
+            "positions_value": self._positions_value,
             "total_value": total_value,
             "total_pnl": total_value - self.initial_balance,
             "total_return_percentage": total_return,
-            "unrealized_pnl": total_unrealized_pnl,
-            "realized_pnl": total_realized_pnl,
+            "unrealized_pnl": self._unrealized_pnl,
+            "realized_pnl": self._realized_pnl,
             "num_positions": len(self.positions),
-            "num_trades": len(self.trade_history),
-            "positions": [
-                {
-                    "symbol": pos.symbol,
-                    "quantity": pos.quantity,
-                    "avg_entry_price": pos.avg_entry_price,
-                    "current_price": self.current_prices.get(pos.symbol, 0),
-                    "market_value": pos.quantity * self.current_prices.get(pos.symbol, pos.avg_entry_price),
-                    "unrealized_pnl": pos.unrealized_pnl,
-                    "unrealized_pnl_percentage": (pos.unrealized_pnl / (pos.avg_entry_price * pos.quantity)) * 100,
-                    "realized_pnl": pos.realized_pnl
-                }
-                for pos in self.positions.values()
-            ]
+            "num_trades": self._num_trades
         }
+        if include_positions:
+            summary["positions"] = self.get_positions()
+        return summary
     
     def get_trade_statistics(self) -> Dict:
-        """Obtiene estadísticas de trading"""
-        if not self.trade_history:
+        """Obtiene estadísticas de trading por round trip (lotes cerrados, netos de fees)"""
+        if not self._num_trades:
             return {"message": "No hay trades registrados"}
         
-        # Separar compras y ventas
-        buys = [t for t in self.trade_history if t["side"] == "BUY"]
-        sells = [t for t in self.trade_history if t["side"] == "SELL"]
-        
-        # Calcular estadísticas básicas
-        total_trades = len(self.trade_history)
-        total_fees = sum(t.get("transaction_cost", 0) for t in self.trade_history)
-        
-        # Calcular trades cerrados (simplificado)
-        winning_trades = 0
-        losing_trades = 0
-        total_profit = 0
-        total_loss = 0
-        
-        for pos in self.positions.values():
-            if pos.realized_pnl > 0:
-                winning_trades += 1
-                total_profit += pos.realized_pnl
-            elif pos.realized_pnl < 0:
-                losing_trades += 1
-                total_loss += abs(pos.realized_pnl)
-        
-        win_rate = (winning_trades / (winning_trades + losing_trades)) * 100 if (winning_trades + losing_trades) > 0 else 0
-        
         return {
-            "total_trades": total_trades,
-            "total_fees": total_fees,
-            "winning_trades": winning_trades,
-            "losing_trades": losing_trades,
-            "win_rate": win_rate,
-            "total_profit": total_profit,
-            "total_loss": total_loss,
-            "profit_factor": total_profit / total_loss if total_loss > 0 else float('inf'),
-            "avg_win": total_profit / winning_trades if winning_trades > 0 else 0,
-            "avg_loss": total_loss / losing_trades if losing_trades > 0 else 0
+            "total_trades": self._num_trades,
+            "total_fees": self._total_fees,
+            **self.ledger.statistics()
         }
     
+    def get_round_trips(self, limit: int = 100) -> List[Dict]:
+        """Últimos round trips cerrados (más recientes primero)"""
+        return self.ledger.recent_round_trips(limit)
+    
     def reset_portfolio(self, new_balance: float = 10000.0):
         """Resetea el portfolio a estado inicial"""
+        if self.shared_state is not None:
+            self.state_seq = self.shared_state.reset(new_balance)["seq"]
+        self._reset_state(new_balance)
+    
+    def _reset_state(self, new_balance: float):
+        if self.journal is not None:
+            self.journal.record_reset(new_balance)
         self.initial_balance = new_balance
         self.current_balance = new_balance
         self.positions.clear()
         self.orders.clear()
-        self.trade_history.clear()
-        self.current_prices.clear()
+        self.order_books.clear()
+        self.trade_log.clear()
+        self.ledger.clear()
+        if not self._shared_prices:
+            self.current_prices.clear()
+        self._reset_aggregates()
         
         logger.info(f"🔄 Portfolio reseteado con balance: ${new_balance:,.2f}")
-
-# Instancia global del paper trading engine
-paper_engine = PaperTradingEngine()
+    
+    def export_state(self) -> Dict:
+        """Estado completo del engine para un snapshot del journal"""
+        symbols = set(self.positions) | {order.symbol for order in self.orders.values()}
+        return {
+            "initial_balance": self.initial_balance,
+            "current_balance": self.current_balance,
+            "positions": self.positions,
+            "orders": list(self.orders.values()),
+            "prices": {s: self.current_prices[s] for s in symbols if s in self.current_prices},
+            "trade_log": self.trade_log,
+            "ledger": self.ledger,
+            "aggregates": {
+                name: getattr(self, name)
+                for name in ("_realized_pnl", "_total_fees", "_num_trades")
+            }
+        }
+    
+    def restore_state(self, state: Dict):
+        """Restaura el engine desde un snapshot del journal"""
+        self.initial_balance = state["initial_balance"]
+        self.current_balance = state["current_balance"]
+        self.positions = state["positions"]
+        self.orders = {}
+        self.order_books = {}
+        for order in state["orders"]:
+            self._book_order(order)
+        self.current_prices.update(state["prices"])
+        self.trade_log = state["trade_log"]
+        self.ledger = state["ledger"]
+        self._reset_aggregates()
+        for name, value in state["aggregates"].items():
+            setattr(self, name, value)
+        self.recompute_position_aggregates()
+    
+    def recompute_position_aggregates(self):
+        """Recalcula PnL no realizado y totales de posiciones con los precios actuales"""
+        self._positions_value = 0.0
+        self._unrealized_pnl = 0.0
+        for symbol in self.positions:
+            self._update_unrealized_pnl(symbol)
+            self._add_position_aggregates(symbol)
@@ -0,0 +1,381 @@
+"""
+Persistencia write-behind de paper trading y learning en Postgres
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import math
+import queue
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Tabla -> (columnas, cláusula de conflicto). Los inserts son idempotentes para
+# poder reintentar un lote completo tras un error de conexión.
+TABLES: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "paper_trades": (
+        ("id", "account_id", "symbol", "side", "quantity", "entry_price", "exit_price",
+         "pnl", "pnl_percentage", "status", "created_at", "closed_at"),
+        "ON CONFLICT (id) DO NOTHING"
+    ),
+    "learning_trades": (
+        ("trade_id", "symbol", "side", "entry_price", "exit_price", "quantity", "pnl",
+         "pnl_percentage", "hold_time_minutes", "market_conditions", "decision_confidence",
+         "created_at"),
+        "ON CONFLICT (trade_id) DO NOTHING"
+    ),
+    "learning_metrics": (
+        ("timestamp", "total_trades", "win_rate", "avg_pnl", "avg_win", "avg_loss", "sharpe_ratio",
+         "max_drawdown", "profit_factor", "confidence_threshold", "market_weights",
+         "optimal_conditions"),
+        ""
+    ),
+}
+
+# Columnas DECIMAL(precisión, escala) de init-db.sql y si admiten NULL: los
+# valores se ajustan a su rango antes de encolar para que una fila no haga
+# fallar el lote entero
+DECIMAL_COLUMNS: Dict[str, Dict[str, Tuple[int, int, bool]]] = {
+    "paper_trades": {
+        "quantity": (18, 8, False), "entry_price": (18, 8, False), "exit_price": (18, 8, True),
+        "pnl": (18, 8, True), "pnl_percentage": (8, 4, True),
+    },
+    "learning_trades": {
+        "entry_price": (18, 8, False), "exit_price": (18, 8, False), "quantity": (18, 8, False),
+        "pnl": (18, 8, False), "pnl_percentage": (8, 4, False), "decision_confidence": (4, 3, True),
+    },
+    "learning_metrics": {
+        "win_rate": (5, 4, False), "avg_pnl": (18, 8, False), "avg_win": (18, 8, True),
+        "avg_loss": (18, 8, True), "sharpe_ratio": (8, 4, True), "max_drawdown": (18, 8, True),
+        "profit_factor": (8, 4, True), "confidence_threshold": (4, 3, True),
+    },
+}
+_DECIMAL_POSITIONS = {
+    table: [(TABLES[table][0].index(column), spec) for column, spec in columns.items()]
+    for table, columns in DECIMAL_COLUMNS.items()
+}
+
+# Errores de una fila concreta (no de conexión): reintentar el lote no sirve
+DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+# Columnas agregadas al esquema de init-db.sql (bases ya inicializadas)
+SCHEMA_UPGRADES = (
+    "ALTER TABLE paper_trades ADD COLUMN IF NOT EXISTS account_id VARCHAR(64) NOT NULL DEFAULT 'default'",
+)
+
+_STOP = object()
+
+
+def _decimal(value: Optional[float], precision: int, scale: int, nullable: bool) -> Optional[float]:
+    """Float nativo dentro del rango de DECIMAL(precision, scale).
+
+    ±inf (p. ej. profit_factor sin pérdidas) se satura al máximo; NaN pasa a
+    NULL, o a 0 si la columna es NOT NULL.
+    """
+    if value is None:
+        return None if nullable else 0.0
+    value = float(value)
+    if math.isnan(value):
+        return None if nullable else 0.0
+    limit = 10 ** (precision - scale) - 10 ** -scale
+    return round(max(-limit, min(limit, value)), scale)
+
+
+def _json(value: Any) -> str:
+    return json.dumps(value, default=float)
+
+
+class PersistenceService:
+    """Escribe trades y métricas en Postgres desde un hilo propio (write-behind).
+
+    - El camino de órdenes solo encola una tupla (`put_nowait`); nunca espera a la BD.
+    - El hilo escritor agrupa filas por tabla y las inserta con un único
+      `INSERT ... VALUES` multi-fila por tabla (execute_values) cuando el lote
+      llega a `batch_size` o pasan `flush_interval` segundos.
+    - Si la cola se llena se descartan filas (y se cuentan) en vez de bloquear.
+    - Si Postgres rechaza una fila, solo esa se descarta (`rows_rejected`); el
+      resto del lote se escribe.
+    """
+
+    def __init__(self, database_url: Optional[str], batch_size: int = 500,
+                 flush_interval: float = 1.0, max_queue: int = 100_000):
+        self.database_url = database_url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+        self.rows_written = {table: 0 for table in TABLES}
+        self.rows_dropped = 0
+        self.rows_rejected = 0  # Filas que Postgres rechazó (descartadas de una en una)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.database_url)
+
+    # ------------------------------------------------------------------ productores
+
+    def _enqueue(self, table: str, row: tuple):
+        row = list(row)
+        for i, spec in _DECIMAL_POSITIONS[table]:
+            row[i] = _decimal(row[i], *spec)
+        try:
+            self._queue.put_nowait((table, tuple(row)))
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logger.warning(f"⚠️ Cola de persistencia llena: {self.rows_dropped} filas descartadas")
+
+    def paper_trade_sink(self, account_id: str) -> Callable[[Dict], None]:
+        """Sink de fills del paper engine para una cuenta"""
+        def sink(fill: Dict):
+            self._enqueue("paper_trades", (
+                fill["id"], account_id, fill["symbol"], fill["side"], fill["quantity"],
+                fill["entry_price"], fill["exit_price"], fill["pnl"],
+                fill["pnl_percentage"], fill["status"], fill["created_at"], fill["closed_at"]
+            ))
+        return sink
+
+    def record_learning_trade(self, outcome):
+        self._enqueue("learning_trades", (
+            outcome.trade_id, outcome.symbol, outcome.side, outcome.entry_price, outcome.exit_price,
+            outcome.quantity, outcome.pnl, outcome.pnl_percentage,
+            int(outcome.hold_time_minutes), _json(outcome.market_conditions),
+            outcome.decision_confidence, outcome.timestamp
+        ))
+
+    def record_learning_metrics(self, record: Dict):
+        metrics = record["metrics"]
+        params = record["learning_parameters"]
+        self._enqueue("learning_metrics", (
+            record["timestamp"], int(metrics.total_trades), metrics.win_rate,
+            metrics.avg_pnl, metrics.avg_win, metrics.avg_loss,
+            metrics.sharpe_ratio, metrics.max_drawdown,
+            metrics.profit_factor, params["confidence_threshold"],
+            _json(params["market_weights"]), _json(params["optimal_conditions"])
+        ))
+
+    # ------------------------------------------------------------------ escritor
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name="pg-write-behind", daemon=True)
+        self._thread.start()
+        logger.info("🗄️ Persistencia write-behind en Postgres iniciada")
+
+    def stop(self, timeout: float = 10.0):
+        """Vacía la cola pendiente y detiene el hilo escritor"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        logger.info("🗄️ Persistencia write-behind detenida")
+
+    def _run(self):
+        pending: Dict[str, List[tuple]] = {table: [] for table in TABLES}
+        count = 0
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is _STOP:
+                    stopping = True
+                else:
+                    table, row = item
+                    pending[table].append(row)
+                    count += 1
+            except queue.Empty:
+                pass
+
+            # Drenar lo que ya está en la cola sin esperar
+            while count < self.batch_size and not stopping:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    table, row = item
+                    pending[table].append(row)
+                    count += 1
+
+            if count and (count >= self.batch_size or stopping or time.monotonic() >= deadline):
+                if self._flush(pending):
+                    count = 0
+                elif count > self.max_queue:
+                    # BD caída demasiado tiempo: descartar el lote más viejo
+                    self.rows_dropped += count
+                    logger.error(f"Persistencia: {count} filas descartadas tras errores repetidos")
+                    for rows in pending.values():
+                        rows.clear()
+                    count = 0
+                elif stopping:
+                    logger.error(f"Persistencia: {count} filas sin escribir al detener")
+                    break
+                else:
+                    # Lo ya escrito al aislar filas inválidas sale de pending
+                    count = sum(len(rows) for rows in pending.values())
+                    time.sleep(self.flush_interval)  # Esperar antes de reintentar
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+            if stopping and not count:
+                break
+
+    def _connect(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self.database_url)
+            with self._conn.cursor() as cur:
+                for statement in SCHEMA_UPGRADES:
+                    cur.execute(statement)
+            self._conn.commit()
+        return self._conn
+
+    def _insert(self, cur, table: str, rows: List[tuple]):
+        columns, conflict = TABLES[table]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s {conflict}"
+        execute_values(cur, sql, rows, page_size=self.batch_size)
+
+    def _write_isolating(self, conn, table: str, rows: List[tuple]):
+        """Escribe `rows` partiendo en mitades los tramos que Postgres rechaza.
+
+        Solo se descartan las filas que fallan por sí solas. Los tramos se
+        procesan en orden, así que lo escrito o descartado es siempre un
+        prefijo de `rows` y se quita de la lista aunque la conexión se caiga
+        a mitad (el resto se reintenta).
+        """
+        ranges = [(0, len(rows))]
+        done = 0
+        try:
+            while ranges:
+                start, stop = ranges.pop()
+                try:
+                    with conn.cursor() as cur:
+                        self._insert(cur, table, rows[start:stop])
+                    conn.commit()
+                    self.rows_written[table] += stop - start
+                except DATA_ERRORS as e:
+                    conn.rollback()
+                    if stop - start > 1:
+                        middle = (start + stop) // 2
+                        ranges += [(middle, stop), (start, middle)]
+                        continue
+                    self.rows_rejected += 1
+                    logger.error(f"Persistencia: fila descartada en {table}: {e}")
+                done = stop
+        finally:
+            del rows[:done]
+
+    def _flush(self, pending: Dict[str, List[tuple]]) -> bool:
+        """Escribe todas las filas pendientes en una transacción; False si falló.
+
+        Si Postgres rechaza alguna fila (dato fuera de rango, NOT NULL...) se
+        reescribe cada tabla aislando las filas inválidas en vez de reintentar
+        el lote completo hasta descartarlo.
+        """
+        try:
+            conn = self._connect()
+            try:
+                with conn.cursor() as cur:
+                    for table, rows in pending.items():
+                        if rows:
+                            self._insert(cur, table, rows)
+                conn.commit()
+            except DATA_ERRORS as e:
+                conn.rollback()
+                logger.warning(f"⚠️ Lote rechazado por Postgres ({e}); aislando filas inválidas")
+                for table, rows in pending.items():
+                    if rows:
+                        self._write_isolating(conn, table, rows)
+                return True
+        except Exception as e:
+            logger.error(f"Error escribiendo en Postgres: {e}")
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+            return False
+
+        for table, rows in pending.items():
+            self.rows_written[table] += len(rows)
+            rows.clear()
+        return True
+
+    # ------------------------------------------------------------------ hidratación
+
+    def load_learning_state(self, limit: int = 10_000) -> Tuple[List[Dict], Optional[Dict]]:
+        """Lee los últimos `limit` learning_trades (en orden cronológico) y las últimas métricas"""
+        conn = psycopg2.connect(self.database_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT trade_id, symbol, side, entry_price, exit_price, quantity, pnl,
+                           pnl_percentage, hold_time_minutes, market_conditions,
+                           decision_confidence, created_at
+                    FROM learning_trades
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                    """,
+                    (limit,)
+                )
+                columns = [c.name for c in cur.description]
+                trades = [dict(zip(columns, row)) for row in reversed(cur.fetchall())]
+
+                cur.execute(
+                    """
+                    SELECT confidence_threshold, market_weights, optimal_conditions
+                    FROM learning_metrics
+                    ORDER BY timestamp DESC
+                    LIMIT 1
+                    """
+                )
+                row = cur.fetchone()
+                parameters = None
+                if row is not None:
+                    parameters = {
+                        "confidence_threshold": row[0],
+                        "market_weights": row[1],
+                        "optimal_conditions": row[2]
+                    }
+            return trades, parameters
+        finally:
+            conn.close()
+
+    def hydrate_learning_agent(self, agent, limit: int = 10_000):
+        """Restaura el historial y los parámetros del learning agent desde Postgres"""
+        if not self.enabled:
+            return
+        try:
+            trades, parameters = self.load_learning_state(limit)
+        except Exception as e:
+            logger.error(f"Error hidratando el learning agent desde Postgres: {e}")
+            return
+        agent.hydrate(trades, parameters)
+        logger.info(f"💧 Learning agent hidratado con {len(trades)} trades desde Postgres")
+
+
+# Instancia global de la persistencia write-behind
+persistence_service = PersistenceService(
+    settings.database_url,
+    batch_size=settings.persistence_batch_size,
+    flush_interval=settings.persistence_flush_interval,
+    max_queue=settings.persistence_max_queue
+)
@@ -0,0 +1,89 @@
+"""
+Cache de predicciones por vela cerrada y versión de modelo
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+
+@dataclass
+class CachedPrediction:
+    candle_open_time: int  # open_time (ms) de la última vela cerrada usada
+    model_version: Hashable
+    valid_until: int  # ms epoch en que cierra la vela en curso
+    result: dict[str, Any]
+
+
+class PredictionCache:
+    """Memoiza predicciones por (symbol, interval, lookback, vela cerrada, versión de modelo).
+
+    Cada serie guarda una única entrada: cuando cierra una vela nueva o cambia la
+    versión del modelo la entrada deja de ser válida y se reemplaza en el siguiente
+    cálculo, por lo que la memoria queda acotada al número de series consultadas.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple, CachedPrediction] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+    def get(self, series_key: tuple, model_version: Hashable) -> dict[str, Any] | None:
+        """Devuelve la predicción cacheada si la vela y el modelo siguen vigentes"""
+        now = self._now_ms()
+        with self._lock:
+            entry = self._entries.get(series_key)
+            if entry is not None and entry.model_version == model_version and now < entry.valid_until:
+                self.hits += 1
+                return entry.result
+            if entry is not None:
+                # La vela cerró o el modelo fue reentrenado
+                del self._entries[series_key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        series_key: tuple,
+        model_version: Hashable,
+        candle_open_time: int,
+        valid_until: int,
+        result: dict[str, Any],
+    ) -> None:
+        with self._lock:
+            self._entries[series_key] = CachedPrediction(
+                candle_open_time=candle_open_time,
+                model_version=model_version,
+                valid_until=valid_until,
+                result=result,
+            )
+
+    def invalidate(self) -> None:
+        """Descarta todas las entradas (p. ej. tras reentrenar el modelo)"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Instancia global del cache de predicciones
+prediction_cache = PredictionCache()
@@ -0,0 +1,275 @@
+"""
+Estado compartido del paper trading en Redis para varios workers de uvicorn
+"""
+from typing import Callable, Dict, Optional
+from dataclasses import asdict
+import json
+import logging
+import uuid
+
+import redis
+
+from app.services.fill_models import Candle
+
+logger = logging.getLogger(__name__)
+
+# Fill atómico: valida saldo/posición contra Redis, actualiza balance y posición,
+# incrementa la secuencia global y publica el fill con los valores autoritativos.
+# Los números se guardan y publican como texto con %.17g: cjson los codifica con
+# solo 14 dígitos significativos.
+FILL_SCRIPT = """
+local account_key, position_key, positions_key, seq_key = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local side = ARGV[1]
+local quantity = tonumber(ARGV[2])
+local price = tonumber(ARGV[3])
+local fee = tonumber(ARGV[4])
+local symbol = ARGV[5]
+
+local function fmt(x) return string.format('%.17g', x) end
+
+local balance = tonumber(redis.call('HGET', account_key, 'balance') or '0')
+local position = tonumber(redis.call('HGET', position_key, 'quantity') or '0')
+local avg = tonumber(redis.call('HGET', position_key, 'avg_entry_price') or '0')
+local balance_before, position_before, avg_before = balance, position, avg
+local realized = 0
+
+if side == 'BUY' then
+    local cost = quantity * price + fee
+    if cost > balance then
+        return cjson.encode({error = 'Saldo insuficiente'})
+    end
+    balance = balance - cost
+    avg = (position * avg + quantity * price) / (position + quantity)
+    position = position + quantity
+    redis.call('HSET', position_key, 'quantity', fmt(position), 'avg_entry_price', fmt(avg))
+    redis.call('SADD', positions_key, symbol)
+else
+    if position < quantity then
+        return cjson.encode({error = 'Posición insuficiente'})
+    end
+    realized = (price - avg) * quantity
+    balance = balance + quantity * price - fee
+    position = position - quantity
+    if position <= 0 then
+        redis.call('DEL', position_key)
+        redis.call('SREM', positions_key, symbol)
+        position, avg = 0, 0
+    else
+        redis.call('HSET', position_key, 'quantity', fmt(position))
+    end
+end
+
+redis.call('HSET', account_key, 'balance', fmt(balance))
+local seq = redis.call('INCR', seq_key)
+local message = cjson.encode({
+    type = 'fill', seq = seq, origin = ARGV[9], account = ARGV[7],
+    order_id = ARGV[6], symbol = symbol, side = side, order_type = ARGV[10],
+    quantity = fmt(quantity), price = fmt(price), fee = fmt(fee), timestamp = ARGV[8],
+    balance_before = fmt(balance_before), position_before = fmt(position_before),
+    avg_before = fmt(avg_before), balance = fmt(balance), position = fmt(position),
+    avg_entry_price = fmt(avg), realized_pnl = fmt(realized)
+})
+redis.call('PUBLISH', ARGV[11], message)
+return message
+"""
+
+# Reset atómico de una cuenta: borra sus posiciones y fija el balance
+RESET_SCRIPT = """
+local account_key, positions_key, seq_key = KEYS[1], KEYS[2], KEYS[3]
+local prefix = ARGV[1]
+for _, symbol in ipairs(redis.call('SMEMBERS', positions_key)) do
+    redis.call('DEL', prefix .. symbol)
+end
+redis.call('DEL', positions_key)
+redis.call('HSET', account_key, 'balance', ARGV[2], 'initial_balance', ARGV[2])
+local seq = redis.call('INCR', seq_key)
+local message = cjson.encode({type = 'reset', seq = seq, origin = ARGV[3], account = ARGV[4],
+                              balance = ARGV[2]})
+redis.call('PUBLISH', ARGV[5], message)
+return message
+"""
+
+# Campos numéricos que los scripts publican como texto
+FLOAT_FIELDS = ("quantity", "price", "fee", "timestamp", "balance_before", "position_before",
+                "avg_before", "balance", "position", "avg_entry_price", "realized_pnl")
+
+
+def _decode(raw: str) -> Dict:
+    event = json.loads(raw)
+    for key in FLOAT_FIELDS:
+        if isinstance(event.get(key), str):
+            event[key] = float(event[key])
+    return event
+
+
+class RedisStateBackend:
+    """Fuente de verdad compartida de precios, balances y posiciones.
+
+    - `{ns}:prices`: hash símbolo → último precio.
+    - `{ns}:account:{id}`: hash con balance e initial_balance de la cuenta.
+    - `{ns}:position:{id}:{symbol}`: hash con quantity y avg_entry_price, más el set
+      `{ns}:positions:{id}` con los símbolos abiertos.
+    - Los fills se validan y aplican con un script Lua (atómico en Redis) que
+      publica el resultado en `{ns}:events`; cada worker aplica los fills ajenos
+      con esos valores autoritativos y mantiene su copia local como caché.
+    """
+
+    def __init__(self, redis_url: str, namespace: str = "paper"):
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.namespace = namespace
+        self.channel = f"{namespace}:events"
+        self.origin = uuid.uuid4().hex  # Identifica los mensajes de este worker
+        self._fill_script = self.redis.register_script(FILL_SCRIPT)
+        self._reset_script = self.redis.register_script(RESET_SCRIPT)
+        self._pubsub = None
+        self._listener = None
+
+    # ------------------------------------------------------------------ claves
+
+    def _account_key(self, account_id: str) -> str:
+        return f"{self.namespace}:account:{account_id}"
+
+    def _position_prefix(self, account_id: str) -> str:
+        return f"{self.namespace}:position:{account_id}:"
+
+    def _positions_key(self, account_id: str) -> str:
+        return f"{self.namespace}:positions:{account_id}"
+
+    @property
+    def _prices_key(self) -> str:
+        return f"{self.namespace}:prices"
+
+    @property
+    def _accounts_key(self) -> str:
+        return f"{self.namespace}:accounts"
+
+    @property
+    def _seq_key(self) -> str:
+        return f"{self.namespace}:seq"
+
+    def _publish(self, pipe, message: Dict):
+        message["origin"] = self.origin
+        pipe.publish(self.channel, json.dumps(message))
+
+    # ------------------------------------------------------------------ cuentas
+
+    def ensure_account(self, account_id: str, initial_balance: float) -> bool:
+        """Registra la cuenta si no existe; devuelve True si fue creada"""
+        key = self._account_key(account_id)
+        created = bool(self.redis.hsetnx(key, "balance", repr(initial_balance)))
+        if created:
+            with self.redis.pipeline() as pipe:
+                pipe.hset(key, "initial_balance", repr(initial_balance))
+                pipe.sadd(self._accounts_key, account_id)
+                self._publish(pipe, {"type": "account_created", "account": account_id,
+                                     "balance": initial_balance})
+                pipe.execute()
+        return created
+
+    def delete_account(self, account_id: str):
+        symbols = self.redis.smembers(self._positions_key(account_id))
+        prefix = self._position_prefix(account_id)
+        with self.redis.pipeline() as pipe:
+            for symbol in symbols:
+                pipe.delete(prefix + symbol)
+            pipe.delete(self._positions_key(account_id), self._account_key(account_id))
+            pipe.srem(self._accounts_key, account_id)
+            self._publish(pipe, {"type": "account_deleted", "account": account_id})
+            pipe.execute()
+
+    def load_accounts(self) -> Dict[str, Dict]:
+        """Balances y posiciones de todas las cuentas registradas"""
+        accounts = {}
+        for account_id in self.redis.smembers(self._accounts_key):
+            data = self.redis.hgetall(self._account_key(account_id))
+            if not data:
+                continue
+            prefix = self._position_prefix(account_id)
+            positions = {}
+            for symbol in self.redis.smembers(self._positions_key(account_id)):
+                pos = self.redis.hgetall(prefix + symbol)
+                if pos:
+                    positions[symbol] = (float(pos["quantity"]), float(pos["avg_entry_price"]))
+            accounts[account_id] = {
+                "balance": float(data["balance"]),
+                "initial_balance": float(data.get("initial_balance", data["balance"])),
+                "positions": positions
+            }
+        return accounts
+
+    # ------------------------------------------------------------------ precios
+
+    def load_prices(self) -> Dict[str, float]:
+        return {symbol: float(price) for symbol, price in self.redis.hgetall(self._prices_key).items()}
+
+    def publish_price(self, symbol: str, price: float, candle: Optional[Candle] = None):
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self._prices_key, symbol, repr(price))
+            self._publish(pipe, {"type": "price", "symbol": symbol, "price": price,
+                                 "candle": asdict(candle) if candle is not None else None})
+            pipe.execute()
+
+    # ------------------------------------------------------------------ fills
+
+    def apply_fill(self, account_id: str, order_id: str, symbol: str, side: str, order_type: str,
+                   quantity: float, price: float, fee: float, timestamp: float) -> Dict:
+        """Valida y aplica un fill de forma atómica; devuelve el mensaje publicado o {"error": ...}"""
+        raw = self._fill_script(
+            keys=[self._account_key(account_id), self._position_prefix(account_id) + symbol,
+                  self._positions_key(account_id), self._seq_key],
+            args=[side, repr(quantity), repr(price), repr(fee), symbol, order_id, account_id,
+                  repr(timestamp), self.origin, order_type, self.channel]
+        )
+        return _decode(raw)
+
+    def reset_account(self, account_id: str, new_balance: float) -> Dict:
+        raw = self._reset_script(
+            keys=[self._account_key(account_id), self._positions_key(account_id), self._seq_key],
+            args=[self._position_prefix(account_id), repr(new_balance), self.origin, account_id, self.channel]
+        )
+        return _decode(raw)
+
+    # ------------------------------------------------------------------ eventos
+
+    def start_listener(self, handler: Callable[[Dict], None]):
+        """Suscribe `handler` a los eventos de otros workers (hilo en segundo plano)"""
+        if self._listener is not None:
+            return
+
+        def on_message(message):
+            try:
+                event = _decode(message["data"])
+                if event.get("origin") != self.origin:
+                    handler(event)
+            except Exception as e:
+                logger.error(f"Error procesando evento de Redis: {e}")
+
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: on_message})
+        self._listener = self._pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+        logger.info(f"📡 Escuchando eventos de estado compartido en {self.channel}")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+
+class SharedAccountState:
+    """Vista de una cuenta sobre el backend compartido; es lo que usa el engine"""
+
+    def __init__(self, backend: RedisStateBackend, account_id: str):
+        self.backend = backend
+        self.account_id = account_id
+
+    def fill(self, order, transaction_cost: float) -> Dict:
+        return self.backend.apply_fill(
+            self.account_id, order.id, order.symbol, order.side.value, order.order_type,
+            order.quantity, order.filled_price, transaction_cost, order.filled_at.timestamp()
+        )
+
+    def reset(self, new_balance: float) -> Dict:
+        return self.backend.reset_account(self.account_id, new_balance)
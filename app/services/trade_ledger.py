@@ -0,0 +1,183 @@
+"""
+Ledger de lotes para contabilidad de round trips del paper trading
+"""
+from typing import Deque, Dict, List, Optional
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+LOT_METHODS = ("FIFO", "LIFO", "AVERAGE")
+
+
+@dataclass(slots=True)
+class Lot:
+    quantity: float
+    price: float
+    fee_per_unit: float
+    opened_ts: float  # Epoch en segundos
+
+
+@dataclass(slots=True)
+class RoundTrip:
+    symbol: str
+    quantity: float
+    entry_price: float  # Promedio ponderado de los lotes cerrados
+    exit_price: float
+    pnl: float  # Neto de fees de entrada (prorrateados) y de salida
+    pnl_percentage: float
+    hold_minutes: float  # Promedio ponderado por cantidad
+    opened_at: datetime
+    closed_at: datetime
+
+    def to_dict(self) -> Dict:
+        return {
+            "symbol": self.symbol,
+            "quantity": self.quantity,
+            "entry_price": self.entry_price,
+            "exit_price": self.exit_price,
+            "pnl": self.pnl,
+            "pnl_percentage": self.pnl_percentage,
+            "hold_minutes": self.hold_minutes,
+            "opened_at": self.opened_at,
+            "closed_at": self.closed_at
+        }
+
+
+class TradeLedger:
+    """Empareja compras y ventas por lotes (FIFO, LIFO o costo promedio).
+
+    - Cada compra abre un lote; cada venta consume lotes y genera un round trip.
+    - Cada lote entra y sale una sola vez de su deque, así que el costo por fill
+      es O(1) amortizado; los agregados (win rate, profit factor, holding time)
+      se mantienen incrementalmente y se leen en O(1).
+    """
+
+    def __init__(self, method: str = "FIFO", history: int = 1000):
+        method = method.upper()
+        if method not in LOT_METHODS:
+            raise ValueError(f"Método de lotes inválido: {method}")
+        self.method = method
+        self.history = history
+        self.clear()
+
+    def clear(self):
+        self.lots: Dict[str, Deque[Lot]] = {}
+        self.recent: Deque[RoundTrip] = deque(maxlen=self.history)
+        self.round_trips = 0
+        self.winning = 0
+        self.losing = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.net_pnl = 0.0
+        self.total_hold_minutes = 0.0
+        self.largest_win = 0.0
+        self.largest_loss = 0.0
+
+    def buy(self, symbol: str, quantity: float, price: float, fee: float, timestamp: datetime):
+        lots = self.lots.setdefault(symbol, deque())
+        fee_per_unit = fee / quantity
+        if self.method == "AVERAGE" and lots:
+            # Un único lote por símbolo con precio, fee y fecha de apertura promediados
+            lot = lots[0]
+            total = lot.quantity + quantity
+            lot.price = (lot.price * lot.quantity + price * quantity) / total
+            lot.fee_per_unit = (lot.fee_per_unit * lot.quantity + fee) / total
+            lot.opened_ts = (lot.opened_ts * lot.quantity + timestamp.timestamp() * quantity) / total
+            lot.quantity = total
+        else:
+            lots.append(Lot(quantity=quantity, price=price, fee_per_unit=fee_per_unit,
+                            opened_ts=timestamp.timestamp()))
+
+    def sell(self, symbol: str, quantity: float, price: float, fee: float,
+             timestamp: datetime) -> Optional[RoundTrip]:
+        """Cierra `quantity` contra los lotes abiertos y devuelve el round trip resultante"""
+        lots = self.lots.get(symbol)
+        if not lots:
+            return None
+
+        remaining = quantity
+        matched = 0.0
+        cost = 0.0
+        entry_fees = 0.0
+        hold_weighted = 0.0
+        first_open: Optional[float] = None
+        close_ts = timestamp.timestamp()
+        pop = lots.pop if self.method == "LIFO" else lots.popleft
+
+        while remaining > 1e-12 and lots:
+            lot = lots[-1] if self.method == "LIFO" else lots[0]
+            take = min(lot.quantity, remaining)
+            matched += take
+            cost += take * lot.price
+            entry_fees += take * lot.fee_per_unit
+            hold_weighted += take * (close_ts - lot.opened_ts)
+            if first_open is None or lot.opened_ts < first_open:
+                first_open = lot.opened_ts
+            lot.quantity -= take
+            remaining -= take
+            if lot.quantity <= 1e-12:
+                pop()
+
+        if not lots:
+            del self.lots[symbol]
+        if matched <= 0:
+            return None
+
+        exit_fee = fee * matched / quantity
+        pnl = price * matched - cost - entry_fees - exit_fee
+        entry_price = cost / matched
+        trip = RoundTrip(
+            symbol=symbol,
+            quantity=matched,
+            entry_price=entry_price,
+            exit_price=price,
+            pnl=pnl,
+            pnl_percentage=pnl / cost * 100 if cost else 0.0,
+            hold_minutes=hold_weighted / matched / 60,
+            opened_at=datetime.fromtimestamp(first_open),
+            closed_at=timestamp
+        )
+        self._record(trip)
+        return trip
+
+    def _record(self, trip: RoundTrip):
+        self.round_trips += 1
+        self.net_pnl += trip.pnl
+        self.total_hold_minutes += trip.hold_minutes
+        if trip.pnl > 0:
+            self.winning += 1
+            self.gross_profit += trip.pnl
+            self.largest_win = max(self.largest_win, trip.pnl)
+        elif trip.pnl < 0:
+            self.losing += 1
+            self.gross_loss += -trip.pnl
+            self.largest_loss = min(self.largest_loss, trip.pnl)
+        self.recent.append(trip)
+
+    def open_quantity(self, symbol: str) -> float:
+        return sum(lot.quantity for lot in self.lots.get(symbol, ()))
+
+    def statistics(self) -> Dict:
+        """Agregados de round trips (O(1))"""
+        decided = self.winning + self.losing
+        return {
+            "lot_method": self.method,
+            "round_trips": self.round_trips,
+            "winning_trades": self.winning,
+            "losing_trades": self.losing,
+            "win_rate": self.winning / decided * 100 if decided else 0,
+            "total_profit": self.gross_profit,
+            "total_loss": self.gross_loss,
+            "net_pnl": self.net_pnl,
+            # Sin pérdidas el profit factor es indefinido (inf no es JSON válido)
+            "profit_factor": self.gross_profit / self.gross_loss if self.gross_loss > 0 else None,
+            "avg_win": self.gross_profit / self.winning if self.winning else 0,
+            "avg_loss": self.gross_loss / self.losing if self.losing else 0,
+            "largest_win": self.largest_win,
+            "largest_loss": self.largest_loss,
+            "avg_hold_minutes": self.total_hold_minutes / self.round_trips if self.round_trips else 0
+        }
+
+    def recent_round_trips(self, limit: int = 100) -> List[Dict]:
+        trips = list(self.recent)[-limit:]
+        return [trip.to_dict() for trip in reversed(trips)]
@@ -0,0 +1,186 @@
+"""
+Historial de trades columnar y paginado para el paper trading engine
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime
+import bisect
+
+import numpy as np
+
+CHUNK_SIZE = 4096
+
+TRADE_DTYPE = np.dtype([
+    ("seq", "i8"),
+    ("ts_us", "i8"),  # epoch en microsegundos
+    ("order_id", "S36"),
+    ("symbol", "i4"),  # código en la tabla de símbolos
+    ("side", "i1"),  # 0 BUY, 1 SELL
+    ("order_type", "i1"),  # código en la tabla de tipos de orden
+    ("quantity", "f8"),
+    ("price", "f8"),
+    ("transaction_cost", "f8"),
+    ("balance_after", "f8"),
+])
+
+SIDES = ("BUY", "SELL")
+
+
+class TradeLog:
+    """Log append-only de trades en columnas numpy que crecen por chunks.
+
+    - Cada trade recibe un `seq` monotónico que sirve de cursor de paginación.
+    - Solo se retienen en memoria los últimos `retention` trades (redondeado a
+      chunks completos); los contadores de vida completa no se pierden.
+    """
+
+    def __init__(self, retention: int = 100_000, chunk_size: int = CHUNK_SIZE):
+        self.retention = max(retention, chunk_size)
+        self.chunk_size = chunk_size
+        self._symbols: Dict[str, int] = {}
+        self._symbol_names: List[str] = []
+        self._order_types: Dict[str, int] = {}
+        self._order_type_names: List[str] = []
+        self.clear()
+
+    def clear(self):
+        self._chunks: List[np.ndarray] = []
+        self._chunk_starts: List[int] = []  # seq del primer trade de cada chunk
+        self._tail_fill = 0
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        """Total de trades registrados (incluye los que ya salieron de la retención)"""
+        return self._next_seq
+
+    @property
+    def retained(self) -> int:
+        if not self._chunks:
+            return 0
+        return (len(self._chunks) - 1) * self.chunk_size + self._tail_fill
+
+    def _code(self, table: Dict[str, int], names: List[str], value: str) -> int:
+        code = table.get(value)
+        if code is None:
+            code = table[value] = len(names)
+            names.append(value)
+        return code
+
+    def append(self, order_id: str, symbol: str, side: str, order_type: str, quantity: float,
+               price: float, transaction_cost: float, timestamp: datetime,
+               balance_after: float) -> int:
+        """Agrega un trade y devuelve su seq"""
+        if not self._chunks or self._tail_fill == self.chunk_size:
+            self._chunks.append(np.zeros(self.chunk_size, dtype=TRADE_DTYPE))
+            self._chunk_starts.append(self._next_seq)
+            self._tail_fill = 0
+            self._evict()
+
+        seq = self._next_seq
+        self._chunks[-1][self._tail_fill] = (
+            seq,
+            int(timestamp.timestamp() * 1_000_000),
+            order_id.encode(),
+            self._code(self._symbols, self._symbol_names, symbol),
+            SIDES.index(side),
+            self._code(self._order_types, self._order_type_names, order_type),
+            quantity,
+            price,
+            transaction_cost,
+            balance_after,
+        )
+        self._tail_fill += 1
+        self._next_seq += 1
+        return seq
+
+    def _evict(self):
+        """Descarta los chunks más antiguos que exceden la ventana de retención"""
+        max_chunks = -(-self.retention // self.chunk_size) + 1
+        while len(self._chunks) > max_chunks:
+            self._chunks.pop(0)
+            self._chunk_starts.pop(0)
+
+    def _chunk_view(self, i: int) -> np.ndarray:
+        chunk = self._chunks[i]
+        return chunk[:self._tail_fill] if i == len(self._chunks) - 1 else chunk
+
+    def _to_dict(self, row) -> Dict:
+        return {
+            "seq": int(row["seq"]),
+            "id": row["order_id"].decode(),
+            "symbol": self._symbol_names[row["symbol"]],
+            "side": SIDES[row["side"]],
+            "order_type": self._order_type_names[row["order_type"]],
+            "quantity": float(row["quantity"]),
+            "price": float(row["price"]),
+            "transaction_cost": float(row["transaction_cost"]),
+            "timestamp": datetime.fromtimestamp(row["ts_us"] / 1_000_000),
+            "balance_after": float(row["balance_after"]),
+        }
+
+    def last(self) -> Optional[Dict]:
+        if not self.retained:
+            return None
+        return self._to_dict(self._chunk_view(len(self._chunks) - 1)[-1])
+
+    def page(self, cursor: Optional[int] = None, limit: int = 100, symbol: Optional[str] = None,
+             start: Optional[datetime] = None, end: Optional[datetime] = None,
+             descending: bool = False) -> Tuple[List[Dict], Optional[int]]:
+        """Devuelve una página de trades y el cursor para la siguiente (None si no hay más).
+
+        El cursor es el `seq` del último trade devuelto; la siguiente página empieza
+        estrictamente después (o antes, en orden descendente).
+        """
+        if symbol is not None and symbol not in self._symbols:
+            return [], None
+        symbol_code = self._symbols.get(symbol) if symbol is not None else None
+        start_us = int(start.timestamp() * 1_000_000) if start else None
+        end_us = int(end.timestamp() * 1_000_000) if end else None
+
+        n_chunks = len(self._chunks)
+        if descending:
+            first = n_chunks - 1 if cursor is None else bisect.bisect_right(self._chunk_starts, cursor - 1) - 1
+            chunk_order = range(min(first, n_chunks - 1), -1, -1)
+        else:
+            first = 0 if cursor is None else max(bisect.bisect_right(self._chunk_starts, cursor + 1) - 1, 0)
+            chunk_order = range(first, n_chunks)
+
+        rows: List[np.ndarray] = []
+        collected = 0
+        for i in chunk_order:
+            view = self._chunk_view(i)
+            mask = np.ones(len(view), dtype=bool)
+            if cursor is not None:
+                mask &= (view["seq"] < cursor) if descending else (view["seq"] > cursor)
+            if symbol_code is not None:
+                mask &= view["symbol"] == symbol_code
+            if start_us is not None:
+                mask &= view["ts_us"] >= start_us
+            if end_us is not None:
+                mask &= view["ts_us"] <= end_us
+
+            selected = view[mask]
+            if descending:
+                selected = selected[::-1]
+            take = selected[:limit - collected]
+            if len(take):
+                rows.append(take)
+                collected += len(take)
+            if collected >= limit:
+                break
+
+        if not rows:
+            return [], None
+        result = np.concatenate(rows)
+        trades = [self._to_dict(row) for row in result]
+        next_cursor = trades[-1]["seq"] if collected >= limit else None
+        return trades, next_cursor
+
+    def iter_pages(self, page_size: int = 1000, **filters) -> Iterator[List[Dict]]:
+        """Recorre todas las páginas que cumplen los filtros"""
+        cursor = filters.pop("cursor", None)
+        while True:
+            trades, cursor = self.page(cursor=cursor, limit=page_size, **filters)
+            if trades:
+                yield trades
+            if cursor is None:
+                break
@@ -0,0 +1,350 @@
+"""
+Resultados de trades del learning agent y su almacén columnar
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIDES = ("BUY", "SELL")
+
+# Condiciones de mercado con columna propia; el resto va a un dict disperso
+NUMERIC_CONDITIONS = ("volatility_value", "volume_ratio", "rsi")
+CATEGORICAL_CONDITIONS = {
+    "volatility_level": ("LOW", "MEDIUM", "HIGH"),
+    "trend_strength": ("WEAK", "STRONG_BULLISH", "STRONG_BEARISH"),
+}
+
+OUTCOME_DTYPE = np.dtype(
+    [
+        ("ts_us", "i8"),  # epoch en microsegundos
+        ("id_end", "i8"),  # fin del trade_id en el buffer de ids
+        ("symbol", "i4"),  # código en la tabla de símbolos
+        ("side", "i1"),  # 0 BUY, 1 SELL
+        ("entry_price", "f8"),
+        ("exit_price", "f8"),
+        ("quantity", "f8"),
+        ("pnl", "f8"),
+        ("pnl_percentage", "f8"),
+        ("hold_time_minutes", "i4"),
+        ("decision_confidence", "f8"),
+    ]
+    + [(name, "f8") for name in NUMERIC_CONDITIONS]  # NaN = ausente
+    + [(name, "i1") for name in CATEGORICAL_CONDITIONS]  # -1 = ausente
+)
+
+
+@dataclass(slots=True)
+class TradeOutcome:
+    trade_id: str
+    symbol: str
+    side: str
+    entry_price: float
+    exit_price: float
+    quantity: float
+    pnl: float
+    pnl_percentage: float
+    hold_time_minutes: int
+    market_conditions: Dict
+    decision_confidence: float
+    timestamp: datetime
+
+    @classmethod
+    def from_record(cls, t: Dict) -> "TradeOutcome":
+        """Crea el outcome desde una fila de learning_trades"""
+        return cls(
+            trade_id=t["trade_id"],
+            symbol=t["symbol"],
+            side=t["side"],
+            entry_price=float(t["entry_price"]),
+            exit_price=float(t["exit_price"]),
+            quantity=float(t["quantity"]),
+            pnl=float(t["pnl"]),
+            pnl_percentage=float(t["pnl_percentage"]),
+            hold_time_minutes=int(t["hold_time_minutes"]),
+            market_conditions=t.get("market_conditions") or {},
+            decision_confidence=float(t["decision_confidence"] or 0.0),
+            timestamp=t["created_at"]
+        )
+
+
+class TradeOutcomeStore:
+    """Historial de TradeOutcome en columnas numpy (struct-of-arrays).
+
+    - Cada trade ocupa una fila de `OUTCOME_DTYPE` (~100 bytes) más su trade_id
+      en un buffer de bytes, en lugar de un objeto con su dict de condiciones;
+      timestamps, lados, símbolos y las condiciones conocidas van codificados.
+    - Se comporta como una lista de solo-append: `len`, índices, slices e
+      iteración devuelven TradeOutcome materializados al vuelo, así que el
+      código y las respuestas JSON existentes no cambian.
+    - `column()` expone vistas numpy para cálculos vectorizados.
+    - Con `max_retained`, al llenarse se vuelca la mitad más antigua a
+      `spill_dir` (un .npz por bloque) o se descarta si no hay directorio. `len`
+      y los índices siguen siendo de vida completa, como en TradeLog; leer un
+      trade ya volcado da IndexError.
+    """
+
+    def __init__(self, capacity: int = 1024, max_retained: Optional[int] = None,
+                 spill_dir: Optional[Path] = None):
+        self.max_retained = max_retained
+        self.spill_dir = Path(spill_dir) if spill_dir is not None else None
+        capacity = min(capacity, max_retained) if max_retained else capacity
+        self._data = np.zeros(max(capacity, 1), dtype=OUTCOME_DTYPE)
+        self._size = 0
+        self._offset = 0  # Índice de vida completa de la primera fila en memoria
+        self._ids = bytearray()
+        self._symbols: Dict[str, int] = {}
+        self._symbol_names: List[str] = []
+        self._extra: Dict[int, Dict] = {}  # Condiciones sin columna propia, por fila
+
+    def __len__(self) -> int:
+        """Total de trades registrados (incluye los volcados a disco)"""
+        return self._offset + self._size
+
+    @property
+    def retained(self) -> int:
+        return self._size
+
+    @property
+    def offset(self) -> int:
+        return self._offset
+
+    def clear(self):
+        self._size = 0
+        self._offset = 0
+        self._ids.clear()
+        self._extra.clear()
+
+    def _grow(self):
+        capacity = len(self._data) * 2
+        if self.max_retained:
+            capacity = min(capacity, self.max_retained)
+        data = np.zeros(capacity, dtype=OUTCOME_DTYPE)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def _spill(self, n: int):
+        """Saca de memoria las `n` filas más antiguas (a disco si hay spill_dir)"""
+        rows = self._data[:n].copy()
+        ids_end = int(rows["id_end"][-1])
+        extra = {i: self._extra.pop(i) for i in range(n) if i in self._extra}
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            first, last = self._offset, self._offset + n - 1
+            path = self.spill_dir / f"outcomes_{first:012d}_{last:012d}.npz"
+            np.savez(
+                path, rows=rows, ids=np.frombuffer(bytes(self._ids[:ids_end]), dtype=np.uint8),
+                symbols=np.array(self._symbol_names), extra=np.array(json.dumps(extra, default=str))
+            )
+            logger.info(f"💾 {n} trades de aprendizaje volcados a {path.name}")
+
+        remaining = self._size - n
+        self._data[:remaining] = self._data[n:self._size]
+        self._data["id_end"][:remaining] -= ids_end
+        del self._ids[:ids_end]
+        self._extra = {i - n: value for i, value in self._extra.items()}
+        self._size = remaining
+        self._offset += n
+
+    def symbol_code(self, symbol: str) -> Optional[int]:
+        return self._symbols.get(symbol)
+
+    def _symbol(self, symbol: str) -> int:
+        code = self._symbols.get(symbol)
+        if code is None:
+            code = self._symbols[symbol] = len(self._symbol_names)
+            self._symbol_names.append(symbol)
+        return code
+
+    def _make_room(self):
+        if self.max_retained and self._size >= self.max_retained:
+            self._spill(max(1, self._size // 2))
+        if self._size == len(self._data):
+            self._grow()
+
+    def append(self, outcome: TradeOutcome):
+        self._make_room()
+        i = self._size
+        code = self._symbol(outcome.symbol)
+
+        conditions = outcome.market_conditions or {}
+        numeric = []
+        for name in NUMERIC_CONDITIONS:
+            value = conditions.get(name)
+            numeric.append(float(value) if self._has_column(name, value) else math.nan)
+        categorical = []
+        for name, levels in CATEGORICAL_CONDITIONS.items():
+            value = conditions.get(name)
+            categorical.append(levels.index(value) if value in levels else -1)
+        extra = {
+            key: value for key, value in conditions.items()
+            if not self._has_column(key, value)
+        }
+        trade_id = outcome.trade_id.encode()
+        # La fila completa se arma antes de tocar buffers: si un valor no es
+        # válido (p. ej. el side) el almacén queda intacto
+        row = (
+            int(outcome.timestamp.timestamp() * 1_000_000),
+            len(self._ids) + len(trade_id),
+            code,
+            SIDES.index(outcome.side),
+            outcome.entry_price,
+            outcome.exit_price,
+            outcome.quantity,
+            outcome.pnl,
+            outcome.pnl_percentage,
+            outcome.hold_time_minutes,
+            outcome.decision_confidence,
+            *numeric,
+            *categorical,
+        )
+        self._data[i] = row
+        self._ids += trade_id
+        if extra:
+            self._extra[i] = extra
+        self._size += 1
+
+    def extend(self, outcomes: Iterable[TradeOutcome]):
+        for outcome in outcomes:
+            self.append(outcome)
+
+    def append_columns(self, trade_ids: Sequence[str], symbols: Sequence[str], sides: np.ndarray,
+                       entry_price: np.ndarray, exit_price: np.ndarray, quantity: np.ndarray,
+                       pnl: np.ndarray, pnl_percentage: np.ndarray, hold_time_minutes: np.ndarray,
+                       decision_confidence: np.ndarray, market_conditions: Sequence[Optional[Dict]],
+                       ts_us: np.ndarray):
+        """Agrega un lote ya en columnas (`sides` codificados 0 BUY / 1 SELL) en bloque"""
+        n = len(trade_ids)
+        if not n:
+            return
+        block = np.zeros(n, dtype=OUTCOME_DTYPE)
+        block["ts_us"] = ts_us
+        block["symbol"] = [self._symbol(symbol) for symbol in symbols]
+        block["side"] = sides
+        block["entry_price"] = entry_price
+        block["exit_price"] = exit_price
+        block["quantity"] = quantity
+        block["pnl"] = pnl
+        block["pnl_percentage"] = pnl_percentage
+        block["hold_time_minutes"] = hold_time_minutes
+        block["decision_confidence"] = decision_confidence
+        numeric = {name: [math.nan] * n for name in NUMERIC_CONDITIONS}
+        categorical = {name: [-1] * n for name in CATEGORICAL_CONDITIONS}
+        extras: Dict[int, Dict] = {}
+        for j, conditions in enumerate(market_conditions):
+            if not conditions:
+                continue
+            extra = None
+            for key, value in conditions.items():
+                if self._has_column(key, value):
+                    levels = CATEGORICAL_CONDITIONS.get(key)
+                    if levels is None:
+                        numeric[key][j] = value
+                    else:
+                        categorical[key][j] = levels.index(value)
+                else:
+                    if extra is None:
+                        extra = extras[j] = {}
+                    extra[key] = value
+        for name, values in numeric.items():
+            block[name] = values
+        for name, values in categorical.items():
+            block[name] = values
+
+        encoded = [trade_id.encode() for trade_id in trade_ids]
+        id_ends = np.cumsum([len(raw) for raw in encoded])
+        ids = b"".join(encoded)
+
+        # Escribir por tramos respetando el cap de filas en memoria
+        start = 0
+        while start < n:
+            self._make_room()
+            room = len(self._data) - self._size
+            if self.max_retained:
+                room = min(room, self.max_retained - self._size)
+            stop = min(n, start + room)
+            id_base = int(id_ends[start - 1]) if start else 0
+            id_stop = int(id_ends[stop - 1])
+            offset = len(self._ids) - id_base
+            self._ids += ids[id_base:id_stop]
+            chunk = block[start:stop]
+            chunk["id_end"] = id_ends[start:stop] + offset
+            self._data[self._size:self._size + len(chunk)] = chunk
+            for j in range(start, stop):
+                if j in extras:
+                    self._extra[self._size + j - start] = extras[j]
+            self._size += len(chunk)
+            start = stop
+
+    @staticmethod
+    def _has_column(key: str, value) -> bool:
+        if key in NUMERIC_CONDITIONS:
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        levels = CATEGORICAL_CONDITIONS.get(key)
+        return levels is not None and value in levels
+
+    # ------------------------------------------------------------------ lectura
+
+    def column(self, name: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Vista (sin copia) de una columna en el rango [start, stop) de las filas en memoria"""
+        return self._data[name][start:self._size if stop is None else stop]
+
+    def market_conditions(self, i: int) -> Dict:
+        row = self._data[i]
+        conditions = {}
+        for name in NUMERIC_CONDITIONS:
+            if not math.isnan(row[name]):
+                conditions[name] = float(row[name])
+        for name, levels in CATEGORICAL_CONDITIONS.items():
+            if row[name] >= 0:
+                conditions[name] = levels[row[name]]
+        conditions.update(self._extra.get(i, {}))
+        return conditions
+
+    def _materialize(self, i: int) -> TradeOutcome:
+        row = self._data[i]
+        id_start = self._data["id_end"][i - 1] if i else 0
+        return TradeOutcome(
+            trade_id=self._ids[id_start:row["id_end"]].decode(),
+            symbol=self._symbol_names[row["symbol"]],
+            side=SIDES[row["side"]],
+            entry_price=float(row["entry_price"]),
+            exit_price=float(row["exit_price"]),
+            quantity=float(row["quantity"]),
+            pnl=float(row["pnl"]),
+            pnl_percentage=float(row["pnl_percentage"]),
+            hold_time_minutes=int(row["hold_time_minutes"]),
+            market_conditions=self.market_conditions(i),
+            decision_confidence=float(row["decision_confidence"]),
+            timestamp=datetime.fromtimestamp(row["ts_us"] / 1_000_000)
+        )
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[TradeOutcome, List[TradeOutcome]]:
+        total = len(self)
+        if isinstance(index, slice):
+            # Los trades ya volcados a disco se omiten
+            return [self._materialize(i - self._offset)
+                    for i in range(*index.indices(total)) if i >= self._offset]
+        if index < 0:
+            index += total
+        if not 0 <= index < total:
+            raise IndexError("Índice fuera de rango")
+        if index < self._offset:
+            raise IndexError("Trade volcado a disco")
+        return self._materialize(index - self._offset)
+
+    def __iter__(self) -> Iterator[TradeOutcome]:
+        for i in range(self._size):
+            yield self._materialize(i)
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria aproximada de las columnas en uso"""
+        return self._size * OUTCOME_DTYPE.itemsize + len(self._ids)
@@ -25,6 +25,7 @@ CREATE TABLE IF NOT EXISTS trading_logs (
 -- Tablas para paper trading
 CREATE TABLE IF NOT EXISTS paper_trades (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    account_id VARCHAR(64) NOT NULL DEFAULT 'default',
     symbol VARCHAR(20) NOT NULL,
     side VARCHAR(10) NOT NULL,
     quantity DECIMAL(18, 8) NOT NULL,
@@ -0,0 +1,22 @@
+"""
+Configuración común de los tests: directorios temporales y servicios sin
+dependencias externas (sin Postgres, Redis ni journal en disco)
+"""
+import os
+import tempfile
+from pathlib import Path
+
+_BASE = Path(tempfile.mkdtemp(prefix="ia-agents-tests-"))
+for _name in ("data", "models"):
+    (_BASE / _name).mkdir()
+
+# Antes de importar app.*: Settings se lee al importar
+os.environ.update(
+    BASE_DIR=str(_BASE),
+    DATA_DIR=str(_BASE / "data"),
+    MODELS_DIR=str(_BASE / "models"),
+    PAPER_JOURNAL_ENABLED="false",
+    LOG_SINK_ENABLED="false",
+)
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("LOGS_DATABASE_URL", None)
@@ -0,0 +1,41 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.clock import Clock, FixedStepClock, SimulatedClock, build_clock
+
+START = datetime(2024, 1, 1)
+
+
+def test_incomplete_clock_fails_at_construction():
+    class NowOnly(Clock):
+        def now(self):
+            return START
+
+    with pytest.raises(TypeError):
+        NowOnly()
+
+
+def test_simulated_clock_only_moves_forward():
+    clock = SimulatedClock(START)
+    clock.sleep(30)
+    asyncio.run(clock.async_sleep(30))
+    assert clock.now() == START + timedelta(minutes=1) and clock.monotonic() == 60.0
+    assert clock.advance_to(START) == START + timedelta(minutes=1)
+    with pytest.raises(ValueError):
+        clock.advance(-1)
+
+
+def test_fixed_step_clock_stays_on_its_grid():
+    clock = FixedStepClock(START, step=60.0)
+    clock.sleep(1)
+    clock.advance_to(START + timedelta(seconds=150))
+    assert clock.now() == START + timedelta(minutes=3)
+
+
+def test_build_clock_modes():
+    assert build_clock("FAST", START).mode == "fast"
+    assert build_clock("fixed_step", START, 5).step == 5
+    with pytest.raises(ValueError):
+        build_clock("sundial")
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from app.services.learning_metrics import CONDITION_BUCKETS, RESYNC_EVERY, ConditionBuckets, classify_conditions
+
+
+def _trades(n: int, seed: int = 11):
+    rng = random.Random(seed)
+    return [
+        ({
+            "volatility_level": rng.choice(["HIGH", "MEDIUM", "LOW", "EXTREME"]),
+            "trend_strength": rng.choice(["STRONG_BULLISH", "STRONG_BEARISH", "WEAK"]),
+            "volume_ratio": rng.uniform(0.2, 2.5),
+        }, round(rng.gauss(0, 3), 2))
+        for _ in range(n)
+    ]
+
+
+def _brute_force(trades, dimension: str):
+    """Análisis recalculado desde cero sobre la ventana"""
+    position = list(CONDITION_BUCKETS).index(dimension)
+    result = {}
+    for level in CONDITION_BUCKETS[dimension]:
+        values = [pnl for conditions, pnl in trades if classify_conditions(conditions)[position] == level]
+        result[level] = {
+            "avg_pnl": sum(values) / len(values) if values else 0,
+            "win_rate": sum(v > 0 for v in values) / len(values) if values else 0,
+            "trade_count": len(values),
+            "best_trade": max(values) if values else 0,
+            "worst_trade": min(values) if values else 0,
+        }
+    return result
+
+
+def _flat(analysis):
+    return {(level, name): value for level, stats in analysis.items() for name, value in stats.items()}
+
+
+@pytest.mark.parametrize("window", [1, 30])
+def test_sliding_buckets_match_brute_force(window):
+    trades = _trades(RESYNC_EVERY + 100)
+    buckets = ConditionBuckets(window)
+    for i, (conditions, pnl) in enumerate(trades):
+        buckets.push(conditions, pnl)
+        if i % 113 and i != len(trades) - 1:
+            continue
+        recent = trades[max(0, i + 1 - window):i + 1]
+        for dimension in CONDITION_BUCKETS:
+            assert _flat(buckets.analysis(dimension)) == pytest.approx(_flat(_brute_force(recent, dimension)))
+
+
+def test_push_many_keeps_only_the_window():
+    trades = _trades(100, seed=5)
+    single, batched = ConditionBuckets(30), ConditionBuckets(30)
+    for conditions, pnl in trades:
+        single.push(conditions, pnl)
+    batched.push_many([c for c, _ in trades], [p for _, p in trades])
+
+    assert batched.count == single.count and batched.size == 30
+    for dimension in CONDITION_BUCKETS:
+        assert _flat(batched.analysis(dimension)) == pytest.approx(_flat(single.analysis(dimension)))
@@ -0,0 +1,122 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import learning
+from app.services.learning_agent import TradeOutcome, learning_agent
+
+
+@pytest.fixture
+def client():
+    learning_agent.clear_history()
+    learning_agent.reset_parameters()
+    app = FastAPI()
+    app.include_router(learning.router)
+    yield TestClient(app)
+    learning_agent.clear_history()
+    learning_agent.reset_parameters()
+
+
+def _trades(n: int):
+    return [
+        {"trade_id": f"b{i}", "symbol": "ETHUSDT" if i % 2 else "BTCUSDT", "side": "SELL" if i % 3 else "buy",
+         "entry_price": 100.0, "exit_price": 100.0 + (i % 5) - 2, "quantity": 1.5,
+         "market_conditions": {"volatility_level": "HIGH", "volume_ratio": 2.0}}
+        for i in range(n)
+    ]
+
+
+def _expected_pnl(trade):
+    move = trade["exit_price"] - trade["entry_price"]
+    return (move if trade["side"].upper() == "BUY" else -move) * trade["quantity"]
+
+
+def test_batch_formats_record_same_trades(client):
+    trades = _trades(12)
+    columnar = {name: [t.get(name) for t in trades] for name in trades[0]}
+    ndjson = "\n".join(json.dumps(t) for t in trades)
+    expected = round(sum(_expected_pnl(t) for t in trades), 2)
+
+    for kwargs in ({"json": trades}, {"json": columnar},
+                   {"content": ndjson, "headers": {"content-type": "application/x-ndjson"}}):
+        learning_agent.clear_history()
+        response = client.post("/learning/record-trades/batch", **kwargs)
+        assert response.status_code == 200, response.text
+        assert response.json()["recorded"] == 12
+        assert response.json()["total_pnl"] == expected
+        stored = learning_agent.trade_outcomes
+        assert [t.trade_id for t in stored] == [t["trade_id"] for t in trades]
+        assert stored[0].side == "BUY"
+        assert stored[1].market_conditions == {"volatility_level": "HIGH", "volume_ratio": 2.0}
+
+
+@pytest.mark.parametrize("field, value", [("entry_price", 0.0), ("quantity", -1.0), ("side", "HOLD")])
+def test_batch_rejects_invalid_trades(client, field, value):
+    trades = _trades(3)
+    trades[1][field] = value
+
+    response = client.post("/learning/record-trades/batch", json=trades)
+    assert response.status_code == 400
+    assert len(learning_agent.trade_outcomes) == 0
+
+
+def test_batch_validation_errors(client):
+    assert client.post("/learning/record-trades/batch", content=b"[1, 2]").status_code == 400
+    assert client.post("/learning/record-trades/batch", json=[]).status_code == 400
+    columnar = {"trade_id": ["a", "b"], "symbol": ["X"], "side": ["BUY", "BUY"],
+                "entry_price": [1, 1], "exit_price": [1, 1], "quantity": [1, 1]}
+    assert client.post("/learning/record-trades/batch", json=columnar).status_code == 422
+
+
+def test_batch_evaluation_matches_single(client):
+    candidates = [
+        ({"volatility_value": 1.5, "volume_ratio": 1.8, "trend_strength": "STRONG_BULLISH", "rsi": 55}, 0.9),
+        ({"volatility_value": 6.0, "volume_ratio": 0.3, "trend_strength": "WEAK", "rsi": 85}, 0.95),
+        ({"volatility_value": 2.0, "volume_ratio": 1.0, "trend_strength": "WEAK", "rsi": 50}, 0.3),
+        ({}, 0.8),
+    ]
+    body = {
+        "signal_confidence": [confidence for _, confidence in candidates],
+        "volatility_value": [c.get("volatility_value") for c, _ in candidates],
+        "volume_ratio": [c.get("volume_ratio") for c, _ in candidates],
+        "trend_strength": [c.get("trend_strength") for c, _ in candidates],
+        "rsi": [c.get("rsi") for c, _ in candidates],
+    }
+    batch = client.post("/learning/evaluate-trades/batch", json=body).json()
+
+    for i, (conditions, confidence) in enumerate(candidates):
+        single = client.post("/learning/evaluate-trade",
+                             json={"market_conditions": conditions, "signal_confidence": confidence}).json()
+        assert batch["should_trade"][i] == single["should_trade"]
+        if "final_score" in single:
+            assert np.isclose(batch["final_score"][i], single["final_score"], atol=1e-4)
+
+
+def _in_sync(expected: int):
+    return (len(learning_agent.trade_outcomes), learning_agent.metrics_window.count,
+            learning_agent.condition_buckets.count, len(learning_agent.outcome_index)) == (expected,) * 4
+
+
+def test_invalid_market_conditions_are_rejected_before_recording(client):
+    trade = _trades(1)[0]
+    trade["market_conditions"] = {"volume_ratio": "high"}
+    assert client.post("/learning/record-trade", json=trade).status_code == 422
+
+    trades = _trades(3)
+    trades[2]["market_conditions"] = {"volume_ratio": [2]}
+    response = client.post("/learning/record-trades/batch", json=trades)
+    assert response.status_code == 422 and response.json()["detail"].startswith("Trade 2")
+    assert _in_sync(0)
+
+    # Llamando al agente directamente, el error llega antes de modificar ninguna estructura
+    outcome = TradeOutcome(trade_id="direct", symbol="BTCUSDT", side="BUY", entry_price=100.0,
+                           exit_price=101.0, quantity=1.0, pnl=1.0, pnl_percentage=1.0,
+                           hold_time_minutes=60, market_conditions={"volume_ratio": "high"},
+                           decision_confidence=0.7, timestamp=datetime.now())
+    with pytest.raises(ValueError):
+        learning_agent.record_trade_outcome(outcome)
+    assert _in_sync(0)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from app.services.learning_metrics import RESYNC_EVERY, RollingMetrics
+
+
+def _expected(pnl: np.ndarray, pnl_pct: np.ndarray) -> dict:
+    """Métricas recalculadas desde cero sobre la ventana"""
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    cumulative = np.cumsum(pnl)
+    std = pnl_pct.std()
+    return {
+        "total_trades": len(pnl),
+        "win_rate": len(wins) / len(pnl),
+        "avg_pnl": pnl.mean(),
+        "avg_win": wins.mean() if len(wins) else 0,
+        "avg_loss": losses.mean() if len(losses) else 0,
+        "sharpe_ratio": pnl_pct.mean() / std if std > 0 else 0,
+        "max_drawdown": (cumulative - np.maximum.accumulate(cumulative)).min(),
+        "profit_factor": wins.sum() / -losses.sum() if len(losses) else float("inf"),
+        "best_trade": pnl.max(),
+        "worst_trade": pnl.min(),
+    }
+
+
+def _stream(n: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    pnl = np.round(rng.normal(0, 10, n), 2)
+    pnl[rng.random(n) < 0.1] = 0.0  # Trades en break-even
+    pnl_pct = pnl / 100 + rng.normal(5, 0.01, n)  # Media lejos de 0: estresa la varianza
+    return pnl, pnl_pct, rng.uniform(1, 600, n), rng.uniform(0, 1, n)
+
+
+@pytest.mark.parametrize("window", [1, 7, 50])
+def test_sliding_window_matches_recomputation(window):
+    pnl, pnl_pct, hold, confidence = _stream(RESYNC_EVERY + 300)
+    rolling = RollingMetrics(window)
+    for i in range(len(pnl)):
+        rolling.push(pnl[i], pnl_pct[i], hold[i], confidence[i])
+        if i % 97 and i != len(pnl) - 1:
+            continue
+        start = max(0, i + 1 - window)
+        expected = _expected(pnl[start:i + 1], pnl_pct[start:i + 1])
+        assert rolling.metrics() == pytest.approx(expected, rel=1e-6, abs=1e-9)
+        assert rolling.averages() == pytest.approx({
+            "avg_hold_minutes": hold[start:i + 1].mean(),
+            "avg_decision_confidence": confidence[start:i + 1].mean(),
+        })
+
+
+def test_push_many_matches_individual_pushes():
+    pnl, pnl_pct, hold, confidence = _stream(500, seed=3)
+    single, batched = RollingMetrics(50), RollingMetrics(50)
+    for values in zip(pnl, pnl_pct, hold, confidence):
+        single.push(*values)
+    # Un lote menor que la ventana y otro que la reemplaza entera
+    batched.push_many(pnl[:20], pnl_pct[:20], hold[:20], confidence[:20])
+    batched.push_many(pnl[20:], pnl_pct[20:], hold[20:], confidence[20:])
+
+    assert batched.count == single.count
+    assert batched.metrics() == pytest.approx(single.metrics())
+    assert batched.averages() == pytest.approx(single.averages())
@@ -0,0 +1,66 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import learning
+from app.services.learning_agent import learning_agent
+from app.services.learning_tuner import build_grid, replay, run_tuning
+from app.services.trade_outcomes import TradeOutcome
+
+START = datetime(2024, 1, 1)
+
+
+def _stream(n: int, seed: int = 3):
+    rng = random.Random(seed)
+    outcomes = []
+    for i in range(n):
+        entry, confidence = 100.0, rng.uniform(0.4, 1.0)
+        # Las señales con más confianza aciertan más: los thresholds altos filtran pérdidas
+        exit_ = entry + rng.gauss(1.0 if confidence > 0.7 else -1.0, 2.0)
+        pnl = exit_ - entry
+        outcomes.append(TradeOutcome(
+            trade_id=f"t{i}", symbol="BTCUSDT", side="BUY", entry_price=entry, exit_price=exit_,
+            quantity=1.0, pnl=pnl, pnl_percentage=pnl, hold_time_minutes=30,
+            market_conditions={"volatility_level": "MEDIUM", "volume_ratio": rng.uniform(0.5, 2.0),
+                               "trend_strength": "WEAK"},
+            decision_confidence=confidence, timestamp=START + timedelta(minutes=i)
+        ))
+    return outcomes
+
+
+def test_tuning_ranks_like_direct_replays():
+    stream = _stream(120)
+    policies = build_grid({"confidence_threshold": [0.4, 0.6, 0.75, 0.9], "adjust_every": [3, 10]})
+    results = run_tuning(stream, policies, workers=2)
+
+    direct = sorted((replay(policy, stream) for policy in policies), key=lambda r: r["total_pnl"], reverse=True)
+    assert [r["policy"] for r in results] == [r["policy"] for r in direct]
+    assert [r["total_pnl"] for r in results] == pytest.approx([r["total_pnl"] for r in direct])
+
+
+@pytest.mark.parametrize("grid", [
+    {"adjust_every": [2.5]}, {"adjust_every": [0]}, {"nope": [1]}, {"confidence_threshold": [True]},
+])
+def test_build_grid_rejects_invalid_values(grid):
+    with pytest.raises(ValueError):
+        build_grid(grid)
+
+
+def test_tune_endpoint(monkeypatch):
+    monkeypatch.setattr(learning_agent, "trade_outcomes", _stream(40))
+    app = FastAPI()
+    app.include_router(learning.router)
+    client = TestClient(app)
+
+    response = client.post("/learning/tune", json={"grid": {"adjust_every": [2.5, 3]}})
+    assert response.status_code == 400 and "entero" in response.json()["detail"]
+
+    response = client.post("/learning/tune", json={
+        "grid": {"confidence_threshold": [0.5, 0.8]}, "workers": 1, "top": 1
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["trades_replayed"] == 40 and body["policies_evaluated"] == 2 and len(body["results"]) == 1
@@ -0,0 +1,68 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.services.learning_agent import LearningAgent, TradeOutcome
+from app.services.trade_outcomes import TradeOutcomeStore
+
+START = datetime(2024, 1, 1)
+
+
+def _outcome(i: int) -> TradeOutcome:
+    pnl = 2.0 if i % 4 else -1.0
+    return TradeOutcome(f"w{i}", "BTCUSDT", "BUY", 100.0, 100.0 + pnl, 1.0, pnl, pnl, 60,
+                        {"volatility_value": 2.0, "volume_ratio": 1.2}, 0.7, START + timedelta(minutes=i))
+
+
+def test_adjustments_run_off_the_request_path_and_coalesce(monkeypatch):
+    agent = LearningAgent(outcome_store=TradeOutcomeStore())
+    entered, release, threads = threading.Event(), threading.Event(), []
+    adjust = agent._adjust_parameters
+
+    def slow_adjust():
+        threads.append(threading.current_thread().name)
+        entered.set()
+        assert release.wait(5.0)
+        adjust()
+
+    monkeypatch.setattr(agent, "_adjust_parameters", slow_adjust)
+    agent.start_adjustment_worker()
+    try:
+        started = time.monotonic()
+        for i in range(5):
+            agent.record_trade_outcome(_outcome(i))
+        assert entered.wait(5.0)
+        for i in range(5, 50):  # 9 peticiones más mientras el primer ajuste sigue en curso
+            agent.record_trade_outcome(_outcome(i))
+        assert time.monotonic() - started < 2.0
+        assert agent.adjustments_requested == 10 and agent.adjustments_run == 0
+    finally:
+        release.set()
+        agent.stop_adjustment_worker()
+
+    # El ajuste en curso más uno solo con el estado más reciente
+    assert agent.adjustments_run == 2 and threads[0] == "learning-adjust"
+    assert agent.parameters.version == 3
+    assert agent.performance_history[-1]["metrics"].total_trades == agent.metrics_window.metrics()["total_trades"]
+
+
+def test_concurrent_requests_are_all_counted():
+    agent = LearningAgent(outcome_store=TradeOutcomeStore())
+    agent.start_adjustment_worker()
+
+    def record(offset: int):
+        for i in range(offset, offset + 100):
+            agent.record_trade_outcome(_outcome(i))
+
+    workers = [threading.Thread(target=record, args=(k * 100,)) for k in range(4)]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        agent.stop_adjustment_worker()
+
+    assert len(agent.trade_outcomes) == 400
+    assert agent.adjustments_requested == 400 // agent.policy.adjust_every
+    assert 1 <= agent.adjustments_run <= agent.adjustments_requested
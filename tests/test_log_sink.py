@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.clock import RealTimeClock, SimulatedClock
+from app.core.database import Base, build_engine
+from app.models.binance_logs import TradingOperation
+from app.services.logging_service import BinanceLogger, BinanceLogSink
+
+
+@pytest.fixture
+def bind(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _sink(bind, monkeypatch, **options) -> BinanceLogSink:
+    sink = BinanceLogSink(bind, **options)
+    flushes = []
+    flush = sink._flush
+    # Registra el tamaño de cada lote antes de escribirlo
+    monkeypatch.setattr(sink, "_flush", lambda pending: (
+        flushes.append(sum(len(batch) for batch in pending.values())), flush(pending)
+    ))
+    sink.flushes = flushes
+    monkeypatch.setattr(BinanceLogger, "sink", sink)
+    return sink
+
+
+def _log(n: int, symbol: str = "BTCUSDT"):
+    for i in range(n):
+        assert BinanceLogger.log_trading_operation(None, "predict", symbol, parameters={"i": i}) is None
+
+
+def _enqueue(sink: BinanceLogSink, n: int):
+    """Encola filas sin el hilo escritor arrancado: esperan todas en la cola"""
+    for _ in range(n):
+        sink.enqueue(TradingOperation, dict(operation_type="predict", symbol="BTCUSDT",
+                                            **BinanceLogger._timestamp()))
+
+
+def _stored(bind) -> int:
+    with bind.connect() as conn:
+        return conn.execute(select(func.count()).select_from(TradingOperation)).scalar_one()
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "El sink no escribió a tiempo"
+        time.sleep(0.01)
+
+
+def test_batches_by_size_and_stop_drains_the_queue(bind, monkeypatch):
+    sink = _sink(bind, monkeypatch, batch_size=10, flush_interval=60.0)
+    _enqueue(sink, 25)
+    sink.start()
+
+    _wait_for(lambda: sink.rows_written == 20)
+    time.sleep(0.1)
+    assert sink.flushes == [10, 10] and _stored(bind) == 20  # El resto espera al intervalo
+
+    sink.stop()
+    assert sink.flushes == [10, 10, 5]
+    assert _stored(bind) == sink.rows_written == 25 and not sink.running
+
+
+def test_partial_batch_is_written_after_the_interval(bind, monkeypatch):
+    sink = _sink(bind, monkeypatch, batch_size=1000, flush_interval=0.05)
+    sink.start()
+    try:
+        _log(3)
+        _wait_for(lambda: _stored(bind) == 3)
+        assert sink.running and sum(sink.flushes) == 3
+    finally:
+        sink.stop()
+
+
+def test_drop_policy_counts_discarded_rows(bind, monkeypatch):
+    sink = _sink(bind, monkeypatch, max_queue=2, policy="drop")
+    _enqueue(sink, 5)
+    assert sink.rows_dropped == 3
+
+    sink.start()
+    sink.stop()
+    assert _stored(bind) == sink.rows_written == 2
+
+
+def test_block_policy_waits_for_room(bind, monkeypatch):
+    sink = _sink(bind, monkeypatch, batch_size=1, max_queue=1, policy="block", block_timeout=0.2)
+    _enqueue(sink, 1)
+    started = time.monotonic()
+    _enqueue(sink, 1)  # Sin escritor que libere hueco: espera block_timeout y descarta
+    assert time.monotonic() - started >= 0.2 and sink.rows_dropped == 1
+
+    sink.block_timeout = 5.0
+    sink.start()
+    _log(50)  # Con el escritor activo cada fila espera hueco en vez de perderse
+    sink.stop()
+    assert sink.rows_dropped == 1 and _stored(bind) == sink.rows_written == 51
+
+
+def test_invalid_policy_is_rejected(bind):
+    with pytest.raises(ValueError):
+        BinanceLogSink(bind, policy="spill")
+
+
+@pytest.mark.parametrize("clock", [RealTimeClock(), SimulatedClock(datetime(2026, 3, 1, 12, 30))])
+def test_timestamps_are_naive_utc_in_both_clock_modes(bind, monkeypatch, clock):
+    monkeypatch.setattr(BinanceLogger, "clock", clock)
+    sink = _sink(bind, monkeypatch)
+    expected = clock.now() if clock.simulated else datetime.utcnow()
+    assert BinanceLogger._timestamp()["timestamp"].tzinfo is None
+    sink.start()
+    _log(1)
+    sink.stop()
+
+    with bind.connect() as conn:
+        stored = conn.execute(select(TradingOperation.timestamp)).scalar_one()
+    assert stored.tzinfo is None and abs(stored - expected) < timedelta(seconds=5)
+    # El filtro de /logs (datetime.utcnow() - horas) encuentra el log
+    since = expected - timedelta(hours=1)
+    with bind.connect() as conn:
+        assert conn.execute(
+            select(func.count()).select_from(TradingOperation).where(TradingOperation.timestamp >= since)
+        ).scalar_one() == 1
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import logs
+from app.core import database
+from app.models.binance_logs import TradingOperation
+
+
+@pytest.fixture(scope="module")
+def client():
+    database.create_tables()
+    now = datetime.utcnow()
+    # Tres operaciones por segundo: muchas comparten timestamp y solo el id desempata
+    rows = [
+        dict(timestamp=now - timedelta(seconds=i // 3), operation_type="train" if i % 2 else "predict",
+             symbol="ETHUSDT" if i % 5 else "BTCUSDT", success=bool(i % 4))
+        for i in range(600)
+    ]
+    with database.engine.begin() as conn:
+        conn.execute(TradingOperation.__table__.delete())
+        conn.execute(TradingOperation.__table__.insert(), rows)
+    app = FastAPI()
+    app.include_router(logs.router)
+    yield TestClient(app)
+    with database.engine.begin() as conn:
+        conn.execute(TradingOperation.__table__.delete())
+
+
+def _expected_ids(**filters):
+    with database.SessionLocal() as db:
+        query = db.query(TradingOperation).filter_by(**filters)
+        ordered = query.order_by(TradingOperation.timestamp.desc(), TradingOperation.id.desc())
+        return [row.id for row in ordered]
+
+
+@pytest.mark.parametrize("params, filters", [
+    ({}, {}),
+    ({"symbol": "btcusdt"}, {"symbol": "BTCUSDT"}),
+    ({"operation_type": "train", "success_only": True}, {"operation_type": "train", "success": True}),
+])
+def test_keyset_pages_cover_every_row_once(client, params, filters):
+    seen, cursor = [], {}
+    while True:
+        response = client.get("/logs/trading-operations", params={"limit": 37, **params, **cursor})
+        assert response.status_code == 200
+        body = response.json()
+        seen += [log["id"] for log in body["logs"]]
+        if body["next_cursor"] is None:
+            break
+        cursor = body["next_cursor"]
+
+    assert seen == _expected_ids(**filters)
+
+
+def test_before_id_requires_before_ts(client):
+    response = client.get("/logs/trading-operations", params={"before_id": 5})
+    assert response.status_code == 400
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from app.services.model_service import EnsembleClassifier
+
+
+def _ensemble(tmp_path, method, vote_weights=None):
+    # Sin modelos en disco: solo se prueba la agregación de probabilidades
+    ensemble = EnsembleClassifier(tmp_path, ["a", "b"], method=method)
+    if vote_weights is not None:
+        ensemble.vote_weights = np.asarray(vote_weights, dtype=float)
+    return ensemble
+
+
+@pytest.mark.parametrize("method, weights, probs, expected", [
+    ("mean", None, [0.9, 0.2], 0.55),
+    ("majority", None, [0.9, 0.6], 1.0),
+    # Empate 1-1: decide la media de probabilidades, no un BUY automático
+    ("majority", None, [0.9, 0.2], 0.55),
+    ("majority", None, [0.6, 0.1], 0.35),
+    # Voto ponderado: cuenta a quién apoya cada peso, no cuánto se aleja de 0.5
+    ("weighted", [0.6, 0.4], [0.51, 0.0], 0.6),
+    ("weighted", [0.6, 0.4], [0.4, 0.99], 0.4),
+    ("weighted", [0.5, 0.5], [0.7, 0.1], 0.4),
+])
+def test_aggregate_votes(tmp_path, method, weights, probs, expected):
+    ensemble = _ensemble(tmp_path, method, weights)
+    assert ensemble._aggregate(np.array([probs])) == pytest.approx([expected])
+
+
+def test_invalid_ensemble_configuration(tmp_path):
+    with pytest.raises(ValueError):
+        EnsembleClassifier(tmp_path, ["a", "b"], method="median")
+    with pytest.raises(ValueError):
+        EnsembleClassifier(tmp_path, ["a", "b"], vote_weights=[1.0])
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from app.services.outcome_index import OutcomeIndex, OutcomeSeries
+
+SYMBOLS = ("BTCUSDT", "ETHUSDT", "SOLUSDT")
+
+
+def _expected(ts, pnl, pct, from_us=None, to_us=None) -> dict:
+    """Métricas del rango recalculadas desde cero sobre los trades ordenados por tiempo"""
+    order = np.argsort(ts, kind="stable")
+    ts, pnl, pct = ts[order], pnl[order], pct[order]
+    mask = np.ones(len(ts), dtype=bool)
+    if from_us is not None:
+        mask &= ts >= from_us
+    if to_us is not None:
+        mask &= ts <= to_us
+    ts, pnl, pct = ts[mask], pnl[mask], pct[mask]
+    if not len(ts):
+        return {"total_trades": 0}
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    cumulative = np.cumsum(pnl)
+    std = pct.std()
+    return {
+        "total_trades": len(pnl),
+        "win_rate": len(wins) / len(pnl),
+        "avg_pnl": pnl.mean(),
+        "avg_win": wins.mean() if len(wins) else 0,
+        "avg_loss": losses.mean() if len(losses) else 0,
+        "sharpe_ratio": pct.mean() / std if std > 0 else 0,
+        "max_drawdown": (cumulative - np.maximum.accumulate(cumulative)).min(),
+        "profit_factor": wins.sum() / -losses.sum() if len(losses) else float("inf"),
+        "best_trade": pnl.max(),
+        "worst_trade": pnl.min(),
+        "total_pnl": pnl.sum(),
+        "first_ts_us": int(ts[0]),
+        "last_ts_us": int(ts[-1]),
+    }
+
+
+def _stream(n: int, scale: float, offset: float, seed: int):
+    rng = np.random.default_rng(seed)
+    ts = np.sort(rng.integers(0, 10 * n, n)) * 1_000_000  # Con timestamps repetidos
+    ts[rng.random(n) < 0.05] -= 5_000_000  # Y algunos trades que llegan tarde
+    pnl = np.round(rng.normal(0, 10, n), 2) * scale + offset
+    pnl[rng.random(n) < 0.1] = 0.0
+    pct = offset / 100 + rng.normal(0.1, 0.5, n)  # Media lejos de 0 con offset: estresa la varianza
+    symbols = [SYMBOLS[k] for k in rng.integers(0, len(SYMBOLS), n)]
+    return ts, pnl, pct, symbols
+
+
+def _windows(ts, seed: int, count: int = 40):
+    rng = np.random.default_rng(seed)
+    yield None, None
+    for _ in range(count):
+        a, b = sorted(rng.integers(ts.min() - 2_000_000, ts.max() + 2_000_000, 2))
+        yield int(a), int(b)
+
+
+@pytest.mark.parametrize("scale, offset", [(1.0, 0.0), (1e6, 0.0), (1.0, 1e9)])
+def test_window_metrics_match_brute_force(scale, offset):
+    ts, pnl, pct, symbols = _stream(3000, scale, offset, seed=17)
+    index = OutcomeIndex()
+    # Mezcla de appends sueltos y en bloque, consultando entre medias
+    for i in range(0, 1000):
+        index.append(int(ts[i]), symbols[i], pnl[i], pct[i])
+    index.metrics()
+    index.append_many(ts[1000:2500], symbols[1000:2500], pnl[1000:2500], pct[1000:2500])
+    index.metrics(symbol="BTCUSDT")
+    index.append_many(ts[2500:], symbols[2500:], pnl[2500:], pct[2500:])
+
+    by_symbol = np.array(symbols)
+    for from_us, to_us in _windows(ts, seed=5):
+        assert index.metrics(from_us, to_us) == pytest.approx(
+            _expected(ts, pnl, pct, from_us, to_us), rel=1e-6, abs=1e-9
+        )
+        for symbol in SYMBOLS:
+            rows = by_symbol == symbol
+            assert index.metrics(from_us, to_us, symbol) == pytest.approx(
+                _expected(ts[rows], pnl[rows], pct[rows], from_us, to_us), rel=1e-6, abs=1e-9
+            )
+
+
+def test_sharpe_survives_a_large_mean():
+    series = OutcomeSeries(capacity=4)
+    rng = np.random.default_rng(3)
+    pct = 1e6 + rng.normal(0, 0.01, 5000)  # E[x²] - media² se anularía por completo
+    series.append_many(np.arange(5000), np.ones(5000), pct)
+    window = pct[1000:4000]
+    assert series.metrics(1000, 3999)["sharpe_ratio"] == pytest.approx(window.mean() / window.std(), rel=1e-6)
+
+
+def test_unknown_symbol_and_empty_window():
+    index = OutcomeIndex()
+    index.append(10, "BTCUSDT", 1.0, 0.1)
+    assert index.metrics(symbol="XRPUSDT") == {"total_trades": 0}
+    assert index.metrics(11, 20) == {"total_trades": 0}
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api.routers import paper_trading
+from app.services.paper_accounts import PaperAccountManager
+from app.services.paper_trading_service import OrderSide
+from app.services.trade_log import TradeLog
+
+
+def _buy(engine):
+    engine.update_market_price("BTCUSDT", 100.0)
+    return engine.place_order("BTCUSDT", OrderSide.BUY, 1.0)
+
+
+def test_accounts_are_isolated_and_deleted_through_the_actor(tmp_path):
+    async def session():
+        manager = PaperAccountManager(2, 10_000.0, journal_dir=tmp_path, fsync=False)
+        await manager.start()
+        await manager.create_account("alice", 5_000.0)
+        # Comandos en vuelo para la cuenta mientras se elimina
+        pending = [asyncio.create_task(manager.submit("alice", _buy)) for _ in range(20)]
+        await asyncio.sleep(0)
+        await manager.delete_account("alice")
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        default = manager.snapshot("default").portfolio
+        await manager.stop()
+        return manager, results, default
+
+    manager, results, default = asyncio.run(session())
+
+    assert all(result["status"] == "FILLED" for result in results)
+    assert "alice" not in manager.accounts
+    assert not (tmp_path / "alice").exists()
+    assert default["num_trades"] == 0 and default["current_balance"] == 10_000.0
+    with pytest.raises(KeyError):
+        asyncio.run(manager.delete_account("alice"))
+    with pytest.raises(ValueError):
+        asyncio.run(manager.delete_account("default"))
+
+
+def test_offloaded_shards_run_commands_off_the_event_loop():
+    async def session():
+        manager = PaperAccountManager(2, 10_000.0)
+        for shard in manager.shards:
+            shard.offload = True
+        await manager.start()
+        await manager.create_account("alice", 5_000.0)
+        loop_thread = threading.get_ident()
+
+        def command(engine):
+            time.sleep(0.05)  # E/S bloqueante, como un fill en Redis
+            return threading.get_ident(), _buy(engine)
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(manager.submit(account, command) for account in ("default", "alice")))
+        task.cancel()
+        portfolio = manager.snapshot("alice").portfolio
+        await manager.stop()
+        return loop_thread, results, ticks, portfolio
+
+    loop_thread, results, ticks, portfolio = asyncio.run(session())
+
+    assert all(thread != loop_thread for thread, _ in results)
+    assert all(result["status"] == "FILLED" for _, result in results)
+    assert ticks > 3  # El event loop siguió atendiendo mientras los comandos esperaban
+    assert portfolio["num_trades"] == 1
+
+
+def test_history_reads_run_on_the_offloaded_writer(monkeypatch):
+    manager = PaperAccountManager(1, 1_000_000.0)
+    manager.shards[0].offload = True
+    monkeypatch.setattr(paper_trading, "paper_accounts", manager)
+    app = FastAPI()
+    app.include_router(paper_trading.router)
+    reader_threads = set()
+    page = TradeLog.page
+
+    def tracked_page(self, *args, **kwargs):
+        reader_threads.add(threading.get_ident())
+        return page(self, *args, **kwargs)
+
+    monkeypatch.setattr(TradeLog, "page", tracked_page)
+
+    async def session():
+        await manager.start()
+        loop_thread = threading.get_ident()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            writers = [asyncio.create_task(manager.submit("default", _buy)) for _ in range(300)]
+            pages = []
+            while not all(task.done() for task in writers):
+                pages.append((await client.get("/paper-trading/trades", params={"limit": 50})).json())
+                trips = (await client.get("/paper-trading/round-trips")).json()
+                assert trips["total_round_trips"] == 0
+            await asyncio.gather(*writers)
+            streamed = (await client.get("/paper-trading/trades", params={"limit": 7, "stream": True})).text
+        await manager.stop()
+        return loop_thread, pages, streamed
+
+    loop_thread, pages, streamed = asyncio.run(session())
+
+    assert loop_thread not in reader_threads
+    for body in pages:
+        seqs = [trade["seq"] for trade in body["trades"]]
+        assert seqs == list(range(len(seqs))) and len(seqs) <= body["total_trades"]
+    assert [json.loads(line)["seq"] for line in streamed.splitlines()] == list(range(300))
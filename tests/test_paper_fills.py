@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.clock import RealTimeClock, SimulatedClock
+from app.services.fill_models import (
+    Candle, DepthWalkModel, FillModel, FixedSlippageModel, VolumeSlippageModel
+)
+from app.services.paper_trading_service import OrderSide, PaperTradingEngine
+
+START = datetime(2024, 1, 1, 12, 0)
+
+
+def _engine(fill_model=None):
+    clock = SimulatedClock(START)
+    engine = PaperTradingEngine(initial_balance=10_000.0, fill_model=fill_model or FixedSlippageModel(0.0),
+                                clock=clock)
+    engine.update_market_price("BTCUSDT", 100.0)
+    return engine, clock
+
+
+def _candle(open_at: datetime, low: float, high: float, volume: float = 1_000.0) -> Candle:
+    # Como una kline: open_time naive en UTC
+    return Candle.from_row({"open": 100.0, "high": high, "low": low, "close": 100.0, "volume": volume,
+                            "open_time": pd.Timestamp(open_at)})
+
+
+@pytest.fixture(params=["UTC", "America/New_York", "Asia/Tokyo"])
+def host_tz(request, monkeypatch):
+    """Zona horaria del host: el resultado no debe depender de ella"""
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_candle_range_only_fills_orders_older_than_the_candle(host_tz):
+    engine, clock = _engine()
+    old = engine.place_order("BTCUSDT", OrderSide.BUY, 1.0, "LIMIT", 98.0)
+    clock.advance(90)
+    new = engine.place_order("BTCUSDT", OrderSide.BUY, 1.0, "LIMIT", 98.0)
+
+    # Vela cerrada que abrió entre las dos órdenes y bajó hasta 97
+    fills = engine.update_market_price("BTCUSDT", 100.0, _candle(START + timedelta(seconds=60), 97.0, 101.0))
+
+    assert [fill["order_id"] for fill in fills] == [old["order_id"]]
+    assert fills[0]["filled_price"] == 98.0
+    assert new["order_id"] in engine.orders
+    assert new["order_id"] in engine.order_books["BTCUSDT"]
+
+    # Con el precio actual cruzando el nivel sí se ejecuta
+    fills = engine.update_market_price("BTCUSDT", 97.5, _candle(START + timedelta(seconds=60), 97.0, 101.0))
+    assert [fill["order_id"] for fill in fills] == [new["order_id"]]
+
+
+def test_candle_without_open_time_keeps_range_matching():
+    engine, _ = _engine()
+    order = engine.place_order("BTCUSDT", OrderSide.BUY, 1.0, "LIMIT", 99.0)
+    fills = engine.update_market_price("BTCUSDT", 100.0, Candle(100.0, 101.0, 98.5, 100.0, 10.0))
+    assert [fill["order_id"] for fill in fills] == [order["order_id"]]
+
+
+def test_candle_from_kline_row():
+    row = pd.Series({"open_time": pd.Timestamp("2024-01-01T12:00:00Z"), "open": "1", "high": "2",
+                     "low": "0.5", "close": "1.5", "volume": "10"})
+    candle = Candle.from_row(row)
+    assert candle.open_time == pd.Timestamp("2024-01-01T12:00:00Z").timestamp()
+    assert Candle.from_row({"open": 1, "high": 2, "low": 0.5, "close": 1.5, "volume": 10}).open_time is None
+
+
+def test_volume_model_caps_fill_by_candle_volume():
+    model = VolumeSlippageModel(base_slippage=0.0, impact=0.0, max_participation=0.1)
+    assert model.market_fill("BTCUSDT", True, 5.0, 100.0, Candle(100, 101, 99, 100, 20.0)) == (100.0, 2.0)
+    assert model.market_fill("BTCUSDT", True, 5.0, 100.0, None) == (100.0, 5.0)
+
+
+def test_fill_models_share_scalar_and_vector_paths():
+    with pytest.raises(TypeError):
+        FillModel()
+    depth = DepthWalkModel()
+    depth.update_depth("BTCUSDT", bids=[[99.0, 1.0], [98.0, 2.0]], asks=[[101.0, 1.0], [102.0, 2.0]])
+    candle = Candle(100, 101, 99, 100, 50.0)
+    for model in (FixedSlippageModel(), VolumeSlippageModel(), depth):
+        prices, filled = model.market_fills("BTCUSDT", np.array([True, False]), np.array([2.0, 1.5]), 100.0, candle)
+        for i, (is_buy, quantity) in enumerate(((True, 2.0), (False, 1.5))):
+            price, qty = model.market_fill("BTCUSDT", is_buy, quantity, 100.0, candle)
+            assert np.isclose(price, prices[i]) and np.isclose(qty, filled[i])
+    assert depth.market_fill("BTCUSDT", True, 2.0, 100.0) == (101.5, 2.0)
+
+
+def test_clock_epochs_share_the_kline_time_base(host_tz):
+    assert SimulatedClock(datetime(2024, 1, 1)).time() == pd.Timestamp("2024-01-01").timestamp()
+    assert RealTimeClock().epoch(datetime.now()) == pytest.approx(time.time(), abs=1.0)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+from app.services.paper_engine_actor import PaperEngineActor
+from app.services.paper_journal import PaperJournal
+from app.services.paper_trading_service import OrderSide, PaperTradingEngine
+
+
+def _state(engine: PaperTradingEngine):
+    return json.loads(json.dumps({
+        "portfolio": engine.get_portfolio_summary(),
+        "statistics": engine.get_trade_statistics(),
+        "orders": engine.get_open_orders(),
+    }, default=str))
+
+
+def _journaled(directory, snapshot_every=10_000) -> PaperTradingEngine:
+    engine = PaperTradingEngine(initial_balance=10_000.0)
+    engine.journal = PaperJournal(directory, snapshot_every=snapshot_every, fsync=False)
+    engine.journal.record_reset(engine.initial_balance)
+    return engine
+
+
+def _trade(engine: PaperTradingEngine, steps: int):
+    for i in range(steps):
+        price = 100.0 + (i * 7) % 11
+        engine.update_market_price("BTCUSDT", price)
+        if i % 4 == 0:
+            engine.place_order("BTCUSDT", OrderSide.BUY, 1.0)
+        elif i % 4 == 1 and "BTCUSDT" in engine.positions:
+            engine.place_order("BTCUSDT", OrderSide.SELL, 0.5)
+        elif i % 4 == 2:
+            order = engine.place_order("BTCUSDT", OrderSide.BUY, 1.0, "LIMIT", price - 3)
+            engine.amend_order(order["order_id"], price=price - 2)
+        elif engine.orders:
+            engine.cancel_order(next(iter(engine.orders)))
+        engine.journal.commit()
+        if engine.journal.should_snapshot():
+            engine.journal.snapshot(engine)
+
+
+def _recover(directory) -> PaperTradingEngine:
+    engine = PaperTradingEngine()
+    engine.journal = PaperJournal(directory, fsync=False)
+    engine.journal.recover(engine)
+    return engine
+
+
+def test_recover_replays_snapshot_and_tail(tmp_path):
+    engine = _journaled(tmp_path, snapshot_every=50)
+    _trade(engine, 120)
+    expected = _state(engine)
+    engine.journal.close()
+
+    assert list(tmp_path.glob("*.snapshot"))  # Hubo snapshot y rotación
+    recovered = _recover(tmp_path)
+    assert _state(recovered) == expected
+    assert recovered.journal.seq == engine.journal.seq
+
+
+def test_torn_or_corrupt_tail_is_truncated(tmp_path):
+    engine = _journaled(tmp_path)
+    _trade(engine, 40)
+    expected = _state(engine)
+    engine.journal.close()
+    (segment,) = tmp_path.glob("*.journal")
+    size = segment.stat().st_size
+
+    # Escritura interrumpida: cabecera que anuncia más bytes de los que hay
+    with open(segment, "ab") as f:
+        f.write(b"\x30\x00\x00\x00garbage")
+    recovered = _recover(tmp_path)
+    assert _state(recovered) == expected
+    assert segment.stat().st_size == size
+
+    # El journal sigue siendo utilizable tras el corte
+    recovered.update_market_price("BTCUSDT", 105.0)
+    recovered.place_order("BTCUSDT", OrderSide.BUY, 2.0)
+    expected = _state(recovered)
+    recovered.journal.close()
+    assert _state(_recover(tmp_path)) == expected
+
+    # Un byte alterado en el último registro invalida su CRC y solo se pierde ese evento
+    data = bytearray(segment.read_bytes())
+    data[-1] ^= 0xFF
+    segment.write_bytes(bytes(data))
+    assert _recover(tmp_path).journal.seq == recovered.journal.seq - 1
+
+
+def test_failed_group_commit_fails_the_batch_commands(tmp_path):
+    actor = PaperEngineActor()
+    healthy, broken = _journaled(tmp_path / "healthy"), _journaled(tmp_path / "broken")
+    actor.add_engine("healthy", healthy)
+    actor.add_engine("broken", broken)
+
+    def disk_full():
+        raise OSError("No space left on device")
+
+    broken.journal.commit = disk_full
+
+    def buy(engine):
+        engine.update_market_price("BTCUSDT", 100.0)
+        return engine.place_order("BTCUSDT", OrderSide.BUY, 1.0)
+
+    def mark_all(engines):
+        return {account_id: engine.update_market_price("BTCUSDT", 101.0) for account_id, engine in engines.items()}
+
+    async def session():
+        results = await asyncio.gather(
+            actor.submit("healthy", buy), actor.submit("broken", buy), actor.submit(None, mark_all),
+            return_exceptions=True
+        )
+        await actor.stop()
+        return results
+
+    ok, failed, shard_wide = asyncio.run(session())
+
+    assert ok["status"] == "FILLED"
+    assert isinstance(failed, OSError) and isinstance(shard_wide, OSError)
+    assert _state(_recover(tmp_path / "healthy")) == _state(healthy)
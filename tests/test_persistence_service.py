@@ -0,0 +1,127 @@
+import math
+from datetime import datetime, timedelta
+
+import psycopg2
+import pytest
+
+from app.services.learning_agent import LearningAgent
+from app.services.persistence_service import PersistenceService, _decimal
+from app.services.trade_outcomes import TradeOutcome, TradeOutcomeStore
+
+
+def test_decimal_fits_column_range():
+    assert _decimal(math.inf, 8, 4, True) == 9999.9999
+    assert _decimal(-12345.6, 8, 4, True) == -9999.9999
+    assert _decimal(math.nan, 8, 4, True) is None
+    assert _decimal(math.nan, 8, 4, False) == 0.0
+    assert _decimal(None, 18, 8, False) == 0.0
+    assert _decimal(0.123456, 4, 3, True) == 0.123
+
+
+def test_enqueue_sanitizes_not_null_percentage():
+    service = PersistenceService("postgresql://unused")
+    outcome = TradeOutcome("t1", "BTCUSDT", "BUY", 100.0, 101.0, 1.0, 1.0, math.nan, 60, {}, 0.7, datetime(2024, 1, 1))
+    service.record_learning_trade(outcome)
+    _, row = service._queue.get_nowait()
+    assert row[7] == 0.0  # pnl_percentage NOT NULL
+
+
+class _Connection:
+    closed = False
+
+    def __init__(self):
+        self.committed = []
+        self._staged = []
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def insert(self, rows):
+                connection._staged += rows
+        return Cursor()
+
+    def commit(self):
+        self.committed += self._staged
+        self._staged = []
+
+    def rollback(self):
+        self._staged = []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = PersistenceService("postgresql://unused")
+    connection = _Connection()
+
+    def insert(cur, table, rows):
+        if any(row[0] < 0 for row in rows):
+            raise psycopg2.DataError("numeric field overflow")
+        cur.insert(rows)
+
+    monkeypatch.setattr(service, "_connect", lambda: connection)
+    monkeypatch.setattr(service, "_insert", insert)
+    service.connection = connection
+    return service
+
+
+def test_flush_discards_only_rejected_rows(service):
+    rows = [(i,) for i in range(10)] + [(-1,)] + [(i,) for i in range(10, 20)] + [(-2,)]
+    pending = {"paper_trades": list(rows), "learning_trades": [], "learning_metrics": [(99,)]}
+
+    assert service._flush(pending)
+    assert sorted(service.connection.committed) == sorted(row for row in rows if row[0] >= 0) + [(99,)]
+    assert service.rows_rejected == 2
+    assert service.rows_written["paper_trades"] == 20
+    assert not any(pending.values())
+
+
+def test_isolation_keeps_unwritten_rows_on_connection_loss(service, monkeypatch):
+    calls = []
+
+    def insert(cur, table, rows):
+        calls.append(len(rows))
+        if len(calls) <= 2:  # Lote completo y primer intento aislado
+            raise psycopg2.DataError("numeric field overflow")
+        if len(calls) == 4:  # Se cae la conexión tras escribir la primera mitad
+            raise psycopg2.OperationalError("connection lost")
+        cur.insert(rows)
+
+    monkeypatch.setattr(service, "_insert", insert)
+    rows = [(i,) for i in range(8)]
+    pending = {"paper_trades": rows, "learning_trades": [], "learning_metrics": []}
+
+    assert not service._flush(pending)
+    # Lo escrito sale de pending; lo demás queda para reintentar
+    assert service.connection.committed == [(i,) for i in range(4)]
+    assert pending["paper_trades"] == [(i,) for i in range(4, 8)]
+
+
+def test_metrics_record_has_adjusted_parameters():
+    agent = LearningAgent(outcome_store=TradeOutcomeStore())
+    records = []
+    agent.metrics_sink = records.append
+    start = datetime(2024, 1, 1)
+    for i in range(40):
+        pnl = 2.0 if i % 4 else -1.0  # Win rate alto: el threshold baja
+        agent.record_trade_outcome(TradeOutcome(
+            f"m{i}", "BTCUSDT", "BUY", 100.0, 100.0 + pnl, 1.0, pnl, pnl, 60,
+            {"volatility_value": 2.0 + i % 3, "volume_ratio": 1.2}, 0.7, start + timedelta(minutes=i)
+        ))
+
+    assert records
+    last = records[-1]["learning_parameters"]
+    assert last["confidence_threshold"] == agent.confidence_threshold
+    assert last["market_weights"] == agent.market_conditions_weights
+    assert last["optimal_conditions"]["volume_ratio_min"] == agent.optimal_conditions["volume_ratio_min"]
+    # El segundo registro ya lleva el threshold reducido por ese mismo ajuste
+    assert records[1]["learning_parameters"]["confidence_threshold"] < 0.6
@@ -0,0 +1,106 @@
+import itertools
+import time
+
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import trading
+from app.services.prediction_cache import PredictionCache, prediction_cache
+
+
+def test_entries_expire_with_candle_close_and_model_version():
+    cache = PredictionCache()
+    now = int(time.time() * 1000)
+    cache.put(("BTCUSDT", "1h"), 1, now - 1000, now + 60_000, {"signal": "BUY"})
+
+    assert cache.get(("BTCUSDT", "1h"), 1) == {"signal": "BUY"}
+    assert cache.get(("BTCUSDT", "1h"), 2) is None  # Modelo reentrenado
+    assert cache.get(("BTCUSDT", "1h"), 1) is None  # La entrada se descartó
+
+    cache.put(("BTCUSDT", "1h"), 1, now - 1000, now - 1, {"signal": "BUY"})
+    assert cache.get(("BTCUSDT", "1h"), 1) is None  # La vela ya cerró
+    assert cache.stats()["hits"] == 1 and cache.stats()["invalidations"] == 2
+
+
+class _Model:
+    available = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_latest(self, feat_df):
+        self.calls += 1
+        return {"signal": "BUY", "rows": len(feat_df)}
+
+
+class _Binance:
+    lag_minutes = 0  # Minutos que lleva parado el feed
+    in_progress = False  # Incluir la vela en curso, como hace Binance
+
+    def get_klines_df(self, symbol, interval, limit):
+        now = pd.Timestamp.now(tz="UTC").floor("min") - pd.Timedelta(minutes=self.lag_minutes)
+        if self.in_progress:
+            now += pd.Timedelta(minutes=1)
+        open_time = [now - pd.Timedelta(minutes=limit - i) for i in range(limit)]
+        return pd.DataFrame({
+            "open_time": open_time,
+            "close_time": [t + pd.Timedelta(minutes=1) - pd.Timedelta(milliseconds=1) for t in open_time],
+            "close": [100.0] * limit,
+        })
+
+
+@pytest.fixture
+def client(monkeypatch):
+    model = _Model()
+    versions = itertools.count(1)
+    monkeypatch.setattr(trading, "BinanceService", _Binance)
+    monkeypatch.setattr(trading, "build_features", lambda df: df)
+    monkeypatch.setattr(trading, "_load_model", lambda names, vote: model)
+    # Cada consulta de versión devuelve una distinta, como si se reentrenara en medio
+    monkeypatch.setattr(trading, "_models_version", lambda names, vote: next(versions))
+    prediction_cache.invalidate()
+    app = FastAPI()
+    app.include_router(trading.router)
+    yield TestClient(app), model
+    prediction_cache.invalidate()
+
+
+def test_predict_caches_under_the_version_it_checked(client):
+    client, model = client
+    response = client.post("/trading/predict", params={"symbol": "BTCUSDT", "interval": "1m", "lookback": 20})
+
+    assert response.status_code == 200
+    assert model.calls == 1
+    (entry,) = prediction_cache._entries.values()
+    assert entry.model_version == 1
+
+
+
+def _next_close_ms() -> int:
+    """ms en que cierra la vela de 1m en curso"""
+    return int((pd.Timestamp.now(tz="UTC").floor("min") + pd.Timedelta(minutes=1)).value // 1_000_000)
+
+
+@pytest.mark.parametrize("in_progress", [True, False])
+def test_predict_entry_lives_until_the_next_candle_close(client, monkeypatch, in_progress):
+    client, _ = client
+    monkeypatch.setattr(_Binance, "in_progress", in_progress)
+    before = _next_close_ms()
+    response = client.post("/trading/predict", params={"symbol": "BTCUSDT", "interval": "1m", "lookback": 20})
+
+    assert response.status_code == 200
+    # Sin vela en curso, hasta el cierre de la vela que sigue a la última cerrada
+    ((series_key, entry),) = prediction_cache._entries.items()
+    assert entry.valid_until in (before, _next_close_ms())
+    assert prediction_cache.get(series_key, entry.model_version) == response.json()
+
+
+def test_predict_does_not_cache_stale_candles(client, monkeypatch):
+    client, model = client
+    monkeypatch.setattr(_Binance, "lag_minutes", 10)
+    response = client.post("/trading/predict", params={"symbol": "BTCUSDT", "interval": "1m", "lookback": 20})
+
+    assert response.status_code == 200 and model.calls == 1
+    assert not prediction_cache._entries
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.trade_ledger import TradeLedger
+
+T0 = datetime(2026, 1, 1, 12, 0)
+
+
+def _ledger(method: str) -> TradeLedger:
+    """Compra 1 @ 100 y 1 @ 120 (fee 1 cada una), a 0 y 10 minutos"""
+    ledger = TradeLedger(method)
+    ledger.buy("BTCUSDT", 1.0, 100.0, 1.0, T0)
+    ledger.buy("BTCUSDT", 1.0, 120.0, 1.0, T0 + timedelta(minutes=10))
+    return ledger
+
+
+@pytest.mark.parametrize("method, entry_price, hold_minutes", [
+    ("FIFO", 100.0, 30.0),
+    ("LIFO", 120.0, 20.0),
+    ("AVERAGE", 110.0, 25.0),
+])
+def test_partial_sell_matches_lots_by_method(method, entry_price, hold_minutes):
+    ledger = _ledger(method)
+    trip = ledger.sell("BTCUSDT", 1.0, 130.0, 2.0, T0 + timedelta(minutes=30))
+
+    assert trip.quantity == pytest.approx(1.0)
+    assert trip.entry_price == pytest.approx(entry_price)
+    assert trip.hold_minutes == pytest.approx(hold_minutes)
+    # Fee de entrada prorrateada (1 por unidad) más la de salida
+    assert trip.pnl == pytest.approx(130.0 - entry_price - 1.0 - 2.0)
+    assert ledger.open_quantity("BTCUSDT") == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("method", ["FIFO", "LIFO", "AVERAGE"])
+def test_full_close_is_method_independent(method):
+    ledger = _ledger(method)
+    trip = ledger.sell("BTCUSDT", 2.0, 105.0, 2.0, T0 + timedelta(minutes=30))
+
+    assert trip.entry_price == pytest.approx(110.0)
+    assert trip.pnl == pytest.approx(210.0 - 220.0 - 2.0 - 2.0)
+    assert trip.hold_minutes == pytest.approx(25.0)
+    # AVERAGE promedia también la fecha de apertura de su único lote
+    assert trip.opened_at == (T0 + timedelta(minutes=5) if method == "AVERAGE" else T0)
+    assert "BTCUSDT" not in ledger.lots
+    assert ledger.sell("BTCUSDT", 1.0, 105.0, 0.0, T0) is None
+
+
+def test_oversell_only_closes_open_quantity_and_aggregates():
+    ledger = TradeLedger("FIFO")
+    ledger.buy("ETHUSDT", 1.0, 10.0, 0.0, T0)
+    trip = ledger.sell("ETHUSDT", 3.0, 12.0, 3.0, T0 + timedelta(minutes=1))
+    assert trip.quantity == pytest.approx(1.0)
+    assert trip.pnl == pytest.approx(2.0 - 1.0)  # Solo la fee de la parte emparejada
+
+    ledger.buy("ETHUSDT", 1.0, 10.0, 0.0, T0)
+    ledger.sell("ETHUSDT", 1.0, 7.0, 0.0, T0 + timedelta(minutes=1))
+    stats = ledger.statistics()
+    assert (stats["round_trips"], stats["winning_trades"], stats["losing_trades"]) == (2, 1, 1)
+    assert stats["profit_factor"] == pytest.approx(1.0 / 3.0)
+    assert [trip["pnl"] for trip in ledger.recent_round_trips()] == pytest.approx([-3.0, 1.0])
+
+
+def test_invalid_method_is_rejected():
+    with pytest.raises(ValueError):
+        TradeLedger("HIFO")
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.trade_log import TradeLog
+
+T0 = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def log():
+    log = TradeLog(retention=64, chunk_size=16)
+    for i in range(200):
+        log.append(f"o{i}", "BTCUSDT" if i % 3 else "ETHUSDT", "SELL" if i % 2 else "BUY",
+                   "MARKET", 1.0 + i, 100.0 + i, 0.1, T0 + timedelta(minutes=i), 10_000.0 - i)
+    return log
+
+
+def _all_seqs(log: TradeLog, page_size: int, **filters):
+    return [trade["seq"] for page in log.iter_pages(page_size=page_size, **filters) for trade in page]
+
+
+def test_retention_keeps_whole_recent_chunks(log):
+    assert len(log) == 200
+    assert log.retained == 72  # 4 chunks completos más el de cola con 8 trades
+    assert log.last()["id"] == "o199" and log.last()["seq"] == 199
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 16, 500])
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_follow_seq_without_gaps(log, page_size, descending):
+    expected = list(range(128, 200))
+    assert _all_seqs(log, page_size, descending=descending) == (expected[::-1] if descending else expected)
+
+    eth = [seq for seq in expected if seq % 3 == 0]
+    assert _all_seqs(log, page_size, symbol="ETHUSDT", descending=descending) == (eth[::-1] if descending else eth)
+
+
+def test_cursor_and_time_filters(log):
+    trades, cursor = log.page(cursor=150, limit=5)
+    assert [trade["seq"] for trade in trades] == [151, 152, 153, 154, 155] and cursor == 155
+
+    trades, cursor = log.page(cursor=150, limit=5, descending=True)
+    assert [trade["seq"] for trade in trades] == [149, 148, 147, 146, 145]
+
+    window = _all_seqs(log, 4, start=T0 + timedelta(minutes=140), end=T0 + timedelta(minutes=150))
+    assert window == list(range(140, 151))
+    assert log.page(symbol="SOLUSDT") == ([], None)
+
+    trade = log.page(cursor=180, limit=1)[0][0]
+    assert (trade["symbol"], trade["side"], trade["price"]) == ("BTCUSDT", "SELL", 281.0)
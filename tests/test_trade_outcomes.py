@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routers import learning
+from app.services.learning_agent import learning_agent
+from app.services.trade_outcomes import TradeOutcome, TradeOutcomeStore
+
+
+def _outcome(trade_id: str, side: str = "BUY", **conditions) -> TradeOutcome:
+    return TradeOutcome(
+        trade_id=trade_id, symbol="BTCUSDT", side=side, entry_price=100.0, exit_price=101.0,
+        quantity=1.0, pnl=1.0, pnl_percentage=1.0, hold_time_minutes=60,
+        market_conditions=conditions, decision_confidence=0.7, timestamp=datetime(2024, 1, 1)
+    )
+
+
+def test_failed_append_leaves_store_intact():
+    store = TradeOutcomeStore(capacity=2)
+    store.append(_outcome("good-0"))
+    with pytest.raises(ValueError):
+        store.append(_outcome("bad-1", side="HOLD", custom="x"))
+    store.append(_outcome("good-1"))
+
+    assert len(store) == 2
+    assert [t.trade_id for t in store] == ["good-0", "good-1"]
+    assert store[1].market_conditions == {}
+
+
+def test_roundtrip_conditions_and_spill():
+    store = TradeOutcomeStore(capacity=2, max_retained=4)
+    for i in range(6):
+        store.append(_outcome(f"t{i}", side="SELL" if i % 2 else "BUY",
+                              volatility_level="HIGH", rsi=30.0 + i, note=i))
+
+    assert len(store) == 6
+    assert store.offset > 0
+    last = store[-1]
+    assert last.trade_id == "t5" and last.side == "SELL"
+    assert last.market_conditions == {"volatility_level": "HIGH", "rsi": 35.0, "note": 5}
+    with pytest.raises(IndexError):
+        store[0]
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(learning.router)
+    return TestClient(app)
+
+
+def test_record_trade_validates_side(client):
+    before = len(learning_agent.trade_outcomes)
+    trade = {"trade_id": "api-1", "symbol": "BTCUSDT", "entry_price": 100.0, "exit_price": 99.0, "quantity": 2.0}
+
+    assert client.post("/learning/record-trade", json={**trade, "side": "HOLD"}).status_code == 422
+    assert len(learning_agent.trade_outcomes) == before
+
+    response = client.post("/learning/record-trade", json={**trade, "side": "sell"})
+    assert response.status_code == 200
+    assert response.json()["pnl"] == 2.0
+    assert learning_agent.trade_outcomes[-1].trade_id == "api-1"
+    assert learning_agent.trade_outcomes[-1].side == "SELL"